@@ -1,51 +1,113 @@
+import time
 from XPPython3 import xp
-import multiprocessing
 
-# This plugin spawns a separate process which listens for standard X-Plane
-# UDP position data, and forwards this data to a remote server (maps.avnwx.com).
-# That's all. On disable (X-Plane shutdown) we terminate the extra process.
+# This plugin spawns a separate process (avnwx/aircraft_udp_tracker.py) which forwards
+# our position to a remote server (maps.avnwx.com). The plugin publishes the position
+# every frame through shared memory; without it, the tracker listens for standard X-Plane
+# UDP position data. The process is supervised (avnwx/supervisor.py): restarted with
+# backoff if it dies, but not if it exits because it isn't configured (no API key: see
+# avnwx/trackerLog.txt). On disable (X-Plane shutdown) we terminate the extra process.
 #
 # Real-time position is displayable at https://maps.avnwx.com.
 
-# With few changes, this 50-line file can be used as a template
-# to driver other multiprocessing type python plugins.
+# With few changes, this file can be used as a template to drive other
+# multiprocessing type python plugins: see also PI_MultiProcess.py and worker_pool.py.
 
 ############################################################
 # Set target python function to be executed in remote process
-from avnwx.aircraft_udp_tracker import stream_to_server
+from avnwx.aircraft_udp_tracker import stream_to_server, SharedPositionFeed
+from avnwx.supervisor import ProcessSupervisor
 TARGET = stream_to_server
 
+# The child is checked (without blocking) every SUPERVISE_INTERVAL seconds, and restarted
+# with backoff if it has exited. Its uptime and restart count are published as datarefs.
+SUPERVISE_INTERVAL = 1.0
+UPTIME_DATAREF = 'xppython3/avnwx/tracker_uptime'  # float, seconds
+RESTARTS_DATAREF = 'xppython3/avnwx/tracker_restarts'  # int
+
+# Publish our position every frame through shared memory, so the tracker doesn't need
+# X-Plane's UDP broadcast. Datarefs are in SharedPositionFeed.FIELDS order (after timestamp),
+# in the same units as the XGPS / XATT packets they replace.
+PUBLISH_POSITION = True
+FEED_DATAREFS = (('sim/flightmodel/position/longitude', 'd'),
+                 ('sim/flightmodel/position/latitude', 'd'),
+                 ('sim/flightmodel/position/elevation', 'd'),  # meters
+                 ('sim/flightmodel/position/hpath', 'f'),
+                 ('sim/flightmodel/position/groundspeed', 'f'),  # m/s
+                 ('sim/flightmodel/position/true_psi', 'f'),
+                 ('sim/flightmodel/position/true_theta', 'f'),
+                 ('sim/flightmodel/position/true_phi', 'f'),
+                 ('sim/flightmodel/position/Prad', 'f'),
+                 ('sim/flightmodel/position/Qrad', 'f'),
+                 ('sim/flightmodel/position/Rrad', 'f'),
+                 ('sim/flightmodel/position/local_vx', 'f'),  # East
+                 ('sim/flightmodel/position/local_vy', 'f'),  # Up
+                 ('sim/flightmodel/position/local_vz', 'f'),  # South
+                 ('sim/flightmodel/forces/g_side', 'f'),
+                 ('sim/flightmodel/forces/g_nrml', 'f'),
+                 ('sim/flightmodel/forces/g_axil', 'f'))
+
 
 class PythonInterface:
     def __init__(self):
-        self.p = None
+        self.supervisor = None
         self.fl = None
+        self.datarefs = []
+        self.feed = None
+        self.feed_fl = None
+        self.feed_getters = []
 
     def XPluginStart(self):
         return "AvnWx Tracker", "xppython3.avnwx.track", "Spawn external process to feed maps.avnwx.com aircraft tracking"
 
     def XPluginEnable(self):
+        # !important: executable, otherwise we spawn a copy of X-Plane. Set (by the supervisor)
+        # before creating the feed, whose shared memory may start multiprocessing's resource tracker.
+        self.supervisor = ProcessSupervisor(TARGET, executable=xp.pythonExecutable, log=xp.log)
+        if PUBLISH_POSITION:
+            # Create feed before the tracker starts, so it finds it
+            try:
+                self.feed = SharedPositionFeed.create()
+            except OSError as e:
+                xp.log(f"Can't create shared memory position feed, tracker will use UDP: {e}")
+            else:
+                self.feed_getters = [(xp.getDatad if kind == 'd' else xp.getDataf, xp.findDataRef(name))
+                                     for name, kind in FEED_DATAREFS]
+                self.feed_fl = xp.createFlightLoop(self.publish)
+                xp.scheduleFlightLoop(self.feed_fl, -1)
+        self.datarefs = [
+            xp.registerDataAccessor(UPTIME_DATAREF, xp.Type_Float, 0,
+                                    None, None, lambda _refCon: self.supervisor.uptime, None,
+                                    None, None, None, None, None, None, None, None, None, None),
+            xp.registerDataAccessor(RESTARTS_DATAREF, xp.Type_Int, 0,
+                                    lambda _refCon: self.supervisor.restarts, None, None, None,
+                                    None, None, None, None, None, None, None, None, None, None)]
         self.fl = xp.createFlightLoop(self.do_it)
         xp.scheduleFlightLoop(self.fl, -1)
         return 1
 
     def XPluginDisable(self):
         # On disable, we try gentle termination, followed by more drastic kill.
-        if self.p and self.p.is_alive():
-            self.p.terminate()
-            self.p.join(timeout=5)
-        if self.p and self.p.is_alive():
-            self.p.kill()
-            self.p.join(timeout=5)
         if xp.isFlightLoopValid(self.fl):
             xp.destroyFlightLoop(self.fl)
+        if self.supervisor:
+            xp.log(f"Tracker {self.supervisor.stats()}")
+            self.supervisor.stop()
+        for dataref in self.datarefs:
+            xp.unregisterDataAccessor(dataref)
+        self.datarefs = []
+        if self.feed_fl and xp.isFlightLoopValid(self.feed_fl):
+            xp.destroyFlightLoop(self.feed_fl)
+        if self.feed:
+            self.feed.close(unlink=True)
+            self.feed = None
 
-    def do_it(self, _since=0.0, _elapsed=0.0, _counter=0, _refCon=None) -> float:
+    def publish(self, _since=0.0, _elapsed=0.0, _counter=0, _refCon=None) -> float:
+        # Every frame: copy datarefs into the shared memory feed
+        self.feed.publish([time.time()] + [get(dataref) for get, dataref in self.feed_getters])
+        return -1
 
-        if self.p is not None:
-            self.p.join()
-
-        multiprocessing.set_executable(xp.pythonExecutable)  # !important, otherwise we spawn a copy of X-Plane
-        self.p = multiprocessing.Process(target=TARGET, daemon=True)
-        self.p.start()
-        return 0
+    def do_it(self, _since=0.0, _elapsed=0.0, _counter=0, _refCon=None) -> float:
+        # Start the child, or restart it if it has died. Never waits on it: that would stall the sim.
+        self.supervisor.poll()
+        return SUPERVISE_INTERVAL
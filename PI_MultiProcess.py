@@ -1,43 +1,82 @@
 import os
+import time
 try:
     from XPPython3 import xp
 except ImportError:
     # 'xp' won't be available to the python child process, so guard against import failure
     pass
 
-import multiprocessing
+from worker_pool import WorkerPool
+try:
+    from dataref_bus import DatarefBus, DatarefPublisher
+except ImportError:
+    # dataref_bus needs numpy
+    DatarefBus = DatarefPublisher = None
 
 """
-Demonstrate the use of multiprocessing (and xp.pythonExecutable).
+Demonstrate the use of multiprocessing (and xp.pythonExecutable), through a WorkerPool.
+
+The pool's worker processes are started once, on enable, and kept warm. Jobs are submitted
+without waiting, and a flight loop collects their results by polling, so X-Plane never
+waits on them. Jobs may have a timeout, and may be cancelled.
+
+The same flight loop publishes a few datarefs to a DatarefBus (if numpy is installed),
+so a job can read the sim's state from shared memory rather than having it pickled over.
 
 Result should be in your XPPython3.log similar to:
 
-  [PythonPlugins.PI_MultiProcess] Calling from PID 38087                                                                                             [PythonPlugins.PI_MultiProcess] [42, None, 'hello from PID: 38167']           
+  [PythonPlugins.PI_MultiProcess] Calling from PID 38087
+  [PythonPlugins.PI_MultiProcess] Job 3 slow cancelled: cancelled before it started
+  [PythonPlugins.PI_MultiProcess] Job 1 f done: [42, None, 'hello from PID: 38167']
+  [PythonPlugins.PI_MultiProcess] Job 4 where done: lat 47.4635 lon -122.3080 at 132m, 0.1s old
+  [PythonPlugins.PI_MultiProcess] Worker 1 replaced: timed out after 1.0s
+  [PythonPlugins.PI_MultiProcess] Job 2 slow timed_out: timed out after 1.0s
 
 """
 
+POOL_SIZE = 2
+POLL_INTERVAL = 0.1  # seconds between flight loop polls for results
+DATAREFS = (('sim/flightmodel/position/latitude', 'd'),
+            ('sim/flightmodel/position/longitude', 'd'),
+            ('sim/flightmodel/position/elevation', 'd'))
+
+
 class PythonInterface:
+    def __init__(self):
+        self.pool = None
+        self.publisher = None
+        self.fl = None
 
     def XPluginStart(self):
-        return 'PI_MultiProcess v1.0', 'xppython.demos.multiprocess', 'Example plugin using multiprocessing'
+        return 'PI_MultiProcess v1.1', 'xppython.demos.multiprocess', 'Example plugin using a pool of worker processes'
 
     def XPluginEnable(self):
         xp.log("Calling from PID {}".format(os.getpid()))
-        parent_conn, child_conn = multiprocessing.Pipe()
         # IMPORTANT! Otherwise, sys.executable is used. When running X-Plane, it will be X-Plane app which will fail!
-        multiprocessing.set_executable(xp.pythonExecutable)
-        p = multiprocessing.Process(target=f, args=(child_conn, ))
-        p.start()
-        xp.log('{}'.format(parent_conn.recv()))
-        # !!!! Note that 'join' will wait untill the called process has finished. This means
-        # X-Plane will wait for this XPluginEnable() to complete prior to continuing.
-        #
-        # Alternatively, don't "join" here... Join in XPluginDisable(), for example
-        p.join()
+        self.pool = WorkerPool(POOL_SIZE, executable=xp.pythonExecutable, log=xp.log)
+        self.pool.start()
+        # None of these wait: results arrive in report(), called from the flight loop
+        self.pool.submit(f, callback=self.report)
+        self.pool.submit(slow, 10, timeout=1.0, callback=self.report)
+        self.pool.submit(slow, 10, callback=self.report).cancel()
+        if DatarefPublisher is not None:
+            self.publisher = DatarefPublisher(xp, DATAREFS)
+            self.publisher.publish()
+            self.pool.submit(where, timeout=5.0, callback=self.report)
+        self.fl = xp.createFlightLoop(self.poll)
+        xp.scheduleFlightLoop(self.fl, POLL_INTERVAL)
         return 1
 
     def XPluginDisable(self):
-        pass
+        if self.fl and xp.isFlightLoopValid(self.fl):
+            xp.destroyFlightLoop(self.fl)
+        if self.pool:
+            xp.log("Pool {}".format(self.pool.stats()))
+            self.pool.shutdown()
+            self.pool = None
+        if self.publisher:
+            self.publisher.close()
+            self.publisher = None
 
     def XPluginStop(self):
         pass
@@ -45,7 +84,36 @@ class PythonInterface:
     def XPluginReceiveMessage(self, *args, **kwargs):
         pass
 
+    def poll(self, _since=0.0, _elapsed=0.0, _counter=0, _refCon=None) -> float:
+        # Collect finished jobs (calling their callbacks). Never waits on a worker.
+        self.pool.poll()
+        if self.publisher:
+            self.publisher.publish()
+        return POLL_INTERVAL
+
+    def report(self, job):
+        xp.log("Job {} {} {}: {}".format(job.id, job.name, job.state, job.result if job.state == 'done' else job.error))
+
+
+def f():
+    return [42, None, 'hello from PID: {}'.format(os.getpid())]
+
+
+def slow(seconds):
+    time.sleep(seconds)
+    return seconds
+
 
-def f(conn):
-    conn.send([42, None, 'hello from PID: {}'.format(os.getpid())])
-    conn.close()
+def where():
+    bus = DatarefBus.attach()
+    if bus is None:
+        return 'no dataref bus'
+    try:
+        if not bus.wait(2.0):
+            return 'no frame published'
+        frame = bus.read()
+        return 'lat {:.4f} lon {:.4f} at {:.0f}m, {:.1f}s old'.format(
+            frame['sim/flightmodel/position/latitude'], frame['sim/flightmodel/position/longitude'],
+            frame['sim/flightmodel/position/elevation'], time.time() - frame['_time'])
+    finally:
+        bus.close()
@@ -12,72 +12,706 @@ This script automatically:
 Just enable "Broadcast To All Mapping Apps" in X-Plane Network settings and run this script!
 """
 
+import asyncio
+import atexit
 import os
+import queue
+import random
+import selectors
+import shutil
+import gzip
+import json
+import math
+import mmap
 import socket
+import struct
 import requests
 import time
 import sys
 import signal
+import threading
+from array import array
+import multiprocessing
+from multiprocessing import shared_memory
+from bisect import bisect_left
+from collections import deque
 from datetime import datetime
 
+try:
+    import numpy as np
+    use_numpy = True
+except ImportError:
+    # numpy is only needed for the TrackArchive
+    use_numpy = False
+
 # Configuration
 UDP_PORT = 49002  # Port to listen on for X-Plane UDP
 SERVER_URL = "https://maps.avnwx.com/api/aircraft/push"
 BAD_API_KEY = 'your-api-key'
+UPLOAD_QUEUE_SIZE = 1  # Uploader keeps only the latest position(s); older ones are dropped
+PUSH_GZIP = False  # gzip request bodies (server must accept Content-Encoding: gzip)
+PUSH_TIMEOUT = 5  # seconds
+BREAKER_FAILURES = 3  # consecutive failed uploads before uploads fail fast (to the spool), see CircuitBreaker
+BREAKER_BASE_DELAY = 2.0  # seconds of failing fast before the first retry, doubling after each failed retry ...
+BREAKER_MAX_DELAY = 120.0  # ... up to this
+BREAKER_JITTER = 0.5  # each wait is shortened by up to this fraction, at random
+BREAKER_PROBE_TIMEOUT = 30.0  # seconds before a probe that never reported back is given up, and another allowed
+MIRROR_URL = None  # Also push every upload to this HTTP endpoint (same JSON bodies), e.g. an internal dashboard
+MIRROR_API_KEY = None  # api_key sent to MIRROR_URL (default: the avnwx one)
+REBROADCAST_ADDRESS = None  # e.g. ('192.168.1.255', 49010): also send every position here as a JSON UDP datagram
+OUTPUT_FILE = None  # Also append every position to this file, as lines of JSON
+SINK_QUEUE_SIZE = 100  # uploads queued for each of those destinations; oldest dropped beyond that
+PUSH_ENCODING = 'json'  # 'binary' for compact encode_positions() bodies, falling back to JSON if server refuses
+UPLOAD_INTERVAL = 1.0  # seconds between single-position uploads
+UPLOAD_TRAFFIC = False  # Include XTRA traffic (other aircraft) table with each upload
+TRAFFIC_MAX_AGE = 30.0  # seconds without an XTRA update before an aircraft is dropped from the table
+TRAFFIC_MAX_AIRCRAFT = 256  # Capacity of the traffic table
+SPOOL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trackerSpool.bin')
+SPOOL_MAX_RECORDS = 86400  # Positions kept while server is unreachable (~6MB on disk); oldest overwritten
+SPOOL_BACKFILL_BATCH = 300  # Spooled positions uploaded per request once server is back
+ARCHIVE_SAMPLES = False  # Keep every received sample in a TrackArchive (needs numpy); query with track_query.py
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trackArchive')
+ARCHIVE_SEGMENT_ROWS = 65536  # Samples per segment (~6MB on disk)
+ARCHIVE_MAX_SEGMENTS = 32  # Full segments kept (~200MB on disk); oldest deleted beyond that
+ARCHIVE_MAX_AGE = 30 * 86400  # seconds: full segments whose newest sample is older are deleted (None: keep)
+RESAMPLE = False  # Interpolate XGPS and XATT onto a fixed clock for upload and archive (needs numpy), see TrackResampler
+RESAMPLE_INTERVAL = 0.1  # seconds between resampled outputs
+RESAMPLE_WINDOW = 8  # samples of each of XGPS and XATT kept for interpolation
+RESAMPLE_MAX_GAP = 2.0  # seconds: never interpolate across a longer gap in either stream (e.g. sim paused)
+SMOOTHING_ALPHA = 0.5  # alpha-beta smoothing of resampled values (alpha 1, beta 0: no smoothing)
+SMOOTHING_BETA = 0.1
+TRACK_FILTER = False  # Reject impossible samples and simplify our track before batching and archiving, see TrackFilter
+OUTLIER_MAX_SPEED = 1000.0  # m/s: a sample implying a faster ground speed than this is rejected
+OUTLIER_MAX_CLIMB = 200.0  # m/s: ... or a faster climb or descent
+OUTLIER_MAX_ACCEL = 50.0  # m/s per second: ... or a faster change of reported speed (e.g. a zero speed spike)
+OUTLIER_CONFIRM = 3  # consecutive rejected samples that agree with each other, to accept a jump as a reposition
+SIMPLIFY_TRACK = True  # With TRACK_FILTER, drop samples the track drawn between the kept ones passes close to
+SIMPLIFY_TOLERANCE = 5.0  # meters horizontally ...
+SIMPLIFY_ALT_TOLERANCE = 3.0  # ... and vertically
+SIMPLIFY_MAX_INTERVAL = 10.0  # seconds: keep a sample at least this often
+LIVE_MAP = False  # Serve live positions on the LAN (http://<this host>:LIVE_MAP_PORT/), see LiveMapServer
+LIVE_MAP_HOST = '0.0.0.0'
+LIVE_MAP_PORT = 8088
+LIVE_MAP_INTERVAL = 0.25  # seconds between live map updates
+LIVE_MAP_MAX_BUFFER = 256 * 1024  # bytes queued for a client before it's disconnected as too slow
+LIVE_MAP_KEEPALIVE = 15.0  # seconds between keep-alive comments to idle clients
+DEAD_RECKONING = False  # Skip uploads the server could have predicted from the last one (single-position mode)
+DR_MAX_ERROR_M = 50.0  # Upload when actual position is further than this from the predicted one (meters)
+DR_MAX_ALT_ERROR_FT = 100.0  # ... or altitude is further than this from the predicted one (feet)
+DR_MAX_INTERVAL = 10.0  # Always upload at least this often (seconds), as a keep-alive
+ADAPTIVE_CADENCE = False  # Choose upload interval from flight phase, instead of fixed UPLOAD_INTERVAL
+CADENCE_MIN_INTERVAL = 0.25  # seconds, during takeoff, landing and aerobatics
+CADENCE_MAX_INTERVAL = 10.0  # seconds, while parked
+COALESCE_PACKETS = True  # Drain all pending packets per wakeup, parsing only the newest (not with BATCH_UPLOADS)
+BATCH_UPLOADS = False  # Collect every received sample and POST them together as one array
+BATCH_INTERVAL = 5.0  # seconds between batch uploads
+BATCH_MAX_SAMPLES = 500  # Upload early when this many samples are buffered (also bounds memory)
+BATCH_QUEUE_SIZE = 4  # Batches waiting for upload, beyond which the oldest batch is dropped
+METRICS_FORMAT = 'prometheus'  # Periodically write metrics file: 'prometheus' (text format), 'json', or None
+METRICS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trackerMetrics')  # + .prom or .json
+METRICS_INTERVAL = 10.0  # seconds between metrics file updates
+SOURCES_FILE = 'sources.txt'  # If present (next to api-key.txt), serve several X-Plane instances, see load_sources()
+UPLOAD_WORKERS = 4  # Upload threads sharing one connection pool, when serving several sources
+SHARED_FEED = True  # Read our position from PI_AvnWx.py's shared memory feed when it exists, rather than UDP
+SHARED_FEED_NAME = 'avnwx_position'
+SHARED_FEED_POLL = 0.05  # seconds between reads of the shared memory feed, when batching
+STOP_POLL_INTERVAL = 0.5  # longest wait, when the stop_event given to a loop isn't a StopEvent
+NO_DATA_LOG_INTERVAL = 60.0  # Log "still listening" every 60 seconds if no data
+CONFIG_ERROR_EXIT = 78  # Exit code (EX_CONFIG) when not configured: supervisor.py doesn't restart the tracker
+LOG_FILE = "Resources/plugins/PythonPlugins/avnwx/trackerLog.txt"  # relative to X-Plane folder, else stdout
+LOG_MAX_BYTES = 1024 * 1024  # Rotate log file at this size ...
+LOG_BACKUPS = 2  # ... keeping this many old logs (trackerLog.txt.1, .2)
+LOG_FLUSH_INTERVAL = 1.0  # seconds between log file flushes
+LOG_QUEUE_SIZE = 1000  # Log lines waiting to be written, beyond which new lines are dropped
+LOG_REPEAT_INTERVAL = 10.0  # Repeated warnings (same text up to first ':') logged at most this often
 
-logFile = None
+logWriter = None
 
 
-def log(*args):
-    """Log message with timestamp"""
-    global logFile  # pylint: disable=global-statement
-    if not logFile:
+class LogWriter(threading.Thread):
+    """Background log writer: log() only queues lines, this thread writes them in batches,
+    flushing every LOG_FLUSH_INTERVAL seconds and rotating the file at LOG_MAX_BYTES.
+    """
+
+    def __init__(self, path=None, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS,
+                 flush_interval=LOG_FLUSH_INTERVAL):
+        super().__init__(name="LogWriter", daemon=True)
+        self.path = path or LOG_FILE
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(LOG_QUEUE_SIZE)
+        self.dropped = 0
+        self.size = 0
         try:
-            logFile = open("Resources/plugins/PythonPlugins/avnwx/trackerLog.txt", "w", encoding='utf-8')
+            self.file = open(self.path, "w", encoding='utf-8')  # pylint: disable=consider-using-with
         except FileNotFoundError:
-            logFile = sys.stdout
+            self.file = sys.stdout
+        self.repeats = {}  # warning key -> [time last logged, number suppressed since]
+        self.repeats_lock = threading.Lock()
+
+    def write(self, line):
+        """Queue line for writing. Never blocks: if the queue is full the line is dropped."""
+        try:
+            self.queue.put_nowait(line)
+        except queue.Full:
+            self.dropped += 1
+
+    def allow(self, message, now):
+        """Rate limit repeated warnings. Returns message to log (with a count of any suppressed
+        since last time), or None to drop it"""
+        if not message.startswith(('⚠', '✗')):
+            return message
+        key = message.split(':', 1)[0]
+        with self.repeats_lock:
+            entry = self.repeats.get(key)
+            if entry is not None and now - entry[0] < LOG_REPEAT_INTERVAL:
+                entry[1] += 1
+                return None
+            suppressed = entry[1] if entry else 0
+            self.repeats[key] = [now, 0]
+        return f"{message} ({suppressed} similar suppressed)" if suppressed else message
+
+    def run(self):
+        last_flush = time.monotonic()
+        unflushed = False
+        running = True
+        while running:
+            try:
+                # With nothing to flush, sleep until there's a line to write
+                timeout = max(0.0, last_flush + self.flush_interval - time.monotonic()) if unflushed else None
+                lines = [self.queue.get(timeout=timeout)]
+            except queue.Empty:
+                lines = []
+            while True:
+                try:
+                    lines.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in lines:  # close() sentinel
+                lines = lines[:lines.index(None)]
+                running = False
+            if lines:
+                text = '\n'.join(lines) + '\n'
+                self.file.write(text)
+                self.size += len(text.encode('utf-8'))
+                unflushed = True
+            if self.dropped:
+                self.file.write(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] "
+                                f"⚠ Log queue full, {self.dropped} lines dropped\n")
+                self.dropped = 0
+            if not running or (unflushed and time.monotonic() - last_flush >= self.flush_interval):
+                self.file.flush()
+                unflushed = False
+                last_flush = time.monotonic()
+            if self.size >= self.max_bytes and self.file is not sys.stdout:
+                self.rotate()
+
+    def rotate(self):
+        """Close log, rename it (and older backups) to .1, .2, ..., and start a new one"""
+        self.file.close()
+        for i in range(self.backups, 0, -1):
+            source = f"{self.path}.{i - 1}" if i > 1 else self.path
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i}")
+        self.file = open(self.path, "w", encoding='utf-8')  # pylint: disable=consider-using-with
+        self.size = 0
+
+    def close(self, timeout=2.0):
+        """Write any queued lines, flush and stop (if not already stopped)"""
+        if self.is_alive():
+            self.queue.put(None)
+            self.join(timeout)
+
+
+def log(*args):
+    """Log message with timestamp (written by the background LogWriter)"""
+    global logWriter  # pylint: disable=global-statement
+    if not logWriter:
+        logWriter = LogWriter()
+        logWriter.start()
+        # Daemon thread: without this, lines logged just before exiting (e.g. sys.exit()) are lost
+        atexit.register(logWriter.close)
+
+    message = logWriter.allow(' '.join(str(arg) for arg in args), time.monotonic())
+    if message is not None:
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        logWriter.write(f"[{timestamp}] {message}" if message else f"[{timestamp}]")
+
+
+class TrackerMetrics:
+    """Counters, histograms and gauges describing the tracker pipeline, written periodically to a file.
+
+    Counters and histograms take an optional single (label name, label value) pair. Several
+    threads update them (receive loop, upload workers, sinks), so updates take a lock.
+    Gauges are functions, called when the metrics are written.
+    """
+
+    PREFIX = 'avnwx_tracker_'
+    BUCKETS = (0.00001, 0.0001, 0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # seconds
+
+    def __init__(self):
+        self.counters = {}  # (name, label) -> count
+        self.histograms = {}  # (name, label) -> [count per bucket ..., count above last bucket, sum]
+        self.gauges = {}  # name -> function returning current value
+        self.lock = threading.Lock()  # for counters and histograms
+        self.last_counters = {}
+        self.last_export = time.time()
+
+    def inc(self, name, label=None, value=1):
+        key = (name, label)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, label=None):
+        key = (name, label)
+        bucket = bisect_left(self.BUCKETS, seconds)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(self.BUCKETS) + 1) + [0.0]
+            histogram[bucket] += 1
+            histogram[-1] += seconds
+
+    def gauge(self, name, func):
+        self.gauges[name] = func
+
+    def quantile(self, name, q, label=None):
+        """Estimate quantile q (0..1) of histogram name, as the upper bound of its bucket"""
+        with self.lock:
+            histogram = self.histograms.get((name, label))
+            if not histogram:
+                return None
+            counts = histogram[:-1]
+        target = q * sum(counts)
+        total = 0
+        for bound, count in zip(self.BUCKETS + (math.inf,), counts):
+            total += count
+            if total >= target and count:
+                return bound
+        return None
+
+    @staticmethod
+    def _name(name, label):
+        return f'{name}{{{label[0]}="{label[1]}"}}' if label else name
+
+    def snapshot(self):
+        """Return all metrics as a JSON-serializable dict, including per-second counter rates
+        since the previous snapshot"""
+        now = time.time()
+        elapsed = max(now - self.last_export, 1e-6)
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: list(histogram) for key, histogram in self.histograms.items()}
+        snapshot = {
+            'time': now,
+            'counters': {self._name(*key): value for key, value in counters.items()},
+            'rates': {self._name(*key): round((value - self.last_counters.get(key, 0)) / elapsed, 2)
+                      for key, value in counters.items()},
+            'histograms': {},
+            'gauges': {},
+        }
+        for (name, label), histogram in histograms.items():
+            snapshot['histograms'][self._name(name, label)] = {
+                'count': sum(histogram[:-1]),
+                'sum': histogram[-1],
+                'p50': self.quantile(name, 0.5, label),
+                'p99': self.quantile(name, 0.99, label),
+                'buckets': dict(zip([str(b) for b in self.BUCKETS] + ['+Inf'], histogram[:-1])),
+            }
+        for name, func in self.gauges.items():
+            try:
+                snapshot['gauges'][name] = func()
+            except Exception:  # pylint: disable=broad-exception-caught
+                pass
+        self.last_counters = counters
+        self.last_export = now
+        return snapshot
+
+    def to_prometheus(self, snapshot):
+        """Format snapshot in Prometheus text exposition format"""
+        lines = []
+        for name, value in snapshot['counters'].items():
+            lines.append(f"{self.PREFIX}{name} {value}")
+        for name, value in snapshot['rates'].items():
+            base, _, label = name.partition('{')
+            lines.append(f"{self.PREFIX}{base.replace('_total', '')}_per_second{'{' + label if label else ''} {value}")
+        for name, histogram in snapshot['histograms'].items():
+            base, _, label = name.partition('{')
+            label = label.rstrip('}')
+            total = 0
+            for bound, count in histogram['buckets'].items():
+                total += count
+                lines.append(f'{self.PREFIX}{base}_bucket{{{label + "," if label else ""}le="{bound}"}} {total}')
+            label = '{' + label + '}' if label else ''
+            lines.append(f"{self.PREFIX}{base}_sum{label} {histogram['sum']}")
+            lines.append(f"{self.PREFIX}{base}_count{label} {histogram['count']}")
+        for name, value in snapshot['gauges'].items():
+            if value is not None:
+                lines.append(f"{self.PREFIX}{name} {value}")
+        return '\n'.join(lines) + '\n'
 
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    print(f"[{timestamp}]", *args, file=logFile, flush=True)
+    def export(self, path=None, fmt=None):
+        """Write metrics to path (+ '.prom' or '.json'), replacing the previous file atomically.
+        Defaults to METRICS_FILE and METRICS_FORMAT."""
+        path = path or METRICS_FILE
+        fmt = fmt or METRICS_FORMAT
+        snapshot = self.snapshot()
+        if fmt == 'json':
+            path, text = path + '.json', json.dumps(snapshot, indent=1)
+        else:
+            path, text = path + '.prom', self.to_prometheus(snapshot)
+        try:
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                f.write(text)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            log(f"⚠ Failed to write metrics {path}: {e}")
+
+
+metrics = TrackerMetrics()
+PACKET_LABELS = {b'XGPS': ('type', 'XGPS'), b'XATT': ('type', 'XATT'), b'XTRA': ('type', 'XTRA')}
+OTHER_PACKET_LABEL = ('type', 'other')
+SHARED_PACKET_LABEL = ('type', 'shared')  # rows read from SharedPositionFeed
+
+
+class PositionRecord:
+    """Latest raw XGPS and XATT values, overwritten in place by the receiver's parsers"""
+
+    XGPS_FIELDS = ('lon', 'lat', 'elevation_m', 'horizontal_path', 'true_speed_ms')
+    XATT_FIELDS = ('heading', 'pitch', 'roll', 'p_rad', 'q_rad', 'r_rad',
+                   'speed_e_ms', 'speed_u_ms', 'speed_s_ms',  # East, Up, South
+                   'g_side', 'g_normal', 'g_axial')
+    __slots__ = XGPS_FIELDS + XATT_FIELDS + ('has_xgps', 'has_xatt')
+
+    def __init__(self):
+        for field in self.XGPS_FIELDS + self.XATT_FIELDS:
+            setattr(self, field, 0.0)
+        self.has_xgps = False
+        self.has_xatt = False
+
+
+class SharedPositionFeed:
+    """Our aircraft's position, published every frame by PI_AvnWx.py in shared memory.
+
+    The block holds a header (magic, version, sequence number) and one row of doubles:
+    publish time, then the PositionRecord XGPS and XATT fields, in the same units as the
+    UDP packets. It's a seqlock: publish() makes the sequence number odd, writes the row,
+    then makes it even again; read() retries until it sees the same even sequence number
+    before and after copying the row, so it never returns a half-written one. There's a
+    single writer (the plugin), and readers never block it.
+    """
+
+    MAGIC = b'AVPF'
+    VERSION = 1
+    HEADER = struct.Struct('<4sI')
+    SEQUENCE = struct.Struct('<Q')
+    FIELDS = ('timestamp',) + PositionRecord.XGPS_FIELDS + PositionRecord.XATT_FIELDS
+    ROW = struct.Struct(f'<{len(FIELDS)}d')
+    SEQUENCE_OFFSET = HEADER.size
+    ROW_OFFSET = SEQUENCE_OFFSET + SEQUENCE.size
+    SIZE = ROW_OFFSET + ROW.size
+
+    def __init__(self, shm):
+        self.shm = shm
+        self.buf = shm.buf
+        self.sequence = 0  # writer's count, always even between publishes
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @classmethod
+    def create(cls, name=SHARED_FEED_NAME):
+        """Writer side: create the block (replacing any left by a crashed X-Plane)"""
+        try:
+            shm = shared_memory.SharedMemory(name, create=True, size=cls.SIZE)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name, create=True, size=cls.SIZE)
+        cls.HEADER.pack_into(shm.buf, 0, cls.MAGIC, cls.VERSION)
+        cls.SEQUENCE.pack_into(shm.buf, cls.SEQUENCE_OFFSET, 0)
+        return cls(shm)
+
+    @classmethod
+    def attach(cls, name=SHARED_FEED_NAME):
+        """Reader side: open an existing block. Returns None if there's none (or it's not ours)"""
+        try:
+            shm = shared_memory.SharedMemory(name)
+        except (FileNotFoundError, OSError):
+            return None
+        if multiprocessing.parent_process() is None:
+            # Run standalone: attaching registered the block with our own resource tracker,
+            # which would unlink it when we exit, though only its creator should. (When spawned
+            # by PI_AvnWx.py we share the plugin's resource tracker, so leave it registered.)
+            try:
+                from multiprocessing import resource_tracker  # pylint: disable=import-outside-toplevel
+                resource_tracker.unregister(shm._name, 'shared_memory')  # pylint: disable=protected-access
+            except (ImportError, AttributeError):
+                pass
+        if shm.size < cls.SIZE or cls.HEADER.unpack_from(shm.buf, 0) != (cls.MAGIC, cls.VERSION):
+            log(f"⚠ Shared memory {name} is not a version {cls.VERSION} position feed, ignoring it")
+            shm.close()
+            return None
+        return cls(shm)
+
+    def publish(self, values):
+        """Write one row (a sequence of len(FIELDS) floats)"""
+        self.SEQUENCE.pack_into(self.buf, self.SEQUENCE_OFFSET, self.sequence + 1)
+        self.ROW.pack_into(self.buf, self.ROW_OFFSET, *values)
+        self.sequence += 2
+        self.SEQUENCE.pack_into(self.buf, self.SEQUENCE_OFFSET, self.sequence)
+
+    def read(self, tries=100):
+        """Returns (sequence number, row tuple), or (sequence number, None) if the writer
+        was mid-publish on every try. Sequence number 0 means nothing published yet."""
+        for _ in range(tries):
+            before, = self.SEQUENCE.unpack_from(self.buf, self.SEQUENCE_OFFSET)
+            if before & 1:
+                continue
+            row = self.ROW.unpack_from(self.buf, self.ROW_OFFSET)
+            after, = self.SEQUENCE.unpack_from(self.buf, self.SEQUENCE_OFFSET)
+            if before == after:
+                return before, row
+        return before, None
+
+    def close(self, unlink=False):
+        """Detach; the writer also unlinks, removing the block"""
+        self.buf.release()
+        self.buf = None
+        self.shm.close()
+        if unlink:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class TrafficTable:
+    """Multi-aircraft state from XTRA packets, keyed by aircraft ID.
+
+    Stored struct-of-arrays: one array per field, with each aircraft at a fixed slot
+    (`slots` maps ID -> slot), so updates overwrite in place and export is a column copy.
+    Aircraft not updated within max_age seconds are evicted by moving the last slot into
+    the hole, keeping the columns dense.
+    """
+
+    FIELDS = ('lat', 'lon', 'altitude', 'vertical_speed', 'heading', 'speed', 'last_seen')
+
+    def __init__(self, max_age=TRAFFIC_MAX_AGE, capacity=TRAFFIC_MAX_AIRCRAFT):
+        self.max_age = max_age
+        self.capacity = capacity
+        self.slots = {}
+        self.ids = array('q')
+        self.airborne = array('b')
+        self.callsigns = []
+        self.columns = {field: array('d') for field in self.FIELDS}
+        self.dropped = 0  # updates ignored because table was full
+
+    def __len__(self):
+        return len(self.ids)
+
+    def parse_xtra(self, data):
+        """Parse XTRA message: [sim name,] ID, lat, lon, altitude (ft), vertical speed (ft/min),
+        airborne flag, heading (deg), speed (kts), callsign"""
+        try:
+            values = data.strip(b'\x00').split(b',')
+            if len(values) >= 10:
+                values = values[1:]  # leading sim name
+            if len(values) < 8:
+                return False
+            callsign = values[8].strip().decode('utf-8', errors='ignore') if len(values) > 8 else ''
+            self.update(int(values[0]), float(values[1]), float(values[2]), float(values[3]), float(values[4]),
+                        values[5].strip() == b'1', float(values[6]), float(values[7]), callsign)
+            return True
+        except (ValueError, IndexError) as e:
+            log(f"⚠ Failed to parse XTRA: {e}")
+        return False
+
+    def update(self, aircraft_id, lat, lon, altitude, vertical_speed, airborne, heading, speed, callsign,
+               now=None):
+        """Insert or overwrite one aircraft's state"""
+        slot = self.slots.get(aircraft_id)
+        if slot is None:
+            if len(self.ids) >= self.capacity:
+                self.evict(now)  # make room from stale aircraft, if any
+            if len(self.ids) >= self.capacity:
+                self.dropped += 1
+                return
+            slot = self.slots[aircraft_id] = len(self.ids)
+            self.ids.append(aircraft_id)
+            self.airborne.append(0)
+            self.callsigns.append('')
+            for column in self.columns.values():
+                column.append(0.0)
+        columns = self.columns
+        columns['lat'][slot] = lat
+        columns['lon'][slot] = lon
+        columns['altitude'][slot] = altitude
+        columns['vertical_speed'][slot] = vertical_speed
+        columns['heading'][slot] = heading
+        columns['speed'][slot] = speed
+        columns['last_seen'][slot] = time.time() if now is None else now
+        self.airborne[slot] = 1 if airborne else 0
+        self.callsigns[slot] = callsign
+
+    def evict(self, now=None):
+        """Drop aircraft not seen for max_age seconds. Returns number evicted"""
+        cutoff = (time.time() if now is None else now) - self.max_age
+        last_seen = self.columns['last_seen']
+        evicted = 0
+        slot = 0
+        while slot < len(self.ids):
+            if last_seen[slot] >= cutoff:
+                slot += 1
+                continue
+            # Move last aircraft into this slot, then shrink every column by one
+            last = len(self.ids) - 1
+            del self.slots[self.ids[slot]]
+            if slot != last:
+                self.slots[self.ids[last]] = slot
+                self.ids[slot] = self.ids[last]
+                self.airborne[slot] = self.airborne[last]
+                self.callsigns[slot] = self.callsigns[last]
+                for column in self.columns.values():
+                    column[slot] = column[last]
+            self.ids.pop()
+            self.airborne.pop()
+            self.callsigns.pop()
+            for column in self.columns.values():
+                column.pop()
+            evicted += 1
+        return evicted
+
+    def to_payload(self):
+        """Return all tracked aircraft as a columnar dict of lists (one entry per aircraft per key)"""
+        self.evict()
+        payload = {field: column.tolist() for field, column in self.columns.items() if field != 'last_seen'}
+        payload['id'] = self.ids.tolist()
+        payload['airborne'] = self.airborne.tolist()
+        payload['callsign'] = list(self.callsigns)
+        return payload
+
+    def rows(self):
+        """Return all tracked aircraft as a list of dicts (for logging or export)"""
+        payload = self.to_payload()
+        return [dict(zip(payload, values)) for values in zip(*payload.values())]
+
+
+def open_udp_socket(port):
+    """Return UDP socket bound to port on all interfaces, shareable with other listeners"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    # On MacOS, also need SO_REUSEPORT for UDP broadcast receiving
+    if hasattr(socket, 'SO_REUSEPORT'):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(('0.0.0.0', port))
+    return sock
+
+
+def position_data(record):
+    """Position dict to upload (feet, knots, feet/minute) from a PositionRecord"""
+    # Calculate ground speed from XGPS true speed (m/s to knots)
+    ground_speed_kts = record.true_speed_ms * 1.94384
+
+    # Build position data
+    position = {
+        'lat': round(record.lat, 6),
+        'lon': round(record.lon, 6),
+        'altitude': round(record.elevation_m * 3.28084, 0),  # meters to feet
+        'heading': round(record.horizontal_path, 1),
+        'speed': round(ground_speed_kts, 1),
+    }
+
+    # Add XATT data if available
+    if record.has_xatt:
+        position['pitch'] = round(record.pitch, 1)
+        position['roll'] = round(record.roll, 1)
+
+        # Calculate vertical speed from up component (m/s to ft/min)
+        vertical_speed_fpm = record.speed_u_ms * 196.85
+        position['vertical_speed'] = round(vertical_speed_fpm, 0)
+    return position
+
+
+def row_position(row, has_xatt=True):
+    """Position dict to upload from a row of timestamp, XGPS_FIELDS, XATT_FIELDS (TrackArchive.FIELDS order)"""
+    if hasattr(row, 'tolist'):
+        row = row.tolist()
+    record = PositionRecord()
+    for field, value in zip(PositionRecord.XGPS_FIELDS + PositionRecord.XATT_FIELDS, row[1:]):
+        setattr(record, field, value)
+    record.has_xgps = True
+    record.has_xatt = has_xatt
+    position = position_data(record)
+    position['timestamp'] = row[0]
+    return position
+
+
+class StopEvent(threading.Event):
+    """threading.Event that can also wake a selector: set() makes it readable.
+
+    Pass as stop_event to run_tracker() or MultiSourceTracker.run(), so they can block until
+    the next packet or deadline and still stop promptly.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._reader, self._writer = socket.socketpair()
+        self._reader.setblocking(False)
+
+    def fileno(self):
+        return self._reader.fileno()
+
+    def set(self):
+        super().set()
+        try:
+            self._writer.send(b'\x00')
+        except OSError:
+            pass
+
+    def close(self):
+        self._reader.close()
+        self._writer.close()
 
 
 class XPlaneUDPReceiver:
     """Receives position data from X-Plane UDP broadcast on port 49002"""
 
+    poll_interval = None  # packets arrive on self.sock; nothing to poll
+
     def __init__(self):
         self.sock = None
-        self.position_data = {}
-        self.xgps_data = {}
-        self.xatt_data = {}
+        self.record = PositionRecord()
+        self.traffic = TrafficTable()
+        self.track_traffic = UPLOAD_TRAFFIC  # parse XTRA into traffic; otherwise they're only counted
+        self.pending = {}  # message type -> newest unparsed payload (see drain())
         self.last_receive_time = 0.0
+        self.xgps_time = 0.0  # when record's XGPS fields were last updated
+        self.xatt_time = 0.0  # ... and its XATT fields
+        self.packet_count = 0
 
-    def start(self):
+    def start(self, port=UDP_PORT):
         """Start UDP receiver on port 49002"""
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        # On MacOS, also need SO_REUSEPORT for UDP broadcast receiving
-        if hasattr(socket, 'SO_REUSEPORT'):
-            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
-        self.sock.settimeout(0.5)  # 500ms timeout
-        self.sock.bind(('0.0.0.0', UDP_PORT))
-        log(f"Listening for X-Plane UDP broadcasts on 0.0.0.0:{UDP_PORT}")
+        self.sock = open_udp_socket(port)
+        self.sock.setblocking(False)  # run_tracker() waits for packets in a selector
+        log(f"Listening for X-Plane UDP broadcasts on 0.0.0.0:{port}")
         log("Make sure 'Broadcast To All Mapping Apps' is enabled in X-Plane Network settings")
         log()
 
+    # The parsers work directly on the received bytes (float() accepts bytes, so no decode
+    # to str is needed) and update self.record in place, rather than building new dicts.
     def parse_xgps(self, data):
         """Parse XGPS message: Longitude, latitude, elevation (m), horizontal path (deg), true speed (m/s)"""
         try:
-            values = data.decode('utf-8', errors='ignore').strip('\x00').split(',')
+            values = data.strip(b'\x00').split(b',')
             if len(values) >= 5:
-                self.xgps_data = {
-                    'lon': float(values[0]),
-                    'lat': float(values[1]),
-                    'elevation_m': float(values[2]),
-                    'horizontal_path': float(values[3]),
-                    'true_speed_ms': float(values[4])
-                }
-                self.last_receive_time = time.time()
-                self._update_position_data()
+                record = self.record
+                (record.lon, record.lat, record.elevation_m, record.horizontal_path,
+                 record.true_speed_ms) = map(float, values[:5])
+                record.has_xgps = True
                 return True
         except (ValueError, IndexError) as e:
             log(f"⚠ Failed to parse XGPS: {e}")
@@ -86,93 +720,126 @@ class XPlaneUDPReceiver:
     def parse_xatt(self, data):
         """Parse XATT message: Heading, pitch, roll, P/Q/R, speeds, g-loads"""
         try:
-            values = data.decode('utf-8', errors='ignore').strip('\x00').split(',')
+            values = data.strip(b'\x00').split(b',')
             if len(values) >= 12:
-                self.xatt_data = {
-                    'heading': float(values[0]),
-                    'pitch': float(values[1]),
-                    'roll': float(values[2]),
-                    'p_rad': float(values[3]),
-                    'q_rad': float(values[4]),
-                    'r_rad': float(values[5]),
-                    'speed_e_ms': float(values[6]),  # East
-                    'speed_u_ms': float(values[7]),  # Up
-                    'speed_s_ms': float(values[8]),  # South
-                    'g_side': float(values[9]),
-                    'g_normal': float(values[10]),
-                    'g_axial': float(values[11])
-                }
-                self.last_receive_time = time.time()
-                self._update_position_data()
+                record = self.record
+                (record.heading, record.pitch, record.roll, record.p_rad, record.q_rad, record.r_rad,
+                 record.speed_e_ms, record.speed_u_ms, record.speed_s_ms,
+                 record.g_side, record.g_normal, record.g_axial) = map(float, values[:12])
+                record.has_xatt = True
                 return True
         except (ValueError, IndexError) as e:
             log(f"⚠ Failed to parse XATT: {e}")
         return False
 
-    def _update_position_data(self):
+    def _position_data(self):
         """Combine XGPS and XATT data into position_data format matching original tracker"""
-        if not self.xgps_data:
-            return
-
-        # Calculate ground speed from XGPS true speed (m/s to knots)
-        ground_speed_kts = self.xgps_data['true_speed_ms'] * 1.94384
-
-        # Build position data
-        self.position_data = {
-            'lat': round(self.xgps_data['lat'], 6),
-            'lon': round(self.xgps_data['lon'], 6),
-            'altitude': round(self.xgps_data['elevation_m'] * 3.28084, 0),  # meters to feet
-            'heading': round(self.xgps_data['horizontal_path'], 1),
-            'speed': round(ground_speed_kts, 1),
-        }
-
-        # Add XATT data if available
-        if self.xatt_data:
-            self.position_data['pitch'] = round(self.xatt_data['pitch'], 1)
-            self.position_data['roll'] = round(self.xatt_data['roll'], 1)
-
-            # Calculate vertical speed from up component (m/s to ft/min)
-            vertical_speed_fpm = self.xatt_data['speed_u_ms'] * 196.85
-            self.position_data['vertical_speed'] = round(vertical_speed_fpm, 0)
+        return position_data(self.record)
 
     def get_position(self, max_age=5.0):
         """Get current position data (returns None if data is older than max_age seconds)"""
-        if self.position_data and self.last_receive_time > 0:
+        if self.pending:
+            self._parse_pending()
+        if self.record.has_xgps and self.last_receive_time > 0:
             age = time.time() - self.last_receive_time
             if age <= max_age:
-                return {
-                    **self.position_data,
-                    'timestamp': time.time()
-                }
+                position = self._position_data()
+                position['timestamp'] = time.time()
+                return position
         return None
 
     def receive(self):
-        """Receive one UDP packet"""
+        """Receive and parse one pending UDP packet. Returns True if it updated our position,
+        False if not, None if there was no packet waiting."""
         try:
             data, _addr = self.sock.recvfrom(4096)
+            return self.handle(data)
+        except BlockingIOError:
+            return None
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            log(f"⚠ Error receiving data: {e}")
+            return None
 
-            # Check for message type (first 4 chars, followed by null)
-            if len(data) < 6:
-                return False
+    def handle(self, data):
+        """Parse one received datagram. Returns True if it updated our position."""
+        self.packet_count += 1
 
-            msg_type = data[:4].decode('utf-8', errors='ignore')
-            payload = data[6:]  # Skip "XXXX\0\0"
+        # Check for message type (first 4 chars, followed by null)
+        if len(data) < 6:
+            return False
 
-            if msg_type == 'XGPS':
-                return self.parse_xgps(payload)
-            elif msg_type == 'XATT':
-                return self.parse_xatt(payload)
-            elif msg_type == 'XTRA':
-                # Ignore XTRA (other aircraft) for now
-                return False
+        msg_type = data[:4]
+        payload = data[6:]  # Skip "XXXX\0\0"
+        metrics.inc('packets_total', PACKET_LABELS.get(msg_type, OTHER_PACKET_LABEL))
 
+        if msg_type == b'XGPS':
+            parsed = self._parse(self.parse_xgps, msg_type, payload)
+        elif msg_type == b'XATT':
+            parsed = self._parse(self.parse_xatt, msg_type, payload)
+        elif msg_type == b'XTRA':
+            # Other aircraft: update traffic table, but not our own position
+            if self.track_traffic:
+                self._parse(self.traffic.parse_xtra, msg_type, payload)
             return False
-
-        except socket.timeout:
+        else:
             return False
+
+        if parsed:
+            self.last_receive_time = time.time()
+            if msg_type == b'XGPS':
+                self.xgps_time = self.last_receive_time
+            else:
+                self.xatt_time = self.last_receive_time
+        return parsed
+
+    def drain(self):
+        """Receive all pending UDP packets, keeping only the newest XGPS and XATT payloads.
+
+        Reads whatever is queued, without blocking. Nothing is parsed here: get_position()
+        parses the newest payloads when asked, so packets superseded before then are never
+        parsed at all. Returns number of packets received.
+        """
+        count = 0
+        try:
+            while True:
+                data, _addr = self.sock.recvfrom(4096)
+                count += 1
+                self.stash(data)
+        except BlockingIOError:
+            pass
         except Exception as e:  # pylint: disable=broad-exception-caught
             log(f"⚠ Error receiving data: {e}")
-            return False
+        return count
+
+    def stash(self, data):
+        """Keep datagram's payload, unparsed, if it's the newest XGPS or XATT (see drain())"""
+        self.packet_count += 1
+        msg_type = data[:4]
+        metrics.inc('packets_total', PACKET_LABELS.get(msg_type, OTHER_PACKET_LABEL))
+        if len(data) >= 6 and (msg_type == b'XGPS' or msg_type == b'XATT'):
+            self.pending[msg_type] = data[6:]  # Skip "XXXX\0\0"
+            self.last_receive_time = time.time()
+        elif msg_type == b'XTRA' and self.track_traffic:
+            # One packet per aircraft, so these can't be coalesced by type
+            self._parse(self.traffic.parse_xtra, msg_type, data[6:])
+
+    def _parse_pending(self):
+        """Parse payloads stashed by drain()"""
+        pending, self.pending = self.pending, {}
+        if b'XGPS' in pending:
+            self._parse(self.parse_xgps, b'XGPS', pending[b'XGPS'])
+        if b'XATT' in pending:
+            self._parse(self.parse_xatt, b'XATT', pending[b'XATT'])
+
+    @staticmethod
+    def _parse(parse, msg_type, payload):
+        """Call parse(payload), recording parse time and failures"""
+        start = time.perf_counter()
+        parsed = parse(payload)
+        metrics.observe('parse_seconds', time.perf_counter() - start)
+        if not parsed:
+            metrics.inc('parse_failures_total', PACKET_LABELS[msg_type])
+        return parsed
 
     def stop(self):
         """Stop receiving position updates"""
@@ -180,11 +847,1652 @@ class XPlaneUDPReceiver:
             self.sock.close()
 
 
-def get_api_key(config_file):
-    def clean_key(raw_key):
-        # Convert to uppercase, strip whitespace (including newlines), remove hyphens
-        return raw_key.upper().strip().replace('-', '').replace(' ', '').replace('\n', '').replace('\r', '').replace('\t', '')
+class SharedFeedReceiver(XPlaneUDPReceiver):
+    """Receiver taking our position from a SharedPositionFeed rather than XGPS/XATT packets:
+    every sim frame's values, no socket or text parsing, no X-Plane network settings.
+
+    Shared memory can't wake a selector, so there's nothing to wait on: get_position()
+    reads the newest row when an upload is due. Only batching (which wants every sample)
+    polls, every poll_interval seconds, through receive(). If track_traffic, XTRA traffic
+    packets are still read from the UDP broadcast, by drain().
+    """
+
+    poll_interval = SHARED_FEED_POLL
+
+    def __init__(self, feed):
+        super().__init__()
+        self.feed = feed
+        self.sequence = 0
+
+    def start(self, port=UDP_PORT):
+        if self.track_traffic:
+            self.sock = open_udp_socket(port)
+            self.sock.setblocking(False)
+        log(f"Reading position from shared memory {self.feed.name}")
+
+    def receive(self):
+        """Take the newest row from the feed. Returns True if it changed since last time."""
+        sequence, row = self.feed.read()
+        if row is None or sequence == self.sequence:
+            return False
+        self.sequence = sequence
+        self.packet_count += 1
+        metrics.inc('packets_total', SHARED_PACKET_LABEL)
+        record = self.record
+        for field, value in zip(SharedPositionFeed.FIELDS[1:], row[1:]):
+            setattr(record, field, value)
+        record.has_xgps = record.has_xatt = True
+        self.last_receive_time = self.xgps_time = self.xatt_time = row[0]
+        return True
+
+    def drain(self):
+        """Read pending XTRA traffic packets (our position comes from the feed)"""
+        count = 0
+        try:
+            while True:
+                data, _addr = self.sock.recvfrom(4096)
+                if data[:4] == b'XTRA':
+                    count += 1
+                    self.stash(data)
+        except BlockingIOError:
+            pass
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            log(f"⚠ Error receiving data: {e}")
+        return count
+
+    def get_position(self, max_age=5.0):
+        self.receive()
+        return super().get_position(max_age)
+
+    def stop(self):
+        super().stop()
+        self.feed.close()
+
+
+class SampleBatcher:
+    """Collects positions at full receive rate into a compact buffer, for batch upload.
+
+    Samples are stored as a flat array of doubles, one row of FIELDS per sample (NaN where
+    a field is not yet known, e.g. attitude before the first XATT). Holds at most
+    max_samples; beyond that the oldest samples are discarded and counted in `dropped`.
+    """
+
+    FIELDS = ('timestamp', 'lat', 'lon', 'altitude', 'heading', 'speed', 'pitch', 'roll', 'vertical_speed')
+
+    def __init__(self, max_samples=BATCH_MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.buffer = array('d')
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.buffer) // len(self.FIELDS)
+
+    def add(self, position):
+        """Append one position dict (as returned by XPlaneUDPReceiver.get_position())"""
+        if len(self) >= self.max_samples:
+            del self.buffer[:len(self.FIELDS)]
+            self.dropped += 1
+        self.buffer.extend([position.get(field, math.nan) for field in self.FIELDS])
+
+    def take(self):
+        """Remove and return all buffered samples as a list of position dicts, oldest first"""
+        buffer, self.buffer = self.buffer, array('d')
+        width = len(self.FIELDS)
+        return [{field: value for field, value in zip(self.FIELDS, buffer[i:i + width]) if value == value}
+                for i in range(0, len(buffer), width)]
+
+
+class PositionSpool:
+    """Disk-backed, memory-mapped ring of positions, for store-and-forward while offline.
+
+    File is a small header followed by `capacity` fixed-size records of SampleBatcher.FIELDS
+    doubles. The header holds absolute read and write sequence numbers, so the spool
+    picks up where it left off after a restart. When full, the oldest record is overwritten,
+    so disk usage never exceeds the size set at creation.
+    """
+
+    MAGIC = b'AVSP'
+    HEADER = struct.Struct('<4sIIQQ')  # magic, record width (doubles), capacity, read seq, write seq
+    RECORD = struct.Struct(f'<{len(SampleBatcher.FIELDS)}d')
+
+    def __init__(self, path=SPOOL_FILE, capacity=SPOOL_MAX_RECORDS):
+        self.path = path
+        size = self.HEADER.size + capacity * self.RECORD.size
+        exists = os.path.exists(path) and os.path.getsize(path) >= self.HEADER.size
+        self.file = open(path, 'r+b' if exists else 'w+b')  # pylint: disable=consider-using-with
+        header = self.HEADER.unpack(self.file.read(self.HEADER.size)) if exists else None
+        if header and header[:2] == (self.MAGIC, len(SampleBatcher.FIELDS)) and \
+           os.path.getsize(path) == self.HEADER.size + header[2] * self.RECORD.size:
+            # Reopen existing spool, keeping its original capacity
+            _magic, _width, self.capacity, self.read_seq, self.write_seq = header
+            self.mmap = mmap.mmap(self.file.fileno(), os.path.getsize(path))
+            if self.read_seq < self.write_seq:
+                log(f"INFO: spool {path} has {len(self)} positions waiting for upload")
+        else:
+            self.capacity, self.read_seq, self.write_seq = capacity, 0, 0
+            self.file.truncate(size)
+            self.mmap = mmap.mmap(self.file.fileno(), size)
+            self._write_header()
+
+    def __len__(self):
+        return self.write_seq - self.read_seq
+
+    def _write_header(self):
+        self.HEADER.pack_into(self.mmap, 0, self.MAGIC, len(SampleBatcher.FIELDS), self.capacity,
+                              self.read_seq, self.write_seq)
+
+    def _offset(self, seq):
+        return self.HEADER.size + (seq % self.capacity) * self.RECORD.size
+
+    def append(self, positions):
+        """Spool a list of position dicts, overwriting the oldest if full"""
+        for position in positions:
+            self.RECORD.pack_into(self.mmap, self._offset(self.write_seq),
+                                  *[position.get(field, math.nan) for field in SampleBatcher.FIELDS])
+            self.write_seq += 1
+        self.read_seq = max(self.read_seq, self.write_seq - self.capacity)
+        self._write_header()
+
+    def peek(self, count):
+        """Return up to count oldest spooled positions (as dicts), without removing them"""
+        positions = []
+        for seq in range(self.read_seq, min(self.write_seq, self.read_seq + count)):
+            values = self.RECORD.unpack_from(self.mmap, self._offset(seq))
+            positions.append({field: value for field, value in zip(SampleBatcher.FIELDS, values)
+                              if value == value})
+        return positions
+
+    def consume(self, count):
+        """Remove count oldest positions, once they've been uploaded"""
+        self.read_seq = min(self.write_seq, self.read_seq + count)
+        if self.read_seq == self.write_seq:
+            self.read_seq = self.write_seq = 0
+        self._write_header()
+
+    def close(self):
+        self.mmap.flush()
+        self.mmap.close()
+        self.file.close()
+
+
+class TrackArchive:
+    """Columnar on-disk archive of every received sample (needs numpy).
+
+    Samples are stored in segments of segment_rows rows. Segment n is directory seg<n>,
+    holding one memory-mapped file per field (FIELDS gives name and dtype): a timestamp,
+    then the PositionRecord fields in XGPS/XATT units. The timestamp is written last, so
+    a row exists once its timestamp is non-zero, and a segment's length is recovered after
+    a crash without other bookkeeping. index.npy holds (first timestamp, last timestamp,
+    rows) for each full segment.
+
+    The writer keeps at most max_segments full segments, none older than max_age seconds:
+    older ones are deleted as segments fill (their index rows stay, with 0 rows).
+
+    Queries use the index to pick segments, then binary search their (increasing) timestamp
+    column, so they only read the rows and fields asked for.
+    """
+
+    FIELDS = ((('timestamp', 'f8'),) + tuple((field, 'f8') for field in PositionRecord.XGPS_FIELDS[:3])
+              + tuple((field, 'f4') for field in PositionRecord.XGPS_FIELDS[3:] + PositionRecord.XATT_FIELDS))
+    INDEX = 'index.npy'
+
+    def __init__(self, path=ARCHIVE_DIR, segment_rows=ARCHIVE_SEGMENT_ROWS, readonly=False,
+                 max_segments=ARCHIVE_MAX_SEGMENTS, max_age=ARCHIVE_MAX_AGE):
+        self.path = path
+        self.segment_rows = segment_rows
+        self.readonly = readonly
+        self.max_segments = max_segments
+        self.max_age = max_age
+        if not readonly:
+            os.makedirs(path, exist_ok=True)
+        index_path = os.path.join(path, self.INDEX)
+        self.index = [tuple(row) for row in np.load(index_path)] if os.path.exists(index_path) else []
+        self.cache = {}  # segment number -> {field: memmap}, for queries
+        # Writer appends to segment `segment` (the first not in the index), at row `rows`
+        self.segment = len(self.index)
+        self.columns = None
+        self.rows = 0
+        if os.path.isdir(self._segment_path(self.segment)):
+            columns = self._open(self.segment, 'r' if readonly else 'r+')
+            self.rows = self._length(columns['timestamp'])
+            if not readonly:
+                self.columns = columns
+                if self.rows == self.segment_rows:
+                    self._seal()
+        if not readonly and self.columns is None:
+            self.columns = self._open(self.segment, 'w+')
+        if not readonly:
+            self.prune()
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, f'seg{segment:06d}')
+
+    def _open(self, segment, mode):
+        directory = self._segment_path(segment)
+        if mode == 'w+':
+            os.makedirs(directory, exist_ok=True)
+        return {field: np.memmap(os.path.join(directory, f'{field}.{dtype}'), dtype=dtype, mode=mode,
+                                 shape=(self.segment_rows,) if mode == 'w+' else None)
+                for field, dtype in self.FIELDS}
+
+    @staticmethod
+    def _length(timestamps):
+        """Rows written: the timestamp column is non-zero up to here"""
+        if timestamps[-1] > 0:
+            return len(timestamps)
+        return int(np.argmin(timestamps > 0))
+
+    def __len__(self):
+        return sum(int(rows) for _first, _last, rows in self.index) + self.rows
+
+    def append(self, timestamp, record):
+        """Add one sample: timestamp and a PositionRecord (or anything with its fields)"""
+        columns = self.columns
+        row = self.rows
+        for field, _dtype in self.FIELDS[1:]:
+            columns[field][row] = getattr(record, field)
+        columns['timestamp'][row] = timestamp
+        self.rows = row + 1
+        if self.rows == self.segment_rows:
+            self._seal()
+
+    def append_rows(self, rows):
+        """Add samples from a 2-D array, one row per sample in FIELDS order (e.g. TrackResampler output)"""
+        done = 0
+        while done < len(rows):
+            count = min(len(rows) - done, self.segment_rows - self.rows)
+            chunk = rows[done:done + count]
+            for i, (field, _dtype) in enumerate(self.FIELDS[1:], start=1):
+                self.columns[field][self.rows:self.rows + count] = chunk[:, i]
+            self.columns['timestamp'][self.rows:self.rows + count] = chunk[:, 0]
+            self.rows += count
+            done += count
+            if self.rows == self.segment_rows:
+                self._seal()
+
+    def _seal(self):
+        """Current segment is full: add it to the index, start the next"""
+        timestamps = self.columns['timestamp']
+        for column in self.columns.values():
+            column.flush()
+        self.index.append((float(timestamps[0]), float(timestamps[-1]), self.segment_rows))
+        self._save_index()
+        self.segment += 1
+        self.rows = 0
+        self.columns = self._open(self.segment, 'w+')
+        self.prune()
+
+    def _save_index(self):
+        temp = os.path.join(self.path, 'index.tmp.npy')
+        np.save(temp, np.array(self.index, dtype='f8'))
+        os.replace(temp, os.path.join(self.path, self.INDEX))
+
+    def prune(self):
+        """Delete the oldest full segments beyond max_segments, and those older than max_age.
+        Returns the number deleted."""
+        kept = [n for n, (_first, _last, rows) in enumerate(self.index) if rows]
+        cutoff = time.time() - self.max_age if self.max_age else None
+        deleted = 0
+        for n in kept:
+            if len(kept) - deleted <= self.max_segments and (cutoff is None or self.index[n][1] >= cutoff):
+                break
+            first, last, _rows = self.index[n]
+            self.index[n] = (first, last, 0)
+            self.cache.pop(n, None)
+            shutil.rmtree(self._segment_path(n), ignore_errors=True)
+            deleted += 1
+        if deleted:
+            self._save_index()
+            log(f"INFO: archive deleted {deleted} old segments")
+        return deleted
+
+    def flush(self):
+        if self.columns is not None:
+            for column in self.columns.values():
+                column.flush()
+
+    def close(self):
+        self.flush()
+        self.columns = None
+        self.cache = {}
+
+    def segments(self):
+        """List of (segment number, first timestamp, last timestamp, rows), including the one being written"""
+        segments = [(n, first, last, int(rows)) for n, (first, last, rows) in enumerate(self.index) if rows]
+        if self.rows:
+            timestamps = self._columns(self.segment)['timestamp']
+            segments.append((self.segment, float(timestamps[0]), float(timestamps[self.rows - 1]), self.rows))
+        return segments
+
+    def _columns(self, segment):
+        if segment == self.segment and self.columns is not None:
+            return self.columns
+        if segment not in self.cache:
+            self.cache[segment] = self._open(segment, 'r')
+        return self.cache[segment]
+
+    def _slices(self, start=None, end=None):
+        """Yield (columns, first row, end row) for the rows with start <= timestamp <= end"""
+        for segment, first, last, rows in self.segments():
+            if (start is not None and last < start) or (end is not None and first > end):
+                continue
+            columns = self._columns(segment)
+            timestamps = columns['timestamp'][:rows]
+            lo = 0 if start is None else int(timestamps.searchsorted(start, 'left'))
+            hi = rows if end is None else int(timestamps.searchsorted(end, 'right'))
+            if hi > lo:
+                yield columns, lo, hi
+
+    def select(self, start=None, end=None, fields=None):
+        """Samples with start <= timestamp <= end, as {field: numpy array} (always including timestamp)"""
+        fields = ['timestamp'] + [field for field in (fields or [name for name, _ in self.FIELDS[1:]])
+                                  if field != 'timestamp']
+        parts = {field: [] for field in fields}
+        for columns, lo, hi in self._slices(start, end):
+            for field in fields:
+                parts[field].append(columns[field][lo:hi])
+        return {field: np.concatenate(arrays) if arrays else np.empty(0, dtype=dict(self.FIELDS)[field])
+                for field, arrays in parts.items()}
+
+    def extreme(self, field, start=None, end=None, largest=True):
+        """(value, timestamp) of field's largest (or smallest) value between start and end, or None"""
+        best = None
+        for columns, lo, hi in self._slices(start, end):
+            values = columns[field][lo:hi]
+            i = int(values.argmax() if largest else values.argmin())
+            if best is None or (values[i] > best[0] if largest else values[i] < best[0]):
+                best = (float(values[i]), float(columns['timestamp'][lo + i]))
+        return best
+
+
+def unwrap_degrees(values, axis=0):
+    """Remove 360 degree jumps along axis (like numpy.unwrap(values, period=360))"""
+    steps = (np.diff(values, axis=axis) + 180.0) % 360.0 - 180.0
+    first = np.take(values, [0], axis=axis)
+    return np.concatenate((first, first + np.cumsum(steps, axis=axis)), axis=axis)
+
+
+def interpolate_rows(samples, ticks, angles):
+    """Linearly interpolate samples (2-D array, rows of time then values, increasing time) at
+    ticks (within samples' time span). Columns flagged in angles (boolean array, one per value)
+    are interpolated the short way round, and left unwrapped. Vectorized over ticks and values."""
+    times = samples[:, 0]
+    values = samples[:, 1:].copy()
+    if angles.any():
+        values[:, angles] = unwrap_degrees(values[:, angles])
+    after = np.clip(times.searchsorted(ticks, 'right'), 1, len(times) - 1)
+    before = after - 1
+    span = times[after] - times[before]
+    weight = np.divide(ticks - times[before], span, out=np.zeros(len(ticks)), where=span > 0)
+    return values[before] + weight[:, None] * (values[after] - values[before])
+
+
+class AlphaBetaFilter:
+    """Alpha-beta smoother (a fixed-gain Kalman filter with constant-rate model) over a vector
+    of values sampled at a fixed interval. Angles are filtered unwrapped, so state moves
+    smoothly through 360/0 (wrap_values() puts them back in range)."""
+
+    def __init__(self, width, interval, alpha=SMOOTHING_ALPHA, beta=SMOOTHING_BETA, angles=None):
+        self.interval = interval
+        self.alpha = alpha
+        self.beta = beta
+        self.angles = angles if angles is not None else np.zeros(width, dtype=bool)
+        self.value = None
+        self.rate = np.zeros(width)
+
+    def reset(self):
+        self.value = None
+
+    def filter(self, rows):
+        """Smooth rows (2-D array, one row per interval) in place, returning them"""
+        angles = self.angles
+        for row in rows:
+            if self.value is None:
+                self.value = row.copy()
+                self.rate[:] = 0.0
+                continue
+            predicted = self.value + self.interval * self.rate
+            residual = row - predicted
+            residual[angles] = (residual[angles] + 180.0) % 360.0 - 180.0
+            self.value = predicted + self.alpha * residual
+            self.rate += (self.beta / self.interval) * residual
+            row[:] = self.value
+        return rows
+
+
+class TrackResampler:
+    """Resamples XGPS and XATT onto one fixed clock, so every output row pairs position and
+    attitude from the same instant, at evenly spaced times (needs numpy).
+
+    Each component's samples are kept, with the time they arrived, in a small window
+    (RESAMPLE_WINDOW). Output ticks are multiples of `interval`; a tick is emitted once both
+    components have a sample at or after it, by linear interpolation (angles the short way
+    round), then optionally alpha-beta smoothed. Output rows are timestamp, XGPS_FIELDS,
+    XATT_FIELDS (TrackArchive.FIELDS order). A gap over RESAMPLE_MAX_GAP in either stream
+    restarts the clock rather than interpolating across it.
+
+    For whole recordings, resample_track() does the same in one vectorized pass.
+    """
+
+    FIELDS = TrackArchive.FIELDS
+    # Degrees that wrap at 360: XGPS lon and path, XATT heading and roll
+    GPS_ANGLES = np.array([field in ('lon', 'horizontal_path') for field in PositionRecord.XGPS_FIELDS]) \
+        if use_numpy else None
+    ATT_ANGLES = np.array([field in ('heading', 'roll') for field in PositionRecord.XATT_FIELDS]) \
+        if use_numpy else None
+
+    def __init__(self, interval=RESAMPLE_INTERVAL, window=RESAMPLE_WINDOW, max_gap=RESAMPLE_MAX_GAP,
+                 smoothing=True, alpha=SMOOTHING_ALPHA, beta=SMOOTHING_BETA):
+        self.interval = interval
+        self.max_gap = max_gap
+        self.gps = deque(maxlen=window)
+        self.att = deque(maxlen=window)
+        self.gps_time = 0.0
+        self.att_time = 0.0
+        self.next_tick = None  # as a multiple of interval, so tick times don't accumulate rounding
+        self.angles = np.concatenate((self.GPS_ANGLES, self.ATT_ANGLES))
+        self.smoother = AlphaBetaFilter(len(self.angles), interval, alpha, beta, self.angles) if smoothing else None
+        self.latest = None  # newest output row, for position()
+        self.emitted = 0
+
+    def update(self, receiver):
+        """Take whichever of receiver's XGPS / XATT fields are new. Returns array of output rows (maybe none)."""
+        record = receiver.record
+        new = False
+        if receiver.xgps_time > self.gps_time:
+            self.gps_time = receiver.xgps_time
+            new |= self._add(self.gps, receiver.xgps_time, [getattr(record, f) for f in PositionRecord.XGPS_FIELDS])
+        if receiver.xatt_time > self.att_time:
+            self.att_time = receiver.xatt_time
+            new |= self._add(self.att, receiver.xatt_time, [getattr(record, f) for f in PositionRecord.XATT_FIELDS])
+        return self._emit() if new else np.empty((0, len(self.FIELDS)))
+
+    def _add(self, samples, timestamp, values):
+        if samples and timestamp - samples[-1][0] > self.max_gap:
+            self.restart()
+        samples.append([timestamp] + values)
+        return True
+
+    def restart(self):
+        """Forget all samples: next output starts afresh once both components arrive"""
+        self.gps.clear()
+        self.att.clear()
+        self.next_tick = None
+        if self.smoother is not None:
+            self.smoother.reset()
+
+    def _emit(self):
+        if not self.gps or not self.att:
+            return np.empty((0, len(self.FIELDS)))
+        gps = np.array(self.gps)
+        att = np.array(self.att)
+        start = max(gps[0, 0], att[0, 0])
+        end = min(gps[-1, 0], att[-1, 0])
+        if self.next_tick is None or self.next_tick * self.interval < start:
+            self.next_tick = math.ceil(start / self.interval)
+        count = math.floor(end / self.interval) - self.next_tick + 1
+        if count <= 0:
+            return np.empty((0, len(self.FIELDS)))
+        ticks = np.arange(self.next_tick, self.next_tick + count) * self.interval
+        self.next_tick += count
+        rows = self._rows(ticks, gps, att, self.smoother)
+        self.latest = rows[-1]
+        self.emitted += len(rows)
+        return rows
+
+    @classmethod
+    def _rows(cls, ticks, gps, att, smoother):
+        values = np.hstack((interpolate_rows(gps, ticks, cls.GPS_ANGLES), interpolate_rows(att, ticks, cls.ATT_ANGLES)))
+        if smoother is not None:
+            smoother.filter(values)
+        wrap_values(values, np.concatenate((cls.GPS_ANGLES, cls.ATT_ANGLES)))
+        return np.column_stack((ticks, values))
+
+    def position(self, max_age=5.0):
+        """Upload dict (see position_data()) of the newest output row, or None if none is
+        newer than max_age seconds"""
+        if self.latest is None or time.time() - self.latest[0] > max_age:
+            return None
+        return self.row_position(self.latest)
+
+    @staticmethod
+    def row_position(row):
+        """Upload dict for one output row"""
+        return row_position(row)
+
+
+def wrap_values(values, angles):
+    """Put unwrapped angle columns of values (2-D array) back in range, in place:
+    lon and roll to -180..180, headings to 0..360"""
+    columns = np.flatnonzero(angles)
+    fields = PositionRecord.XGPS_FIELDS + PositionRecord.XATT_FIELDS
+    for column in columns:
+        if fields[column] in ('lon', 'roll'):
+            values[:, column] = (values[:, column] + 180.0) % 360.0 - 180.0
+        else:
+            values[:, column] %= 360.0
+    return values
+
+
+def resample_track(gps, att, interval=RESAMPLE_INTERVAL, max_gap=RESAMPLE_MAX_GAP, smoothing=True,
+                   alpha=SMOOTHING_ALPHA, beta=SMOOTHING_BETA):
+    """Batch TrackResampler: gps and att are 2-D arrays of (arrival time, XGPS_FIELDS) and
+    (arrival time, XATT_FIELDS) rows, in time order, e.g. from a replayed capture.
+    Returns 2-D array of output rows, as TrackResampler."""
+    # Split into runs without gaps over max_gap in either stream, and resample each run at once
+    breaks = np.concatenate((gps[1:, 0][np.diff(gps[:, 0]) > max_gap], att[1:, 0][np.diff(att[:, 0]) > max_gap]))
+    edges = [-math.inf] + sorted(breaks.tolist()) + [math.inf]
+    runs = []
+    smoother = AlphaBetaFilter(len(TrackResampler.GPS_ANGLES) + len(TrackResampler.ATT_ANGLES), interval,
+                               alpha, beta, np.concatenate((TrackResampler.GPS_ANGLES, TrackResampler.ATT_ANGLES))) \
+        if smoothing else None
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        run_gps = gps[(gps[:, 0] >= lo) & (gps[:, 0] < hi)]
+        run_att = att[(att[:, 0] >= lo) & (att[:, 0] < hi)]
+        if not len(run_gps) or not len(run_att):
+            continue
+        start = max(run_gps[0, 0], run_att[0, 0])
+        end = min(run_gps[-1, 0], run_att[-1, 0])
+        first = math.ceil(start / interval)
+        count = math.floor(end / interval) - first + 1
+        if count <= 0:
+            continue
+        if smoother is not None:
+            smoother.reset()
+        runs.append(TrackResampler._rows(np.arange(first, first + count) * interval, run_gps, run_att, smoother))
+    return np.concatenate(runs) if runs else np.empty((0, len(TrackResampler.FIELDS)))
+
+
+class TrackFilter:
+    """Streaming clean-up of our track before it's batched, archived or uploaded.
+
+    Outliers: a sample is rejected if, compared with the last accepted one, it implies a
+    ground speed over max_speed, a climb or descent over max_climb, or a change of reported
+    speed faster than max_accel (e.g. a zero speed spike). A real jump (the sim was
+    repositioned, or the aircraft crashed) is accepted once `confirm` consecutive rejected
+    samples agree with each other.
+
+    Simplification (optional): an opening-window version of Douglas-Peucker. The last kept
+    sample is the anchor; a new sample extends the current segment if the straight line from
+    the anchor to it passes within tolerance (horizontally) and alt_tolerance (vertically,
+    interpolated by time) of every sample since the anchor. That's tracked as the sector of
+    directions, and range of climb rates, still allowed, narrowed by each sample, so costs
+    O(1) per sample. Once a sample doesn't extend the segment, the one before it is kept
+    and becomes the anchor. A sample is kept at least every max_interval seconds, so the
+    held back one is never older than that. Dropped samples are all within tolerance of the
+    line drawn between the kept ones. Their other fields (attitude, g) go with them, so
+    leave simplification off if the archive is for finding those after the flight.
+
+    Rows are timestamp, XGPS_FIELDS, XATT_FIELDS (TrackArchive.FIELDS order), as lists.
+    """
+
+    EARTH_RADIUS_M = 6371000.0
+    DISTANCE_SLACK = 20.0  # meters of position noise allowed on top of max_speed / max_climb
+    SPEED_SLACK = 5.0  # m/s of speed noise allowed on top of max_accel
+    FIELDS = PositionRecord.XGPS_FIELDS + PositionRecord.XATT_FIELDS  # after the timestamp
+    LON = 1 + FIELDS.index('lon')
+    LAT = 1 + FIELDS.index('lat')
+    ELEVATION = 1 + FIELDS.index('elevation_m')
+    SPEED = 1 + FIELDS.index('true_speed_ms')
+
+    def __init__(self, simplify=True, max_speed=OUTLIER_MAX_SPEED, max_climb=OUTLIER_MAX_CLIMB,
+                 max_accel=OUTLIER_MAX_ACCEL, confirm=OUTLIER_CONFIRM, tolerance=SIMPLIFY_TOLERANCE,
+                 alt_tolerance=SIMPLIFY_ALT_TOLERANCE, max_interval=SIMPLIFY_MAX_INTERVAL):
+        self.simplify = simplify
+        self.max_speed = max_speed
+        self.max_climb = max_climb
+        self.max_accel = max_accel
+        self.confirm = confirm
+        self.tolerance = tolerance
+        self.alt_tolerance = alt_tolerance
+        self.max_interval = max_interval
+        self.latest = None  # last accepted row
+        self.candidates = []  # rejected rows that agree with each other: maybe a reposition
+        self._start(None)  # anchor (last kept row) and the segment from it
+        self.accepted = 0
+        self.kept = 0
+        self.rejected = 0
+        self.repositions = 0
+
+    def plausible(self, a, b):
+        """True if row b could follow row a"""
+        dt = max(0.0, b[0] - a[0])
+        if abs(b[self.SPEED] - a[self.SPEED]) > self.max_accel * dt + self.SPEED_SLACK:
+            return False
+        if abs(b[self.ELEVATION] - a[self.ELEVATION]) > self.max_climb * dt + self.DISTANCE_SLACK:
+            return False
+        x, y = self._local(a, b)
+        return math.hypot(x, y) <= self.max_speed * dt + self.DISTANCE_SLACK
+
+    def accept(self, row):
+        """Outlier check only. Returns list of rows accepted: none, this one, or (on a
+        confirmed reposition) the rejected ones that confirmed it."""
+        if self.latest is None or self.plausible(self.latest, row):
+            self.candidates.clear()
+            self.latest = row
+            return [row]
+        if self.candidates and not self.plausible(self.candidates[-1], row):
+            self.candidates.clear()
+        self.candidates.append(row)
+        if len(self.candidates) < self.confirm:
+            self.rejected += 1
+            metrics.inc('track_outliers_total')
+            return []
+        self.rejected -= len(self.candidates) - 1
+        rows, self.candidates = self.candidates, []
+        log(f"INFO: track jumped {self._distance(self.latest, row) / 1000:.1f}km, accepted as a reposition")
+        self.latest = row
+        self.repositions += 1
+        metrics.inc('track_repositions_total')
+        return rows
+
+    def accept_position(self, position):
+        """Outlier check of an upload dict (see position_data()). Returns True if accepted."""
+        row = [0.0] * (1 + len(PositionRecord.XGPS_FIELDS))
+        row[0] = position['timestamp']
+        row[self.LAT] = position['lat']
+        row[self.LON] = position['lon']
+        row[self.ELEVATION] = position['altitude'] / 3.28084
+        row[self.SPEED] = position['speed'] / 1.94384
+        return bool(self.accept(row))
+
+    def filter(self, rows):
+        """Return the rows (list or 2-D array) to keep"""
+        if hasattr(rows, 'tolist'):
+            rows = rows.tolist()
+        kept = []
+        for row in rows:
+            accepted = self.accept(row)
+            self.accepted += len(accepted)
+            if len(accepted) > 1 and self.simplify:
+                # Reposition: end the segment before the jump, start a new one after it
+                if self.pending is not None:
+                    kept.append(self.pending)
+                self._start(None)
+            for accepted_row in accepted:
+                if self.simplify:
+                    kept.extend(self._simplify(accepted_row))
+                else:
+                    kept.append(accepted_row)
+        self.kept += len(kept)
+        return kept
+
+    def flush(self):
+        """Rows held back by simplification: call when the track ends"""
+        if self.pending is None:
+            return []
+        row = self.pending
+        self._start(row)
+        self.kept += 1
+        return [row]
+
+    def position(self, max_age=5.0):
+        """Upload dict of the last accepted row, or None if older than max_age seconds"""
+        if self.latest is None or time.time() - self.latest[0] > max_age:
+            return None
+        return row_position(self.latest)
+
+    @property
+    def reduction(self):
+        """Fraction of accepted rows dropped by simplification"""
+        return 1.0 - self.kept / self.accepted if self.accepted else 0.0
+
+    def stats(self):
+        return {'accepted': self.accepted, 'kept': self.kept, 'rejected': self.rejected,
+                'repositions': self.repositions, 'reduction': round(self.reduction, 3)}
+
+    def _local(self, a, b):
+        """(east, north) meters from row a to row b"""
+        cos_lat = math.cos(math.radians(a[self.LAT]))
+        east = math.radians((b[self.LON] - a[self.LON] + 180.0) % 360.0 - 180.0) * self.EARTH_RADIUS_M * cos_lat
+        north = math.radians(b[self.LAT] - a[self.LAT]) * self.EARTH_RADIUS_M
+        return east, north
+
+    def _distance(self, a, b):
+        return math.hypot(*self._local(a, b))
+
+    def _start(self, row):
+        """row is kept (None: nothing yet): make it the anchor of a new segment"""
+        self.anchor = row
+        self.pending = None
+        self.reference = None  # direction of the first sample beyond tolerance, radians
+        self.low = -math.pi  # allowed directions, relative to reference
+        self.high = math.pi
+        self.reach = 0.0  # furthest sample from the anchor, meters
+        self.min_climb = -math.inf  # allowed climb rates, m/s
+        self.max_climb_rate = math.inf
+
+    def _simplify(self, row):
+        if self.anchor is None:
+            self._start(row)
+            return [row]
+        if row[0] - self.anchor[0] <= self.max_interval and self._extends(row):
+            self.pending = row
+            return []
+        if self.pending is None:
+            self._start(row)
+            return [row]
+        kept = self.pending
+        self._start(kept)
+        self._extends(row)  # always does, from a new anchor
+        self.pending = row
+        return [kept]
+
+    def _extends(self, row):
+        """True if the line from the anchor to row stays within tolerance of every sample since
+        the anchor; if so, narrows the allowed directions and climb rates to include row's"""
+        anchor = self.anchor
+        dt = row[0] - anchor[0]
+        min_climb, max_climb = self.min_climb, self.max_climb_rate
+        if dt > 0:
+            climb = (row[self.ELEVATION] - anchor[self.ELEVATION]) / dt
+            if not min_climb <= climb <= max_climb:
+                return False
+            min_climb = max(min_climb, climb - self.alt_tolerance / dt)
+            max_climb = min(max_climb, climb + self.alt_tolerance / dt)
+        x, y = self._local(anchor, row)
+        distance = math.hypot(x, y)
+        if distance < self.reach - self.tolerance:
+            return False  # turned back
+        if distance > self.tolerance:
+            direction = math.atan2(y, x)
+            if self.reference is None:
+                self.reference = direction
+            relative = (direction - self.reference + math.pi) % (2 * math.pi) - math.pi
+            if not self.low <= relative <= self.high:
+                return False
+            half_width = math.asin(self.tolerance / distance)
+            self.low = max(self.low, relative - half_width)
+            self.high = min(self.high, relative + half_width)
+        self.reach = max(self.reach, distance)
+        self.min_climb, self.max_climb_rate = min_climb, max_climb
+        return True
+
+
+class DeadReckoning:
+    """Upload suppression: predict current position from the last uploaded one, and only
+    upload when the real position has drifted more than max_error from the prediction.
+
+    Prediction is straight-line along the last heading at the last groundspeed and vertical
+    speed (flat-earth approximation, fine over the few seconds between uploads).
+    """
+
+    EARTH_RADIUS_M = 6371000.0
+
+    def __init__(self, max_error_m=DR_MAX_ERROR_M, max_alt_error_ft=DR_MAX_ALT_ERROR_FT,
+                 max_interval=DR_MAX_INTERVAL):
+        self.max_error_m = max_error_m
+        self.max_alt_error_ft = max_alt_error_ft
+        self.max_interval = max_interval
+        self.last = None  # last uploaded position
+        self.uploaded = 0
+        self.suppressed = 0
+
+    def predict(self, timestamp):
+        """Return (lat, lon, altitude) predicted at timestamp from the last uploaded position"""
+        last = self.last
+        dt = timestamp - last['timestamp']
+        distance = last['speed'] * (1852.0 / 3600.0) * dt  # knots -> meters
+        heading = math.radians(last['heading'])
+        lat = last['lat'] + math.degrees(distance * math.cos(heading) / self.EARTH_RADIUS_M)
+        lon = last['lon'] + math.degrees(distance * math.sin(heading) /
+                                         (self.EARTH_RADIUS_M * max(0.01, math.cos(math.radians(last['lat'])))))
+        altitude = last['altitude'] + last.get('vertical_speed', 0.0) * dt / 60.0
+        return lat, lon, altitude
+
+    def should_upload(self, position):
+        """Return True if position differs enough from the prediction (or is due as a keep-alive).
+        Records position as the new basis for prediction when True."""
+        if self.last is None or position['timestamp'] - self.last['timestamp'] >= self.max_interval:
+            upload = True
+        else:
+            lat, lon, altitude = self.predict(position['timestamp'])
+            north = math.radians(position['lat'] - lat) * self.EARTH_RADIUS_M
+            east = math.radians(position['lon'] - lon) * self.EARTH_RADIUS_M * math.cos(math.radians(lat))
+            upload = (math.hypot(north, east) > self.max_error_m
+                      or abs(position['altitude'] - altitude) > self.max_alt_error_ft)
+        if upload:
+            self.last = position
+            self.uploaded += 1
+        else:
+            self.suppressed += 1
+        return upload
 
+    @property
+    def suppression_ratio(self):
+        """Fraction of positions not uploaded"""
+        total = self.uploaded + self.suppressed
+        return self.suppressed / total if total else 0.0
+
+    def stats(self):
+        return {'uploaded': self.uploaded, 'suppressed': self.suppressed,
+                'suppression_ratio': round(self.suppression_ratio, 3)}
+
+
+class AdaptiveCadence:
+    """Chooses the upload interval from the aircraft's parsed XGPS/XATT state.
+
+    Parked (groundspeed under PARKED_KTS): max_interval. Otherwise the interval falls from
+    UPLOAD_INTERVAL (steady cruise) towards min_interval as the most dynamic of roll rate,
+    g-load, vertical speed and low-and-slow flight (taxi, takeoff, landing) approaches its
+    full-scale value below.
+    """
+
+    PARKED_KTS = 2.0
+    FULL_ROLL_RATE = math.radians(20.0)  # rad/s
+    FULL_G_DELTA = 0.5  # g, either side of 1g
+    FULL_VERTICAL_SPEED = 1500.0  # ft/min
+    SLOW_KTS = 180.0  # below this, and low vertical speed counts as taxi/approach, not parked
+
+    def __init__(self, min_interval=CADENCE_MIN_INTERVAL, max_interval=CADENCE_MAX_INTERVAL,
+                 cruise_interval=UPLOAD_INTERVAL):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.cruise_interval = cruise_interval
+        self.start = time.time()
+        self.uploads = 0
+
+    def interval(self, record):
+        """Return seconds until next upload, for the state in record (a PositionRecord)"""
+        speed_kts = record.true_speed_ms * 1.94384
+        if speed_kts < self.PARKED_KTS:
+            return self.max_interval
+        activity = 0.0
+        if record.has_xatt:
+            activity = max(abs(record.p_rad) / self.FULL_ROLL_RATE,
+                           abs(record.g_normal - 1.0) / self.FULL_G_DELTA,
+                           abs(record.speed_u_ms * 196.85) / self.FULL_VERTICAL_SPEED)
+        if speed_kts < self.SLOW_KTS:
+            # Taxi, takeoff roll, approach: the faster (still under SLOW_KTS) the busier
+            activity = max(activity, 0.5 * speed_kts / self.SLOW_KTS)
+        activity = min(activity, 1.0)
+        return self.cruise_interval - activity * (self.cruise_interval - self.min_interval)
+
+    def next_interval(self, record):
+        """Count an upload, and return interval until the next one"""
+        self.uploads += 1
+        return max(self.min_interval, min(self.max_interval, self.interval(record)))
+
+    @property
+    def average_rate(self):
+        """Uploads per second since start"""
+        return self.uploads / max(time.time() - self.start, 1e-6)
+
+
+class LatestValueQueue:
+    """Bounded hand-off between the receive loop and the upload worker.
+
+    Holds at most `maxsize` items. When full, the oldest item is discarded (and counted
+    in `dropped`) so the producer never blocks and the consumer always sees the newest data.
+    """
+
+    def __init__(self, maxsize=UPLOAD_QUEUE_SIZE):
+        self._items = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        """Add item, displacing the oldest one if the queue is full. Never blocks."""
+        with self._cond:
+            if len(self._items) == self._items.maxlen:
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Remove and return the oldest item, waiting up to timeout seconds. Returns None on timeout
+        (or if woken by wake())."""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            return self._items.popleft() if self._items else None
+
+    def wake(self):
+        """Make every waiting get() return"""
+        with self._cond:
+            self._cond.notify_all()
+
+    def __len__(self):
+        return len(self._items)
+
+
+BINARY_CONTENT_TYPE = 'application/x-avnwx-positions'
+BINARY_MAGIC = b'AVB1'
+# Position fields in binary body, with the scale each is multiplied by before rounding to an integer
+BINARY_FIELDS = (('timestamp', 1000), ('lat', 1e6), ('lon', 1e6), ('altitude', 1), ('heading', 10),
+                 ('speed', 10), ('pitch', 10), ('roll', 10), ('vertical_speed', 1))
+
+
+def _put_varint(out, value):
+    """Append signed integer to bytearray out, zigzag then LEB128 varint encoded"""
+    value = (value << 1) ^ (value >> 63)
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _get_varint(body, pos):
+    """Return (signed integer, next pos) decoded from body at pos"""
+    value = shift = 0
+    while True:
+        byte = body[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if byte < 0x80:
+            return (value >> 1) ^ -(value & 1), pos
+
+
+def encode_positions(api_key, positions):
+    """Compact binary body for a list of positions.
+
+    BINARY_MAGIC, key length byte, api_key, varint count, then per position: a varint
+    bitmask of which BINARY_FIELDS are present, and for each present field the scaled
+    integer value as a zigzag varint delta from that field's previous value (from 0 for
+    the first). Successive samples differ little, so most deltas take one or two bytes.
+    """
+    key = api_key.encode('ascii')
+    out = bytearray(BINARY_MAGIC)
+    out.append(len(key))
+    out += key
+    _put_varint(out, len(positions))
+    previous = [0] * len(BINARY_FIELDS)
+    for position in positions:
+        mask = 0
+        values = []
+        for i, (field, scale) in enumerate(BINARY_FIELDS):
+            value = position.get(field)
+            if value is not None and math.isfinite(value):  # NaN / inf: sent as absent
+                mask |= 1 << i
+                value = round(value * scale)
+                values.append(value - previous[i])
+                previous[i] = value
+        _put_varint(out, mask)
+        for value in values:
+            _put_varint(out, value)
+    return bytes(out)
+
+
+def decode_positions(body):
+    """Inverse of encode_positions(): returns (api_key, list of position dicts)"""
+    if body[:4] != BINARY_MAGIC:
+        raise ValueError("not a binary positions body")
+    key_length = body[4]
+    api_key = body[5:5 + key_length].decode('ascii')
+    count, pos = _get_varint(body, 5 + key_length)
+    previous = [0] * len(BINARY_FIELDS)
+    positions = []
+    for _ in range(count):
+        mask, pos = _get_varint(body, pos)
+        position = {}
+        for i, (field, scale) in enumerate(BINARY_FIELDS):
+            if mask & (1 << i):
+                delta, pos = _get_varint(body, pos)
+                previous[i] += delta
+                position[field] = previous[i] / scale
+        positions.append(position)
+    return api_key, positions
+
+
+class CircuitBreaker:
+    """Stops uploads hammering (and waiting on) a failing server.
+
+    Closed: requests go ahead. After `failures` consecutive failures (network errors,
+    timeouts, 5xx, 429) it opens: allow() returns False at once (fast-fail, so the upload is
+    spooled without touching the network) until the open period ends. Then it's half-open:
+    one request is allowed through as a probe while the others keep failing fast. If the
+    probe succeeds the circuit closes; if not, it opens again for twice as long, up to
+    max_delay. Each open period is shortened by a random fraction (up to `jitter`), so
+    trackers that lost the server together don't all probe it together. A probe that hasn't
+    reported success() or failure() after probe_timeout seconds is given up, and another allowed.
+
+    Shared by the upload workers of one PushClient, so it's thread-safe.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failures=BREAKER_FAILURES, base_delay=BREAKER_BASE_DELAY, max_delay=BREAKER_MAX_DELAY,
+                 jitter=BREAKER_JITTER, probe_timeout=BREAKER_PROBE_TIMEOUT, name='Server'):
+        self.name = name  # for log messages
+        self.failures = failures
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.probe_timeout = probe_timeout
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.delay = base_delay  # length of the next open period, before jitter
+        self.open_until = 0.0  # monotonic
+        self.probe_started = 0.0  # monotonic
+        self.opened = 0
+        self.probes = 0
+        self.fast_failed = 0
+
+    def allow(self):
+        """True if a request may be made now"""
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if ((self.state == self.OPEN and now >= self.open_until)
+                    or (self.state == self.HALF_OPEN and now - self.probe_started >= self.probe_timeout)):
+                self.state = self.HALF_OPEN
+                self.probe_started = now
+                self.probes += 1
+                return True
+            self.fast_failed += 1
+            return False
+
+    def success(self):
+        """A request reached the server and it answered (even if it refused the request)"""
+        with self.lock:
+            if self.state != self.CLOSED:
+                log(f"INFO: {self.name} is back, resuming uploads (circuit opened {self.opened} times)")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.delay = self.base_delay
+
+    def failure(self):
+        """A request failed for want of a working server"""
+        with self.lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED
+                                                and self.consecutive_failures >= self.failures):
+                wait = self.delay * (1.0 - self.jitter * random.random())
+                self.open_until = time.monotonic() + wait
+                self.state = self.OPEN
+                self.opened += 1
+                self.delay = min(self.delay * 2, self.max_delay)
+                log(f"⚠ {self.name} failing ({self.consecutive_failures} in a row), next try in {wait:.1f}s")
+
+    def stats(self):
+        return {'state': self.state, 'opened': self.opened, 'probes': self.probes, 'fast_failed': self.fast_failed}
+
+
+class PushClient:
+    """HTTP client for the push endpoint.
+
+    Owns a single pooled keep-alive requests.Session, so the TCP connection (and TLS
+    handshake) is reused across uploads rather than made once a second. Optionally gzips
+    the JSON body, or sends compact binary bodies (see encode_positions()) instead.
+    Keeps connection-reuse and per-request latency statistics. Its CircuitBreaker is
+    shared by every uploader using the client.
+    """
+
+    def __init__(self, server_url, api_key, gzip_body=PUSH_GZIP, timeout=PUSH_TIMEOUT, verify=True, pool_size=2,
+                 encoding=PUSH_ENCODING, breaker=None, label=None):
+        self.server_url = server_url
+        self.label = label  # for its metrics, if it's not the avnwx endpoint's client
+        self.breaker = breaker or CircuitBreaker()
+        self.api_key = api_key
+        self.gzip_body = gzip_body
+        self.encoding = encoding
+        self.binary_accepted = False  # set once server has accepted a binary body
+        self.timeout = timeout
+        self.verify = verify  # passed per request: a Session-level verify is overridden by REQUESTS_CA_BUNDLE
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': 'application/json',
+                                     'Connection': 'keep-alive'})
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.request_count = 0
+        self.latencies = deque(maxlen=1000)  # seconds, most recent requests
+
+    def post(self, payload):
+        """POST payload (a JSON-serializable dict). Returns requests.Response, raises RequestException"""
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        headers = None
+        if self.gzip_body:
+            body = gzip.compress(body, compresslevel=6)
+            headers = {'Content-Encoding': 'gzip'}
+        return self._send(body, headers)
+
+    def post_binary(self, api_key, positions, payload):
+        """POST positions as a binary body. If the server refuses it (before ever accepting one),
+        switch to JSON for good and POST payload instead."""
+        response = self._send(encode_positions(api_key, positions), {'Content-Type': BINARY_CONTENT_TYPE})
+        if response.status_code == 200:
+            self.binary_accepted = True
+        elif response.status_code in (400, 406, 415) and not self.binary_accepted:
+            log(f"INFO: server refused binary positions ({response.status_code}), using JSON")
+            self.encoding = 'json'
+            response = self.post(payload)
+        return response
+
+    def _send(self, body, headers):
+        start = time.perf_counter()
+        try:
+            return self.session.post(self.server_url, data=body, headers=headers,
+                                     timeout=self.timeout, verify=self.verify)
+        finally:
+            self.request_count += 1
+            self.latencies.append(time.perf_counter() - start)
+            metrics.observe('upload_latency_seconds', self.latencies[-1], self.label)
+
+    def push(self, position, traffic=None, api_key=None):
+        """Upload a single position, with optional traffic (see TrafficTable.to_payload()).
+        api_key overrides the client's key, so one client can serve several sources."""
+        payload = {'api_key': api_key or self.api_key, 'position': position}
+        if traffic:
+            payload['traffic'] = traffic
+        elif self.encoding == 'binary':
+            return self.post_binary(payload['api_key'], [position], payload)
+        return self.post(payload)
+
+    def push_batch(self, positions, traffic=None, api_key=None):
+        """Upload a list of positions, oldest first, in one request"""
+        payload = {'api_key': api_key or self.api_key, 'positions': positions}
+        if traffic:
+            payload['traffic'] = traffic
+        elif self.encoding == 'binary':
+            return self.post_binary(payload['api_key'], positions, payload)
+        return self.post(payload)
+
+    @property
+    def connection_count(self):
+        """Number of TCP connections opened so far (request_count - connection_count were reused)"""
+        pools = self.session.get_adapter(self.server_url).poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys())
+
+    def stats(self):
+        """Return dict of connection reuse and latency (ms) statistics"""
+        latencies = sorted(self.latencies)
+
+        def percentile(pct):
+            return round(1000 * latencies[min(len(latencies) - 1, int(pct / 100.0 * len(latencies)))], 1)
+
+        connections = self.connection_count
+        return {
+            'requests': self.request_count,
+            'connections': connections,
+            'reused': max(0, self.request_count - connections),
+            'p50_ms': percentile(50) if latencies else None,
+            'p99_ms': percentile(99) if latencies else None,
+            'circuit_opened': self.breaker.opened,
+        }
+
+    def close(self):
+        self.session.close()
+
+
+class PositionUploader(threading.Thread):
+    """Upload worker: posts queued positions to the server on its own thread.
+
+    The receive loop only calls submit(), so a slow or dead server can never stall UDP intake.
+    While the client's CircuitBreaker is open, uploads go straight to the spool, so the
+    worker isn't tied up waiting on a dead server either.
+    """
+
+    def __init__(self, server_url, api_key, queue_size=UPLOAD_QUEUE_SIZE, client=None, spool=None,
+                 upload_queue=None):
+        super().__init__(name="PositionUploader", daemon=True)
+        self.client = client or PushClient(server_url, api_key)
+        self.spool = spool  # PositionSpool: failed uploads are kept here, and sent once server is back
+        # Several uploaders may share a client and upload_queue, to upload concurrently
+        self.queue = upload_queue if upload_queue is not None else LatestValueQueue(queue_size)
+        self.log_counter = 0  # Counter for logging every 10th position
+        self._stopping = threading.Event()
+
+    def submit(self, position, traffic=None, received_at=None, api_key=None):
+        """Queue position (a dict), or batch of positions (a list), for upload. Returns immediately.
+        received_at is when the newest data in position arrived (for the data age metric).
+        api_key, if given, overrides the client's key for this upload."""
+        self.queue.put((position, traffic, received_at, api_key))
+
+    def run(self):
+        while not self._stopping.is_set():
+            item = self.queue.get()  # sleeps until there's an upload, or stop()
+            if item is None:
+                continue
+            try:
+                self.upload(*item)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                # Only upload thread: never let one bad upload stop it
+                metrics.inc('uploads_total', ('result', 'error'))
+                log(f"✗ Upload error: {type(e).__name__} {e}")
+
+    def stop(self, timeout=5.0):
+        """Ask worker to exit, waiting up to timeout seconds for any in-flight upload, then close
+        its client and spool (see stop_uploaders() for uploaders sharing a client)"""
+        self.halt()
+        self.finish(timeout)
+        self.close()
+
+    def halt(self):
+        """Ask worker to exit once any in-flight upload is done. Doesn't wait."""
+        self._stopping.set()
+        self.queue.wake()
+
+    def finish(self, timeout=5.0):
+        """Wait up to timeout seconds for the worker to exit, after halt()"""
+        if self.is_alive():
+            self.join(timeout)
+
+    def close(self):
+        log(f"INFO: upload stats {self.client.stats()}")
+        self.client.close()
+        if self.spool is not None:
+            self.spool.close()
+
+    def upload(self, position, traffic=None, received_at=None, api_key=None):
+        """POST a single position or batch (blocking). Called from the worker thread."""
+        positions = position if isinstance(position, list) else [position]
+        if received_at:
+            metrics.observe('data_age_seconds', time.time() - received_at)
+        breaker = self.client.breaker
+        if not breaker.allow():
+            # Server is failing: don't wait on it, keep the positions for backfill
+            metrics.inc('uploads_total', ('result', 'circuit_open'))
+            if self.spool is not None:
+                self.spool.append(positions)
+            return
+        try:
+            if isinstance(position, list):
+                response = self.client.push_batch(position, traffic, api_key)
+                position = position[-1]
+            else:
+                response = self.client.push(position, traffic, api_key)
+
+            metrics.inc('uploads_total', ('result', str(response.status_code)))
+            if response.status_code == 200:
+                breaker.success()
+                # Log only every 10th position to reduce log file size (1st, 11th, 21st, etc.)
+                self.log_counter = (self.log_counter % 10) + 1
+                if self.log_counter == 1:
+                    log(format_status(position))
+                if self.spool is not None:
+                    self.backfill()
+                return
+            log(f"✗ Upload failed: {response.status_code}")
+            if response.status_code < 500 and response.status_code != 429:
+                breaker.success()  # Server is up, it rejected this upload: no point spooling it for later
+                return
+            breaker.failure()
+
+        except requests.exceptions.RequestException as e:
+            metrics.inc('uploads_total', ('result', 'network_error'))
+            log(f"✗ Network error: {e}")
+            breaker.failure()
+        except Exception:
+            # Not the server's fault, but this may have been the breaker's probe: release it (run() logs this)
+            breaker.failure()
+            raise
+
+        if self.spool is not None:
+            self.spool.append(positions)
+
+    def backfill(self):
+        """Upload spooled positions in batches, oldest first, until spool is empty or the server
+        fails. A batch the server refuses (other 4xx) is dropped, not retried."""
+        while len(self.spool) and not self._stopping.is_set():
+            positions = self.spool.peek(SPOOL_BACKFILL_BATCH)
+            try:
+                response = self.client.push_batch(positions)
+            except requests.exceptions.RequestException:
+                self.client.breaker.failure()
+                return
+            if response.status_code >= 500 or response.status_code == 429:
+                self.client.breaker.failure()
+                return
+            if response.status_code != 200:
+                # Server is up and refused it, as upload() treats a refusal: retrying won't help
+                metrics.inc('uploads_total', ('result', 'backfill_rejected'))
+                log(f"✗ Backfill failed: {response.status_code}, dropping {len(positions)} spooled positions")
+            self.spool.consume(len(positions))
+            if not len(self.spool):
+                log("INFO: spool backfill complete")
+
+
+class Sink(threading.Thread):
+    """One extra destination for the tracker's uploads, on its own worker thread with its own
+    bounded queue (oldest dropped when full), so a slow or dead destination never delays the
+    others, or the receive loop. Subclasses implement deliver().
+
+    Metrics are labelled with the sink's name: sink_items_total, sink_failures_total,
+    sink_latency_seconds, and the sink_queue_depth / sink_dropped gauges.
+    """
+
+    def __init__(self, name, queue_size=SINK_QUEUE_SIZE):
+        super().__init__(name=f"Sink-{name}", daemon=True)
+        self.label = ('sink', name)
+        self.queue = LatestValueQueue(queue_size)
+        self._stopping = threading.Event()
+
+    def submit(self, position, traffic=None, received_at=None, api_key=None):
+        """Queue position (a dict), or batch of positions (a list), as for PositionUploader. Never blocks."""
+        self.queue.put((position, traffic, received_at, api_key))
+
+    def run(self):
+        while not self._stopping.is_set():
+            item = self.queue.get()
+            if item is None:
+                continue
+            start = time.perf_counter()
+            try:
+                delivered = self.deliver(*item)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                log(f"✗ {self.label[1]}: {e}")
+                delivered = False
+            metrics.observe('sink_latency_seconds', time.perf_counter() - start, self.label)
+            metrics.inc('sink_items_total' if delivered else 'sink_failures_total', self.label)
+
+    def deliver(self, position, traffic=None, received_at=None, api_key=None):
+        """Send one queued upload (blocking). Returns True if it was delivered."""
+        raise NotImplementedError
+
+    def stop(self, timeout=5.0):
+        """Ask worker to exit, waiting up to timeout seconds for a delivery in progress"""
+        self._stopping.set()
+        self.queue.wake()
+        if self.is_alive():
+            self.join(timeout)
+        self.close()
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def records(position, traffic=None):
+        """One dict per position (without the API key), the last one with traffic (if any)"""
+        positions = position if isinstance(position, list) else [position]
+        records = [{'position': p} for p in positions]
+        if traffic and records:
+            records[-1]['traffic'] = traffic
+        return records
+
+
+class HttpSink(Sink):
+    """Pushes uploads to a second HTTP endpoint, in the same format as the avnwx one.
+
+    Has its own PushClient (so its own connection pool and CircuitBreaker), but no spool:
+    uploads that fail are not retried.
+    """
+
+    def __init__(self, url, api_key, name='http', queue_size=SINK_QUEUE_SIZE, timeout=PUSH_TIMEOUT):
+        super().__init__(name, queue_size)
+        self.client = PushClient(url, api_key, timeout=timeout, encoding='json',
+                                 breaker=CircuitBreaker(name=f"{name} sink"), label=self.label)
+
+    def deliver(self, position, traffic=None, received_at=None, api_key=None):
+        breaker = self.client.breaker
+        if not breaker.allow():
+            return False
+        try:
+            if isinstance(position, list):
+                response = self.client.push_batch(position, traffic)
+            else:
+                response = self.client.push(position, traffic)
+        except requests.exceptions.RequestException:
+            breaker.failure()
+            return False
+        if response.status_code >= 500 or response.status_code == 429:
+            breaker.failure()
+        else:
+            breaker.success()
+        return response.status_code == 200
+
+    def close(self):
+        self.client.close()
+
+
+class UdpSink(Sink):
+    """Sends each position as a UDP datagram of JSON (see Sink.records()) to address, a
+    (host, port) pair. A host ending in .255 broadcasts, so any number of local listeners
+    can follow the feed without sharing X-Plane's port."""
+
+    MAX_DATAGRAM = 65000
+
+    def __init__(self, address, name='udp', queue_size=SINK_QUEUE_SIZE):
+        super().__init__(name, queue_size)
+        self.address = address
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if address[0].endswith('.255'):
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+
+    def deliver(self, position, traffic=None, received_at=None, api_key=None):
+        for record in self.records(position, traffic):
+            data = json.dumps(record, separators=(',', ':')).encode('utf-8')
+            if len(data) > self.MAX_DATAGRAM:
+                del record['traffic']  # too much traffic for one datagram: send the position alone
+                data = json.dumps(record, separators=(',', ':')).encode('utf-8')
+            self.sock.sendto(data, self.address)
+        return True
+
+    def close(self):
+        self.sock.close()
+
+
+class FileSink(Sink):
+    """Appends each position to path as a line of JSON (see Sink.records())"""
+
+    def __init__(self, path, name='file', queue_size=SINK_QUEUE_SIZE):
+        super().__init__(name, queue_size)
+        self.path = path
+        self.file = open(path, 'a', encoding='utf-8')  # pylint: disable=consider-using-with
+
+    def deliver(self, position, traffic=None, received_at=None, api_key=None):
+        self.file.write(''.join(json.dumps(record, separators=(',', ':')) + '\n'
+                                for record in self.records(position, traffic)))
+        self.file.flush()
+        return True
+
+    def close(self):
+        self.file.close()
+
+
+class FanOut:
+    """Hands every upload to several destinations: the PositionUploader for avnwx, and any
+    number of Sinks. submit() only queues, for each, so never blocks; each destination
+    keeps its own queue, worker and metrics."""
+
+    def __init__(self, uploader, sinks):
+        self.uploader = uploader
+        self.sinks = sinks
+
+    def submit(self, position, traffic=None, received_at=None, api_key=None):
+        self.uploader.submit(position, traffic, received_at, api_key)
+        for sink in self.sinks:
+            sink.submit(position, traffic, received_at, api_key)
+
+    def start(self):
+        self.uploader.start()
+        for sink in self.sinks:
+            sink.start()
+
+    def stop(self, timeout=5.0):
+        self.uploader.stop(timeout)
+        for sink in self.sinks:
+            sink.stop(timeout)
+
+
+def create_sinks(api_key):
+    """Sinks configured by MIRROR_URL, REBROADCAST_ADDRESS and OUTPUT_FILE"""
+    sinks = []
+    if MIRROR_URL:
+        sinks.append(HttpSink(MIRROR_URL, MIRROR_API_KEY or api_key, name='mirror'))
+    if REBROADCAST_ADDRESS:
+        sinks.append(UdpSink(REBROADCAST_ADDRESS, name='rebroadcast'))
+    if OUTPUT_FILE:
+        try:
+            sinks.append(FileSink(OUTPUT_FILE))
+        except OSError as e:
+            log(f"⚠ Output file disabled, can't open {OUTPUT_FILE}: {e}")
+    return sinks
+
+
+LIVE_MAP_PAGE = b"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>AvnWx live map</title>
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css">
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<style>html, body, #map {height: 100%; margin: 0} #status {position: absolute; top: 8px; right: 8px;
+ z-index: 1000; background: white; padding: 4px 8px; font: 13px monospace}</style></head>
+<body><div id="map"></div><div id="status">waiting for data</div><script>
+const map = L.map('map').setView([0, 0], 2), markers = {};
+L.tileLayer('https://tile.openstreetmap.org/{z}/{x}/{y}.png', {maxZoom: 18}).addTo(map);
+let centered = false;
+function place(id, lat, lon, label, color) {
+  if (!markers[id]) markers[id] = L.circleMarker([lat, lon], {radius: 6, color: color}).addTo(map).bindTooltip(label);
+  markers[id].setLatLng([lat, lon]);
+}
+new EventSource('/events').onmessage = (event) => {
+  const update = JSON.parse(event.data), p = update.position;
+  if (p) {
+    place('own', p.lat, p.lon, 'own', 'red');
+    if (!centered) { map.setView([p.lat, p.lon], 11); centered = true; }
+    document.getElementById('status').textContent =
+      `${p.altitude} ft  ${p.speed} kt  hdg ${p.heading}  ${new Date(p.timestamp * 1000).toLocaleTimeString()}`;
+  }
+  const t = update.traffic;
+  if (t) t.id.forEach((id, i) => place(id, t.lat[i], t.lon[i], t.callsign[i], 'blue'));
+};
+</script></body></html>
+"""
+
+
+class LiveMapServer(threading.Thread):
+    """Local live map for the LAN: a small asyncio HTTP server on its own thread.
+
+    GET / is a map page; GET /events is a Server-Sent Events stream of updates; GET
+    /position is the latest update as JSON. publish() (from the receive loop) encodes each
+    update once, as a complete SSE frame, and the server writes those same bytes to every
+    subscriber. Writes never wait on a client: one that falls LIVE_MAP_MAX_BUFFER bytes
+    behind is disconnected.
+    """
+
+    def __init__(self, host=LIVE_MAP_HOST, port=LIVE_MAP_PORT, max_buffer=LIVE_MAP_MAX_BUFFER,
+                 keepalive=LIVE_MAP_KEEPALIVE):
+        super().__init__(name="LiveMapServer", daemon=True)
+        self.host = host
+        self.port = port
+        self.max_buffer = max_buffer
+        self.keepalive = keepalive
+        self.loop = None
+        self.server = None
+        self.subscribers = set()  # StreamWriters of /events clients
+        self.latest = b'{}'
+        self.frames = 0
+        self.slow_disconnects = 0
+        self.ready = threading.Event()
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.server = self.loop.run_until_complete(asyncio.start_server(self.handle, self.host, self.port,
+                                                                            backlog=1024))
+            self.port = self.server.sockets[0].getsockname()[1]
+            log(f"Live map on http://{self.host}:{self.port}/")
+        except OSError as e:
+            log(f"⚠ Live map disabled, can't listen on {self.host}:{self.port}: {e}")
+            self.ready.set()
+            return
+        self.ready.set()
+        keepalive = self.loop.create_task(self._keepalive())
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            keepalive.cancel()
+            for writer in list(self.subscribers):
+                writer.transport.abort()  # ends their handle()
+            tasks = asyncio.all_tasks(self.loop)
+            if tasks:
+                self.loop.run_until_complete(asyncio.wait(tasks, timeout=1.0))
+            self.loop.close()
+
+    async def handle(self, reader, writer):
+        try:
+            request = await reader.readuntil(b'\r\n\r\n')
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        parts = request.split(b' ', 2)
+        path = parts[1].split(b'?', 1)[0] if len(parts) > 1 else b''
+        if path == b'/events':
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n'
+                         b'Access-Control-Allow-Origin: *\r\n\r\n')
+            writer.write(b'data: ' + self.latest + b'\n\n')
+            self.subscribers.add(writer)
+            try:
+                # Nothing more is expected: discard anything sent, in bounded reads, until the client disconnects
+                while await reader.read(4096):
+                    pass
+            except ConnectionError:
+                pass
+            self.subscribers.discard(writer)
+        else:
+            if path == b'/':
+                status, content_type, body = b'200 OK', b'text/html; charset=utf-8', LIVE_MAP_PAGE
+            elif path == b'/position':
+                status, content_type, body = b'200 OK', b'application/json', self.latest
+            else:
+                status, content_type, body = b'404 Not Found', b'text/plain', b'not found'
+            writer.write(b'HTTP/1.1 ' + status + b'\r\nContent-Type: ' + content_type + b'\r\nContent-Length: '
+                         + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+        writer.close()
+
+    def publish(self, position, traffic=None):
+        """Send update to every subscriber. Thread safe; encodes once, never blocks."""
+        if self.loop is None or self.server is None:
+            return
+        update = {'position': position}
+        if traffic:
+            update['traffic'] = traffic
+        self.latest = json.dumps(update, separators=(',', ':')).encode('utf-8')
+        self.loop.call_soon_threadsafe(self._broadcast, b'data: ' + self.latest + b'\n\n')
+
+    def _broadcast(self, frame):
+        self.frames += 1
+        for writer in list(self.subscribers):
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                self.slow_disconnects += 1
+                self.subscribers.discard(writer)
+                writer.transport.abort()
+            else:
+                writer.write(frame)
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(self.keepalive)
+            self._broadcast(b': keepalive\n\n')
+            self.frames -= 1
+
+    def stop(self, timeout=2.0):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        self.join(timeout)
+
+
+def format_status(position):
+    """Build one-line status summary of position, for the log"""
+    status = (f"✓ {position['lat']:.4f}, {position['lon']:.4f} | "
+              f"{position['altitude']:.0f}ft")
+
+    if 'altitude_agl' in position:
+        status += f" ({position['altitude_agl']:.0f}ft AGL)"
+
+    status += f" | {position['heading']:.0f}° | {position['speed']:.0f}kts"
+
+    if 'vertical_speed' in position and abs(position['vertical_speed']) > 50:
+        vs_sign = "↑" if position['vertical_speed'] > 0 else "↓"
+        status += f" | {vs_sign}{abs(position['vertical_speed']):.0f}fpm"
+    return status
+
+
+def clean_key(raw_key):
+    # Convert to uppercase, strip whitespace (including newlines), remove hyphens
+    return raw_key.upper().strip().replace('-', '').replace(' ', '').replace('\n', '').replace('\r', '').replace('\t', '')
+
+
+def get_api_key(config_file):
     api_key = clean_key(BAD_API_KEY)
     try:
         with open(config_file, 'r', encoding='utf-8') as f:
@@ -201,11 +2509,169 @@ def get_api_key(config_file):
         log("1. Visit https://maps.avnwx.com")
         log("2. Click 'Track My Aircraft'")
         log("3. Copy value of displayed API-key from side panel.")
-        sys.exit(1)
+        sys.exit(CONFIG_ERROR_EXIT)
 
     return api_key
 
 
+def load_sources(sources_file):
+    """Read sources file: one X-Plane instance per line, as
+
+        port [source-address] api-key
+
+    e.g. "49002 192.168.1.21 ABCD-1234". Without source-address, all datagrams arriving on
+    port (not claimed by another line) belong to that source. '#' starts a comment.
+    Returns list of (port, address or None, api_key). Returns [] if the file doesn't exist.
+    """
+    sources = []
+    try:
+        with open(sources_file, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                fields = line.split('#', 1)[0].split()
+                if not fields:
+                    continue
+                try:
+                    if len(fields) == 2:
+                        sources.append((int(fields[0]), None, clean_key(fields[1])))
+                    elif len(fields) == 3:
+                        sources.append((int(fields[0]), fields[1], clean_key(fields[2])))
+                    else:
+                        raise ValueError("expected: port [source-address] api-key")
+                except ValueError as e:
+                    log(f"⚠ {sources_file} line {line_number} ignored: {e}")
+    except FileNotFoundError:
+        pass
+    return sources
+
+
+class MultiSourceTracker:
+    """One event-driven receive loop serving several X-Plane instances.
+
+    Each source is a (port, source address) with its own API key and its own
+    XPlaneUDPReceiver state. All sockets are watched with one selector; each wakeup drains
+    every readable socket, routing datagrams by sender address and keeping only the newest
+    XGPS/XATT per source (see XPlaneUDPReceiver.stash()). Every UPLOAD_INTERVAL, each source
+    with fresh data queues one upload, sent by a shared uploader over one connection pool.
+    """
+
+    def __init__(self, sources):
+        self.selector = selectors.DefaultSelector()
+        self.routes = {}  # (port, address or None) -> (receiver, api_key)
+        self.unknown = 0  # datagrams from senders not in sources
+        for port, address, api_key in sources:
+            if not any(route[0] == port for route in self.routes):
+                sock = open_udp_socket(port)
+                sock.setblocking(False)
+                self.selector.register(sock, selectors.EVENT_READ, port)
+                log(f"Listening for X-Plane UDP broadcasts on 0.0.0.0:{port}")
+            self.routes[(port, address)] = (XPlaneUDPReceiver(), api_key)
+
+    @property
+    def receivers(self):
+        return [receiver for receiver, _api_key in self.routes.values()]
+
+    def _drain(self, sock, port):
+        """Read all pending datagrams from sock, routing each to its source's receiver"""
+        routes = self.routes
+        try:
+            while True:
+                data, addr = sock.recvfrom(4096)
+                route = routes.get((port, addr[0])) or routes.get((port, None))
+                if route is None:
+                    self.unknown += 1
+                else:
+                    route[0].stash(data)
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            log(f"⚠ Error receiving data: {e}")
+
+    def run(self, uploader, stop_event=None):
+        """Receive and upload until KeyboardInterrupt, or until stop_event is set (see run_tracker()).
+        Uploads are only due once some source has sent new data."""
+        next_upload = time.monotonic() + UPLOAD_INTERVAL
+        next_metrics = time.monotonic() + METRICS_INTERVAL
+        fresh = False
+        stop_selectable = hasattr(stop_event, 'fileno')
+        if stop_selectable:
+            self.selector.register(stop_event, selectors.EVENT_READ, None)
+        try:
+            while stop_event is None or not stop_event.is_set():
+                deadline = min(next_upload, next_metrics) if fresh else next_metrics
+                timeout = max(deadline - time.monotonic(), 0.0) if fresh or METRICS_FORMAT else None
+                if stop_event is not None and not stop_selectable:
+                    timeout = STOP_POLL_INTERVAL if timeout is None else min(timeout, STOP_POLL_INTERVAL)
+                for key, _events in self.selector.select(timeout):
+                    if key.data is not None:
+                        self._drain(key.fileobj, key.data)
+                        fresh = True
+                metrics.inc('loop_wakeups_total')
+
+                now = time.monotonic()
+                if fresh and now >= next_upload:
+                    for receiver, api_key in self.routes.values():
+                        position = receiver.get_position()
+                        if position:
+                            uploader.submit(position, None, receiver.last_receive_time, api_key)
+                    next_upload = max(next_upload + UPLOAD_INTERVAL, now)
+                    fresh = False
+                if METRICS_FORMAT and now >= next_metrics:
+                    metrics.export()
+                    next_metrics = now + METRICS_INTERVAL
+        finally:
+            if stop_selectable:
+                self.selector.unregister(stop_event)
+
+    def stop(self):
+        for key in list(self.selector.get_map().values()):
+            self.selector.unregister(key.fileobj)
+            key.fileobj.close()
+        self.selector.close()
+
+
+def start_uploaders(server_url, api_key, workers, queue_size):
+    """Start `workers` PositionUploaders sharing one queue and one pooled PushClient.
+    Returns list of uploaders; submit to any of them."""
+    client = PushClient(server_url, api_key, pool_size=workers)
+    upload_queue = LatestValueQueue(queue_size)
+    uploaders = [PositionUploader(server_url, api_key, client=client, upload_queue=upload_queue)
+                 for _ in range(workers)]
+    for uploader in uploaders:
+        uploader.start()
+    return uploaders
+
+
+def stop_uploaders(uploaders, timeout=5.0):
+    """Stop uploaders started by start_uploaders(): all of them, before closing their shared client"""
+    for uploader in uploaders:
+        uploader.halt()
+    deadline = time.monotonic() + timeout
+    for uploader in uploaders:
+        uploader.finish(max(0.0, deadline - time.monotonic()))
+    uploaders[0].close()
+
+
+def stream_multi_sources(sources, server_url):
+    """Main loop when serving several X-Plane instances (see SOURCES_FILE)"""
+    tracker = MultiSourceTracker(sources)
+    uploaders = start_uploaders(server_url, None, UPLOAD_WORKERS, queue_size=2 * len(sources))
+    metrics.gauge('sources', lambda: len(sources))
+    metrics.gauge('upload_queue_depth', lambda: len(uploaders[0].queue))
+    metrics.gauge('upload_queue_dropped', lambda: uploaders[0].queue.dropped)
+    metrics.gauge('unknown_source_packets', lambda: tracker.unknown)
+    log(f"Serving {len(sources)} sources, will post to {server_url}")
+    log("-" * 60)
+    try:
+        tracker.run(uploaders[0])
+    except KeyboardInterrupt:
+        log("\nStopping...")
+    finally:
+        tracker.stop()
+        stop_uploaders(uploaders)
+        log("Stopped listening for X-Plane UDP broadcasts")
+        logWriter.close()
+
+
 def stream_to_server():
     """Main loop: receive X-Plane UDP broadcast data and stream to server"""
     log("INFO: stream_to_server started")
@@ -215,7 +2681,8 @@ def stream_to_server():
         config_file = 'api-key.txt'
     else:
         config_file = os.path.join(os.path.dirname(__file__), 'api-key.txt')
-    api_key = get_api_key(config_file)
+    sources = load_sources(os.path.join(os.path.dirname(config_file), SOURCES_FILE))
+    api_key = get_api_key(config_file) if not sources else None
     server_url = SERVER_URL
 
     # Set up signal handler for graceful termination
@@ -227,81 +2694,308 @@ def stream_to_server():
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
 
-    # Start UDP receiver
-    receiver = XPlaneUDPReceiver()
+    if sources:
+        stream_multi_sources(sources, server_url)
+        return
+
+    # Start receiver: shared memory from PI_AvnWx.py if it's publishing, else UDP broadcasts
+    feed = SharedPositionFeed.attach() if SHARED_FEED else None
+    receiver = SharedFeedReceiver(feed) if feed is not None else XPlaneUDPReceiver()
+    receiver.track_traffic = UPLOAD_TRAFFIC or LIVE_MAP
     receiver.start()
     log("INFO: receiver started")
 
-    last_upload = 0.0
-    last_no_data_log = time.time()
-    upload_interval = 1.0  # Upload every second
-    no_data_log_interval = 60.0  # Log "still listening" every 60 seconds if no data
-    log_counter = 0  # Counter for logging every 10th position
+    # Start upload worker
+    try:
+        spool = PositionSpool()
+    except OSError as e:
+        log(f"⚠ Spool disabled, can't open {SPOOL_FILE}: {e}")
+        spool = None
+    uploader = PositionUploader(server_url, api_key,
+                                queue_size=BATCH_QUEUE_SIZE if BATCH_UPLOADS else UPLOAD_QUEUE_SIZE,
+                                spool=spool)
+    sinks = create_sinks(api_key)
+    output = FanOut(uploader, sinks) if sinks else uploader
+    output.start()
+    batcher = SampleBatcher() if BATCH_UPLOADS else None
+    dead_reckoning = DeadReckoning() if DEAD_RECKONING and not BATCH_UPLOADS else None
+    cadence = AdaptiveCadence() if ADAPTIVE_CADENCE and not BATCH_UPLOADS else None
+    archive = None
+    if ARCHIVE_SAMPLES and not use_numpy:
+        log("⚠ Sample archive disabled, needs numpy")
+    elif ARCHIVE_SAMPLES:
+        try:
+            archive = TrackArchive()
+            log(f"INFO: archiving samples to {ARCHIVE_DIR} ({len(archive)} already)")
+        except (OSError, ValueError) as e:
+            log(f"⚠ Sample archive disabled, can't open {ARCHIVE_DIR}: {e}")
+    resampler = None
+    if RESAMPLE and not use_numpy:
+        log("⚠ Resampling disabled, needs numpy")
+    elif RESAMPLE:
+        resampler = TrackResampler()
+    track_filter = TrackFilter(simplify=SIMPLIFY_TRACK) if TRACK_FILTER else None
+    live_map = None
+    if LIVE_MAP:
+        live_map = LiveMapServer()
+        live_map.start()
+        live_map.ready.wait(5.0)
+        metrics.gauge('live_map_subscribers', lambda: len(live_map.subscribers))
+    register_gauges(receiver, uploader, batcher, dead_reckoning, cadence, sinks)
+    if archive is not None:
+        metrics.gauge('archive_samples', lambda: len(archive))
+    if track_filter is not None:
+        metrics.gauge('track_simplified_ratio', lambda: round(track_filter.reduction, 3))
 
     log("Waiting for X-Plane UDP broadcast data...")
     log(f"Will post to {server_url} with key {api_key}")
+    for sink in sinks:
+        log(f"... and to {sink.label[1]} sink")
     log("-" * 60)
 
     try:
-        while True:
-            # Receive UDP packets
-            received = receiver.receive()
+        run_tracker(receiver, output, batcher=batcher, dead_reckoning=dead_reckoning, cadence=cadence,
+                    archive=archive, live_map=live_map, resampler=resampler, track_filter=track_filter)
+    except KeyboardInterrupt:
+        log("\nStopping...")
+    finally:
+        # Stop receiving on exit
+        receiver.stop()
+        output.stop()
+        if dead_reckoning:
+            log(f"INFO: dead reckoning {dead_reckoning.stats()}")
+        if cadence:
+            log(f"INFO: adaptive cadence averaged {cadence.average_rate:.2f} uploads/s")
+        if track_filter is not None:
+            rows = track_filter.flush()
+            if rows and archive is not None:
+                archive.append_rows(np.asarray(rows))
+            log(f"INFO: track filter {track_filter.stats()}")
+        if archive is not None:
+            archive.close()
+        if live_map is not None:
+            live_map.stop()
+        if METRICS_FORMAT:
+            metrics.export()
+        log("Stopped listening for X-Plane UDP broadcasts")
+        logWriter.close()
+
+
+def register_gauges(receiver, uploader, batcher=None, dead_reckoning=None, cadence=None, sinks=()):
+    """Add gauges for the pipeline's queues and drop counts to metrics"""
+    metrics.gauge('upload_queue_depth', lambda: len(uploader.queue))
+    metrics.gauge('upload_queue_dropped', lambda: uploader.queue.dropped)
+    metrics.gauge('circuit_open', lambda: int(uploader.client.breaker.state != CircuitBreaker.CLOSED))
+    metrics.gauge('traffic_aircraft', lambda: len(receiver.traffic))
+    metrics.gauge('traffic_dropped', lambda: receiver.traffic.dropped)
+    metrics.gauge('last_receive_age_seconds',
+                  lambda: round(time.time() - receiver.last_receive_time, 3) if receiver.last_receive_time else None)
+    if uploader.spool is not None:
+        metrics.gauge('spool_depth', lambda: len(uploader.spool))
+    if batcher is not None:
+        metrics.gauge('batch_depth', lambda: len(batcher))
+        metrics.gauge('batch_dropped', lambda: batcher.dropped)
+    if dead_reckoning is not None:
+        metrics.gauge('dead_reckoning_suppression_ratio', lambda: round(dead_reckoning.suppression_ratio, 3))
+    if cadence is not None:
+        metrics.gauge('cadence_average_rate', lambda: round(cadence.average_rate, 3))
+    for sink in sinks:
+        metrics.gauge(TrackerMetrics._name('sink_queue_depth', sink.label), lambda sink=sink: len(sink.queue))
+        metrics.gauge(TrackerMetrics._name('sink_dropped', sink.label), lambda sink=sink: sink.queue.dropped)
+
+
+def run_tracker(receiver, uploader, stop_event=None, batcher=None, coalesce=COALESCE_PACKETS,
+                dead_reckoning=None, cadence=None, archive=None, live_map=None, resampler=None, track_filter=None):
+    """Receive loop: drain UDP packets and hand a position to uploader (a PositionUploader, or
+    a FanOut to several destinations) at regular intervals.
+
+    Event driven: blocks in a selector until a packet arrives or the next deadline (upload,
+    metrics export, "still listening" log) is due, so an idle tracker barely wakes. An
+    upload is only due once new data has arrived since the last one.
+
+    With coalesce, each wakeup drains every pending packet and only the newest position is
+    parsed, at upload time (see XPlaneUDPReceiver.drain()).
 
-            current_time = time.time()
+    With a batcher (SampleBatcher), every received sample is buffered and the whole batch
+    is handed over every BATCH_INTERVAL seconds, or sooner once BATCH_MAX_SAMPLES are buffered.
 
-            # Log if no data received for a while
-            if current_time - receiver.last_receive_time > no_data_log_interval:
-                if current_time - last_no_data_log >= no_data_log_interval:
+    With dead_reckoning (DeadReckoning), positions close to where the last uploaded one
+    predicts are not uploaded.
+
+    With cadence (AdaptiveCadence), the interval to the next upload is chosen from the
+    current flight state rather than fixed at UPLOAD_INTERVAL.
+
+    With an archive (TrackArchive), every XGPS and XATT sample is parsed and archived
+    (so packets aren't coalesced).
+
+    With a resampler (TrackResampler), every sample is parsed too, but what's uploaded,
+    batched, archived and mapped are its evenly spaced, interpolated outputs.
+
+    With a track_filter (TrackFilter), samples it rejects as outliers are never uploaded,
+    and those it simplifies away are not batched or archived. Without a batcher, archive or
+    resampler, it only checks the positions about to be uploaded.
+
+    With a live_map (LiveMapServer), the newest position (and traffic) is published to it
+    every LIVE_MAP_INTERVAL seconds, while data is arriving.
+
+    Every METRICS_INTERVAL seconds, metrics are written to METRICS_FILE (if METRICS_FORMAT is set).
+
+    Runs until KeyboardInterrupt, or until stop_event is set. If stop_event is a StopEvent
+    setting it wakes the loop at once, otherwise it's checked every STOP_POLL_INTERVAL seconds.
+    """
+    upload_interval = BATCH_INTERVAL if batcher is not None else UPLOAD_INTERVAL
+    now = time.monotonic()
+    last_upload = now - upload_interval
+    next_metrics = now + METRICS_INTERVAL
+    next_no_data_log = now + NO_DATA_LOG_INTERVAL
+    next_poll = now
+    last_live = now - LIVE_MAP_INTERVAL
+    live_fresh = False
+    # As for uploads, a polled receiver is always assumed to have new data
+    live_polled = live_map is not None and receiver.poll_interval is not None
+    # Wants every sample, not just the newest
+    sampling = batcher is not None or archive is not None or resampler is not None
+    newest_position = resampler.position if resampler is not None else receiver.get_position
+    if track_filter is not None and sampling:
+        newest_position = track_filter.position
+    # A receiver with a poll_interval (shared memory) has no socket event for new data, so
+    # is always assumed to have some: it's read when an upload is due
+    fresh = receiver.poll_interval is not None
+    selector = selectors.DefaultSelector()
+    if receiver.sock is not None:
+        selector.register(receiver.sock, selectors.EVENT_READ, receiver)
+    stop_selectable = hasattr(stop_event, 'fileno')
+    if stop_selectable:
+        selector.register(stop_event, selectors.EVENT_READ, stop_event)
+
+    try:
+        while stop_event is None or not stop_event.is_set():
+            deadline = next_no_data_log
+            if METRICS_FORMAT:
+                deadline = min(deadline, next_metrics)
+            if sampling and receiver.poll_interval is not None:
+                deadline = min(deadline, next_poll)
+            if batcher is not None:
+                if len(batcher):
+                    deadline = min(deadline, last_upload + upload_interval)
+            elif fresh:
+                deadline = min(deadline, last_upload + upload_interval)
+            if live_fresh or live_polled:
+                deadline = min(deadline, last_live + LIVE_MAP_INTERVAL)
+            timeout = max(0.0, deadline - time.monotonic())
+            if stop_event is not None and not stop_selectable:
+                timeout = min(timeout, STOP_POLL_INTERVAL)
+
+            if selector.get_map():
+                events = selector.select(timeout)
+            else:
+                # Nothing to wait on (polled receiver without a socket, no StopEvent), and on
+                # Windows select() with no sockets is an error
+                if stop_event is not None:
+                    stop_event.wait(timeout)
+                else:
+                    time.sleep(timeout)
+                events = []
+            metrics.inc('loop_wakeups_total')
+            received = 0
+            for key, _mask in events:
+                if key.data is not receiver:
+                    continue  # stop_event
+                if receiver.poll_interval is not None:
+                    # Only XTRA traffic arrives on a polled receiver's socket: its samples are polled below
+                    received += receiver.drain()
+                elif sampling or not coalesce:
+                    # Parse every packet
+                    while True:
+                        updated = receiver.receive()
+                        if updated is None:
+                            break
+                        received += 1
+                        if updated:
+                            sample(receiver, batcher, archive, resampler, track_filter)
+                else:
+                    received += receiver.drain()
+
+            now = time.monotonic()
+            if received:
+                fresh = True
+                live_fresh = live_map is not None
+                next_no_data_log = now + NO_DATA_LOG_INTERVAL
+            elif now >= next_no_data_log:
+                if time.time() - receiver.last_receive_time > NO_DATA_LOG_INTERVAL:
                     log("⏱ Still listening for X-Plane UDP broadcasts (no data received yet)...")
-                    last_no_data_log = current_time
+                next_no_data_log = now + NO_DATA_LOG_INTERVAL
+
+            if METRICS_FORMAT and now >= next_metrics:
+                metrics.export()
+                next_metrics = now + METRICS_INTERVAL
 
-            # Upload to server at regular intervals
-            if current_time - last_upload >= upload_interval:
-                position = receiver.get_position()
+            if sampling and receiver.poll_interval is not None and now >= next_poll:
+                if receiver.receive():
+                    sample(receiver, batcher, archive, resampler, track_filter)
+                next_poll = now + receiver.poll_interval
 
+            if (live_fresh or live_polled) and now - last_live >= LIVE_MAP_INTERVAL:
+                position = newest_position()
                 if position:
-                    try:
-                        response = requests.post(
-                            server_url,
-                            json={'api_key': api_key, 'position': position},
-                            timeout=5
-                        )
-
-                        if response.status_code == 200:
-                            # Log only every 10th position to reduce log file size (1st, 11th, 21st, etc.)
-                            log_counter = (log_counter % 10) + 1
-                            if log_counter == 1:
-                                # Build status line
-                                status = (f"✓ {position['lat']:.4f}, {position['lon']:.4f} | "
-                                          f"{position['altitude']:.0f}ft")
-
-                                if 'altitude_agl' in position:
-                                    status += f" ({position['altitude_agl']:.0f}ft AGL)"
-
-                                status += f" | {position['heading']:.0f}° | {position['speed']:.0f}kts"
-
-                                if 'vertical_speed' in position and abs(position['vertical_speed']) > 50:
-                                    vs_sign = "↑" if position['vertical_speed'] > 0 else "↓"
-                                    status += f" | {vs_sign}{abs(position['vertical_speed']):.0f}fpm"
-
-                                log(status)
-                        else:
-                            log(f"✗ Upload failed: {response.status_code}")
-
-                    except requests.exceptions.RequestException as e:
-                        log(f"✗ Network error: {e}")
-
-                    last_upload = current_time
+                    live_map.publish(position, receiver.traffic.to_payload() if len(receiver.traffic) else None)
+                last_live = now
+                live_fresh = False
+
+            if batcher is not None:
+                if len(batcher) and (now - last_upload >= upload_interval or len(batcher) >= batcher.max_samples):
+                    uploader.submit(batcher.take(), receiver.traffic.to_payload() if UPLOAD_TRAFFIC else None,
+                                    receiver.last_receive_time)
+                    last_upload = now
+                continue
+
+            # Queue upload to server at regular intervals, if there's been new data
+            if fresh and now - last_upload >= upload_interval:
+                position = newest_position()
+
+                if position:
+                    if ((track_filter is None or sampling or track_filter.accept_position(position))
+                            and (dead_reckoning is None or dead_reckoning.should_upload(position))):
+                        uploader.submit(position, receiver.traffic.to_payload() if UPLOAD_TRAFFIC else None,
+                                        receiver.last_receive_time)
+                        if cadence is not None:
+                            upload_interval = cadence.next_interval(receiver.record)
+                    last_upload = now
                 else:
                     if received:
                         log("⚠ Waiting for valid position data from X-Plane...")
-
-    except KeyboardInterrupt:
-        log("\nStopping...")
+                fresh = receiver.poll_interval is not None
     finally:
-        # Stop receiving on exit
-        receiver.stop()
-        log("Stopped listening for X-Plane UDP broadcasts")
+        selector.close()
+
+
+def sample(receiver, batcher=None, archive=None, resampler=None, track_filter=None):
+    """Receiver has a new sample: add it to batcher and archive (or the resampler's outputs, if any,
+    and only those track_filter keeps)"""
+    if resampler is not None or track_filter is not None:
+        if resampler is not None:
+            rows = resampler.update(receiver)
+        elif receiver.record.has_xgps:
+            record = receiver.record
+            rows = [[receiver.last_receive_time] + [getattr(record, field) for field in TrackFilter.FIELDS]]
+        else:
+            return
+        if track_filter is not None:
+            rows = track_filter.filter(rows)
+        if len(rows):
+            if archive is not None:
+                archive.append_rows(np.asarray(rows))
+            if batcher is not None:
+                has_xatt = resampler is not None or receiver.record.has_xatt
+                for row in rows:
+                    batcher.add(row_position(row, has_xatt))
+        return
+    if archive is not None and receiver.record.has_xgps:
+        archive.append(receiver.last_receive_time, receiver.record)
+    if batcher is not None:
+        position = receiver.get_position()
+        if position:
+            batcher.add(position)
 
 
 if __name__ == '__main__':
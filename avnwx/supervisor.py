@@ -0,0 +1,159 @@
+"""
+Non-blocking supervisor for a plugin's child process (e.g. the tracker run by PI_AvnWx.py)
+
+Everything here runs from a flight loop, so nothing may block: ProcessSupervisor.poll()
+only asks whether the child is alive, and restarts it (after a delay) if not.
+
+    supervisor = ProcessSupervisor(stream_to_server, executable=xp.pythonExecutable, log=xp.log)
+    ... every second or so, from a flight loop:
+    supervisor.poll()
+    ... on disable:
+    supervisor.stop()
+
+Restarts back off exponentially (RESTART_DELAY, doubling to MAX_RESTART_DELAY), resetting
+once a child has run for STABLE_AFTER seconds, so a tracker that crashes at startup can't
+thrash. With prewarm, a spare process is kept started and waiting (interpreter up, target's
+module imported): a restart just tells it to go, rather than waiting for a new interpreter.
+
+A child that exits with one of NO_RESTART_EXIT_CODES (it's misconfigured, e.g. no API key:
+it says why in its own log) isn't restarted, nor is one that has exited MAX_FAILED_STARTS
+times in a row without running for STABLE_AFTER seconds.
+
+This module must not import xp: it's imported by the child processes too.
+"""
+
+import multiprocessing
+import time
+
+RESTART_DELAY = 1.0  # seconds before first restart
+MAX_RESTART_DELAY = 60.0
+STABLE_AFTER = 60.0  # seconds a child must run before the restart delay resets
+STANDBY_CHECK = 5.0  # seconds between a spare's checks that its parent is still alive
+NO_RESTART_EXIT_CODES = (78,)  # EX_CONFIG: the child can't run as configured, so restarting won't help
+MAX_FAILED_STARTS = 10  # consecutive exits before STABLE_AFTER seconds, after which the child isn't restarted
+
+
+def standby(go, target):
+    """Child process entry point: wait until go (a multiprocessing.Event) is set, then run target.
+
+    Exits without running target if the parent goes away first (e.g. X-Plane crashed).
+    """
+    parent = multiprocessing.parent_process()
+    while not go.wait(STANDBY_CHECK):
+        if parent is not None and not parent.is_alive():
+            return
+    target()
+
+
+class ProcessSupervisor:
+    """Keeps one child process running target(), restarting it with backoff when it exits"""
+
+    def __init__(self, target, executable=None, prewarm=True, log=print,
+                 restart_delay=RESTART_DELAY, max_restart_delay=MAX_RESTART_DELAY, stable_after=STABLE_AFTER,
+                 max_failed_starts=MAX_FAILED_STARTS):
+        self.target = target
+        self.executable = executable
+        if executable:
+            # Now, not at the first spawn: anything the plugin creates meanwhile that starts a
+            # helper process (e.g. shared memory's resource tracker) must not start X-Plane
+            multiprocessing.set_executable(executable)
+        self.prewarm = prewarm
+        self.log = log
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.stable_after = stable_after
+        self.max_failed_starts = max_failed_starts
+        self.delay = restart_delay
+        self.process = None
+        self.process_go = None  # must outlive the child's startup, which unpickles it
+        self.started = 0.0
+        self.spare = None
+        self.spare_go = None
+        self.restart_at = 0.0  # monotonic time to (re)start process, when it's None
+        self.starts = 0
+        self.restarts = 0
+        self.prewarmed_starts = 0
+        self.last_exitcode = None
+        self.failed_starts = 0  # consecutive exits before stable_after
+        self.given_up = None  # why the child is no longer restarted, once it isn't
+
+    @property
+    def uptime(self):
+        """Seconds the current child has been running (0 if none)"""
+        return time.monotonic() - self.started if self.process is not None else 0.0
+
+    def poll(self):
+        """Check on the child, (re)starting it when due. Never blocks. Returns True if a child is running."""
+        now = time.monotonic()
+        if self.process is not None and not self.process.is_alive():
+            self.last_exitcode = self.process.exitcode
+            ran = now - self.started
+            self.process = None
+            if ran >= self.stable_after:
+                self.delay = self.restart_delay
+                self.failed_starts = 0
+            else:
+                self.failed_starts += 1
+            if self.last_exitcode in NO_RESTART_EXIT_CODES:
+                self.given_up = f"exit code {self.last_exitcode} (configuration error)"
+            elif self.failed_starts >= self.max_failed_starts:
+                self.given_up = f"exited {self.failed_starts} times within {self.stable_after:.0f}s of starting"
+            if self.given_up is not None:
+                self.log(f"Tracker process exited with code {self.last_exitcode} after {ran:.1f}s, "
+                         f"not restarting: {self.given_up}")
+                if self.spare is not None and self.spare.is_alive():
+                    self.spare.terminate()  # stop() reaps it
+            else:
+                self.restart_at = now + self.delay
+                self.log(f"Tracker process exited with code {self.last_exitcode} after {ran:.1f}s, "
+                         f"restarting in {self.delay:.1f}s")
+                self.delay = min(self.delay * 2, self.max_restart_delay)
+        if self.given_up is not None:
+            return False
+        if self.process is None:
+            if now >= self.restart_at:
+                self._start(now)
+        elif self.prewarm and (self.spare is None or not self.spare.is_alive()):
+            # Start spare on a later poll than the child, so one call does at most one spawn
+            self.spare, self.spare_go = self._spawn()
+        return self.process is not None
+
+    def _spawn(self, go_now=False):
+        # Must point multiprocessing at python: in X-Plane sys.executable is X-Plane itself
+        if self.executable:
+            multiprocessing.set_executable(self.executable)
+        go = multiprocessing.Event()
+        if go_now:
+            go.set()
+        process = multiprocessing.Process(target=standby, args=(go, self.target), daemon=True)
+        process.start()
+        return process, go
+
+    def _start(self, now):
+        if self.spare is not None and self.spare.is_alive():
+            self.spare_go.set()
+            self.process, self.process_go = self.spare, self.spare_go
+            self.prewarmed_starts += 1
+        else:
+            self.process, self.process_go = self._spawn(go_now=True)
+        self.spare = self.spare_go = None
+        if self.starts:
+            self.restarts += 1
+        self.starts += 1
+        self.started = now
+
+    def stop(self, timeout=5.0):
+        """Terminate child (and spare): gently, then kill. Blocks up to 2 * timeout, so only call on disable/stop."""
+        for process in (self.process, self.spare):
+            if process is not None and process.is_alive():
+                process.terminate()
+                process.join(timeout=timeout)
+            if process is not None and process.is_alive():
+                process.kill()
+                process.join(timeout=timeout)
+        self.process = self.process_go = self.spare = self.spare_go = None
+
+    def stats(self):
+        return {'running': self.process is not None, 'uptime': round(self.uptime, 1), 'restarts': self.restarts,
+                'prewarmed_starts': self.prewarmed_starts, 'last_exitcode': self.last_exitcode,
+                'next_restart_delay': self.delay, 'given_up': self.given_up}
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Post-flight queries over the tracker's sample archive (see TrackArchive in aircraft_udp_tracker.py)
+
+    python track_query.py info [--archive DIR]
+    python track_query.py range --from 2026-10-17T14:00 --to 2026-10-17T15:30 [--fields lat,lon,elevation_m] [--csv out.csv]
+    python track_query.py max g_normal [--from ...] [--to ...] [--min]
+
+Times are local ISO dates/times, or seconds since the epoch. Fields are the PositionRecord
+fields (raw XGPS / XATT values: meters, m/s, degrees, radians/s, g).
+"""
+
+import argparse
+import csv
+import sys
+import time
+from datetime import datetime
+
+from aircraft_udp_tracker import TrackArchive, ARCHIVE_DIR, use_numpy
+
+
+def parse_time(text):
+    try:
+        return float(text)
+    except ValueError:
+        return datetime.fromisoformat(text).timestamp()
+
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat(sep=' ', timespec='milliseconds')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--archive', default=ARCHIVE_DIR, help='archive directory')
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('info', help='segments, sample count and time span')
+    p = sub.add_parser('range', help='samples between two times')
+    p.add_argument('--from', dest='start', type=parse_time)
+    p.add_argument('--to', dest='end', type=parse_time)
+    p.add_argument('--fields', help='comma separated (default all)')
+    p.add_argument('--csv', help='write samples to this CSV file, rather than a summary')
+    p = sub.add_parser('max', help='largest value of a field, and when')
+    p.add_argument('field')
+    p.add_argument('--from', dest='start', type=parse_time)
+    p.add_argument('--to', dest='end', type=parse_time)
+    p.add_argument('--min', action='store_true', help='smallest value instead')
+    args = parser.parse_args()
+
+    if not use_numpy:
+        sys.exit("The archive needs numpy")
+    archive = TrackArchive(args.archive, readonly=True)
+    fields = [name for name, _dtype in TrackArchive.FIELDS]
+    elapsed = time.perf_counter()
+
+    if args.command == 'info':
+        segments = archive.segments()
+        print(f"{args.archive}: {len(archive)} samples in {len(segments)} segments")
+        if segments:
+            print(f"from {format_time(segments[0][1])} to {format_time(segments[-1][2])}")
+    elif args.command == 'range':
+        wanted = args.fields.split(',') if args.fields else None
+        for field in wanted or []:
+            if field not in fields:
+                parser.error(f"unknown field {field}, choose from {', '.join(fields)}")
+        samples = archive.select(args.start, args.end, wanted)
+        elapsed = time.perf_counter() - elapsed
+        count = len(samples['timestamp'])
+        if args.csv:
+            with open(args.csv, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(samples.keys())
+                writer.writerows(zip(*(column.tolist() for column in samples.values())))
+            print(f"Wrote {count} samples to {args.csv}")
+        else:
+            print(f"{count} samples ({1000 * elapsed:.1f}ms)")
+            for field, column in samples.items():
+                if count and field != 'timestamp':
+                    print(f"  {field:>16}: min {column.min():12.6f}  max {column.max():12.6f}  mean {column.mean():12.6f}")
+    else:
+        if args.field not in fields:
+            parser.error(f"unknown field {args.field}, choose from {', '.join(fields)}")
+        best = archive.extreme(args.field, args.start, args.end, largest=not args.min)
+        elapsed = time.perf_counter() - elapsed
+        if best is None:
+            print("No samples")
+        else:
+            print(f"{'min' if args.min else 'max'} {args.field} {best[0]:.6f} at {format_time(best[1])} "
+                  f"({1000 * elapsed:.1f}ms)")
+
+
+if __name__ == '__main__':
+    main()
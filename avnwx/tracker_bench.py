@@ -0,0 +1,1066 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for aircraft_udp_tracker.py
+
+Runs the tracker receive loop in-process, replays XGPS/XATT packets to it over UDP and
+posts to a local stand-in server (no X-Plane, no maps.avnwx.com needed).
+
+    python tracker_bench.py dropped [--delay 5] [--rate 200] [--duration 15]
+    python tracker_bench.py latency [--count 200] [--gzip] [--cert cert.pem --key key.pem]
+    python tracker_bench.py parse [--count 1000000]
+    python tracker_bench.py cpu [--rate 2000] [--duration 10] [--burst 32]
+    python tracker_bench.py spool [--count 120] [--outage 40]
+    python tracker_bench.py pipeline [--capture flight.xpcap | --aircraft 20 --duration 30] [--speed 10]
+    python tracker_bench.py fanin [--sources 50] [--rate 10] [--duration 20]
+    python tracker_bench.py payload [--batch 50] [--count 2000]
+    python tracker_bench.py idle [--duration 30]
+    python tracker_bench.py archive [--hours 3] [--rate 20]
+    python tracker_bench.py livemap [--clients 500] [--rate 10] [--duration 10]
+    python tracker_bench.py resample [--duration 3600] [--jitter 0.05]
+    python tracker_bench.py filter [--duration 3600] [--rate 10] [--glitches 0.002]
+    python tracker_bench.py breaker [--outage 20] [--interval 0.2] [--timeout 2]
+    python tracker_bench.py fanout [--duration 10] [--rate 10] [--slow 0.5]
+
+'dropped' compares posting inline in the receive loop (the old behavior) with posting
+from the upload worker, and reports how many replayed packets never reached the receiver.
+
+'latency' compares a new requests.post() per upload (the old behavior) with PushClient's
+pooled keep-alive session, and reports connections opened and p50/p99 upload latency.
+Give --cert/--key (e.g. from `openssl req -x509 -newkey rsa:2048 -nodes -subj /CN=localhost
+-keyout key.pem -out cert.pem`) to run the stand-in over HTTPS, to include TLS handshakes.
+
+'parse' compares the original decode/split/dict XGPS+XATT parser with the receiver's
+bytes parser that updates a PositionRecord in place: time, and transient memory allocated
+per packet (traced with tracemalloc).
+
+'cpu' compares receive loop CPU time for parsing every packet with draining and coalescing
+packets, parsing only the newest at upload time.
+
+'spool' uploads positions while the stand-in server goes down and comes back up (twice,
+with a restart of the uploader and its spool in between), and checks every position
+reached the server. The outages are short, so the circuit breaker's open period is too
+(--breaker-delay), and each run waits for the backfill once the server's back.
+
+'pipeline' replays a capture (see udp_replay.py), or a synthetic flight, through the whole
+receive -> parse -> upload path and reports throughput, receive loop CPU, and position
+age when it reaches the server.
+
+'fanin' runs one MultiSourceTracker for N simulated X-Plane instances, each on its own port
+with its own API key, and reports receive loop CPU (one core) and uploads per source.
+
+'payload' compares request body size and encode time for JSON, gzipped JSON and the
+compact binary encoding, for single positions and batches, then checks PushClient posts
+binary to a stand-in that accepts it and falls back to JSON on one that refuses it.
+
+'idle' runs the tracker (receive loop, upload worker, log writer, metrics export) with no
+X-Plane sending, and reports receive loop wakeups, context switches (all threads) and CPU
+time per second: what the tracker costs while the sim isn't flying.
+
+'archive' appends a synthetic multi-hour flight to a TrackArchive, reporting append cost
+and size on disk, then times post-flight queries (a time range, a whole-flight maximum)
+from a freshly opened reader, and checks a writer reopened without close() resumes.
+
+'livemap' connects hundreds of local Server-Sent Events subscribers to a LiveMapServer,
+publishes positions (with traffic) to it, and reports frames delivered, publish-to-client
+latency, and the server's time per broadcast.
+
+'resample' feeds a synthetic flight, with jittered XGPS/XATT arrival times, to the
+TrackResampler (per sample, as the tracker does) and to resample_track() (one vectorized
+pass, as for a replayed recording). It compares them with pairing the latest XGPS and XATT:
+output interval spread, and how far apart in time the paired position and attitude are,
+measured as heading (XATT) minus ground track (XGPS), which agree exactly in the synthetic
+flight.
+
+'filter' runs a synthetic flight, with zero speed spikes, position jumps and a sim
+reposition injected, through a TrackFilter: what it rejects, what fraction of samples
+simplification drops, how far the clean samples are from the track drawn through the kept
+ones, and the archive and batch upload size with and without it.
+
+'breaker' uploads positions while the stand-in server answers 503, then hangs past the
+upload timeout, with and without the CircuitBreaker: requests made to the failing server,
+positions lost (dropped from the upload queue while the worker waited), and how long after
+the server recovers the spool is drained.
+
+'fanout' publishes positions through a FanOut to a slow avnwx stand-in, a mirror endpoint
+that hangs, a UDP re-broadcast and a file: how long submit() takes, and what each
+destination received, dropped, and its delivery latency.
+"""
+
+import argparse
+import gzip
+import json
+import math
+import os
+import resource
+import selectors
+import tempfile
+import socket
+import ssl
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import aircraft_udp_tracker
+from aircraft_udp_tracker import (XPlaneUDPReceiver, PositionRecord, TrackArchive, LiveMapServer, TrackResampler,
+                                  TrackFilter, CircuitBreaker, FanOut, HttpSink, UdpSink, FileSink,
+                                  resample_track, row_position, PositionUploader, PositionSpool, PushClient, MultiSourceTracker,
+                                  run_tracker, start_uploaders, stop_uploaders, encode_positions, decode_positions,
+                                  BINARY_CONTENT_TYPE, StopEvent, metrics)
+import udp_replay
+
+BENCH_PORT = 49102  # Keep clear of X-Plane's real 49002
+
+
+class StandInServer:
+    """Local stand-in for maps.avnwx.com push endpoint, answering after `delay` seconds.
+
+    Set `up` False to make it drop connections without answering, as if the server were down.
+    """
+
+    def __init__(self, delay=0.0, status=200, certfile=None, keyfile=None, binary=True):
+        self.delay = delay
+        self.status = status
+        self.binary = binary  # accept encode_positions() bodies, else answer 415
+        self.content_types = {}  # Content-Type -> requests
+        self.up = True
+        self.requests = 0
+        self.connections = 0
+        self.timestamps = set()  # of every position received (when not gzipped)
+        self.ages = []  # seconds from each position's timestamp to its arrival here
+        self.keys = {}  # api_key -> positions received
+        bench = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive
+            disable_nagle_algorithm = True  # else keep-alive replies wait on delayed ACK
+
+            def setup(self):
+                bench.connections += 1
+                super().setup()
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if not bench.up:
+                    self.close_connection = True
+                    return
+                bench.requests += 1
+                content_type = self.headers.get('Content-Type')
+                bench.content_types[content_type] = bench.content_types.get(content_type, 0) + 1
+                status = bench.status
+                if content_type == BINARY_CONTENT_TYPE and not bench.binary:
+                    status = 415
+                elif status == 200 and not self.headers.get('Content-Encoding'):
+                    if content_type == BINARY_CONTENT_TYPE:
+                        api_key, positions = decode_positions(body)
+                    else:
+                        payload = json.loads(body)
+                        api_key = payload['api_key']
+                        positions = payload.get('positions', [payload.get('position')])
+                    now = time.time()
+                    bench.keys[api_key] = bench.keys.get(api_key, 0) + 1
+                    for position in positions:
+                        bench.timestamps.add(position['timestamp'])
+                        bench.ages.append(now - position['timestamp'])
+                time.sleep(bench.delay)
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Length', '2')
+                    self.end_headers()
+                    self.wfile.write(b'{}')
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True  # client gave up waiting
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        scheme = 'http'
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True)
+            scheme = 'https'
+        self.url = f"{scheme}://127.0.0.1:{self.httpd.server_address[1]}/api/aircraft/push"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def synthetic_packets(count, lat=47.45, lon=-122.31):
+    """Generate alternating XGPS/XATT datagrams for an aircraft flying a slow circle"""
+    packets = []
+    for i in range(count // 2):
+        angle = i / 500.0
+        heading = math.degrees(angle) % 360
+        packets.append(b'XGPS\x00\x00' + (f"{lon + 0.05 * math.cos(angle):.6f},{lat + 0.05 * math.sin(angle):.6f},"
+                                          f"{1500 + 10 * math.sin(angle):.1f},{heading:.1f},61.7").encode())
+        packets.append(b'XATT\x00\x00' + (f"{heading:.1f},2.5,-15.0,0.01,0.02,0.03,"
+                                          f"40.1,1.5,-45.2,0.01,1.03,0.02").encode())
+    return packets
+
+
+def replay(packets, port, rate, burst=1):
+    """Send packets to localhost:port at `rate` packets per second, `burst` packets at a time"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    start = time.perf_counter()
+    for i, packet in enumerate(packets):
+        if i % burst == 0:
+            wait = start + i / rate - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+        sock.sendto(packet, ('127.0.0.1', port))
+    sock.close()
+
+
+class InlineUploader(PositionUploader):
+    """Old behavior: post from inside the receive loop"""
+
+    def start(self):
+        pass
+
+    def stop(self, timeout=5.0):
+        pass
+
+    def submit(self, position, traffic=None, received_at=None, api_key=None):
+        self.upload(position, traffic, received_at, api_key)
+
+
+def run_pipeline(uploader_class, packets, args, delay=0.0, **run_kwargs):
+    """Replay packets through receiver -> run_tracker() -> uploader -> stand-in server.
+
+    Returns (packets received, server posts, CPU seconds used by the receive loop).
+    """
+    with StandInServer(delay=delay) as server:
+        receiver = XPlaneUDPReceiver()
+        receiver.start(port=args.port)
+        if getattr(args, 'rcvbuf', 0):
+            receiver.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, args.rcvbuf)
+        uploader = uploader_class(server.url, 'BENCH')
+        uploader.start()
+        stop = StopEvent()
+        sender = threading.Thread(target=replay, args=(packets, args.port, args.rate, getattr(args, 'burst', 1)),
+                                  daemon=True)
+        cpu = time.thread_time()
+        sender.start()
+        threading.Thread(target=lambda: (sender.join(), time.sleep(1.0), stop.set()), daemon=True).start()
+        try:
+            run_tracker(receiver, uploader, stop, **run_kwargs)
+        finally:
+            cpu = time.thread_time() - cpu
+            receiver.stop()
+            uploader.stop(timeout=0)
+        return receiver.packet_count, server.requests, cpu
+
+
+def bench_dropped(args):
+    packets = synthetic_packets(int(args.rate * args.duration))
+    print(f"Replaying {len(packets)} packets at {args.rate}/s, server delay {args.delay}s")
+    for name, uploader_class in (('inline', InlineUploader), ('worker', PositionUploader)):
+        received, posts, _cpu = run_pipeline(uploader_class, packets, args, delay=args.delay)
+        dropped = len(packets) - received
+        print(f"{name:>8}: received {received:6d}  dropped {dropped:6d} ({100.0 * dropped / len(packets):5.1f}%)"
+              f"  posts {posts}")
+
+
+def bench_cpu(args):
+    packets = synthetic_packets(int(args.rate * args.duration))
+    print(f"Replaying {len(packets)} packets at {args.rate}/s, in bursts of {args.burst}")
+    for name, coalesce in (('per-packet', False), ('coalesce', True)):
+        received, posts, cpu = run_pipeline(PositionUploader, packets, args, coalesce=coalesce)
+        print(f"{name:>10}: received {received:6d}  posts {posts:3d}  CPU {cpu:6.3f}s"
+              f"  ({1e6 * cpu / max(1, received):.1f}us/packet)")
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return [1000 * latencies[min(len(latencies) - 1, int(pct * len(latencies)))] for pct in (0.5, 0.99)]
+
+
+def bench_latency(args):
+    position = {'lat': 47.45, 'lon': -122.31, 'altitude': 1500.0, 'heading': 270.0, 'speed': 120.0,
+                'pitch': 2.5, 'roll': -15.0, 'vertical_speed': 300.0, 'timestamp': time.time()}
+    with StandInServer(certfile=args.cert, keyfile=args.key) as server:
+        latencies = []
+        for _ in range(args.count):
+            start = time.perf_counter()
+            requests.post(server.url, json={'api_key': 'BENCH', 'position': position}, timeout=5, verify=False)
+            latencies.append(time.perf_counter() - start)
+        p50, p99 = percentiles(latencies)
+        print(f"requests.post: {args.count} posts, {server.connections} connections, p50 {p50:.2f}ms, p99 {p99:.2f}ms")
+
+    with StandInServer(certfile=args.cert, keyfile=args.key) as server:
+        client = PushClient(server.url, 'BENCH', gzip_body=args.gzip, verify=False)
+        for _ in range(args.count):
+            client.push(position)
+        stats = client.stats()
+        client.close()
+        print(f"   PushClient: {stats['requests']} posts, {server.connections} connections "
+              f"({stats['reused']} reused), p50 {stats['p50_ms']:.2f}ms, p99 {stats['p99_ms']:.2f}ms")
+
+
+class LegacyParser:
+    """The original XGPS/XATT parser: decode, split, and new dicts on every packet"""
+
+    def __init__(self):
+        self.position_data = {}
+        self.xgps_data = {}
+        self.xatt_data = {}
+
+    def parse_xgps(self, data):
+        values = data.decode('utf-8', errors='ignore').strip('\x00').split(',')
+        if len(values) >= 5:
+            self.xgps_data = {
+                'lon': float(values[0]),
+                'lat': float(values[1]),
+                'elevation_m': float(values[2]),
+                'horizontal_path': float(values[3]),
+                'true_speed_ms': float(values[4])
+            }
+            self._update_position_data()
+            return True
+        return False
+
+    def parse_xatt(self, data):
+        values = data.decode('utf-8', errors='ignore').strip('\x00').split(',')
+        if len(values) >= 12:
+            self.xatt_data = {
+                'heading': float(values[0]),
+                'pitch': float(values[1]),
+                'roll': float(values[2]),
+                'p_rad': float(values[3]),
+                'q_rad': float(values[4]),
+                'r_rad': float(values[5]),
+                'speed_e_ms': float(values[6]),
+                'speed_u_ms': float(values[7]),
+                'speed_s_ms': float(values[8]),
+                'g_side': float(values[9]),
+                'g_normal': float(values[10]),
+                'g_axial': float(values[11])
+            }
+            self._update_position_data()
+            return True
+        return False
+
+    def _update_position_data(self):
+        if not self.xgps_data:
+            return
+        ground_speed_kts = self.xgps_data['true_speed_ms'] * 1.94384
+        self.position_data = {
+            'lat': round(self.xgps_data['lat'], 6),
+            'lon': round(self.xgps_data['lon'], 6),
+            'altitude': round(self.xgps_data['elevation_m'] * 3.28084, 0),
+            'heading': round(self.xgps_data['horizontal_path'], 1),
+            'speed': round(ground_speed_kts, 1),
+        }
+        if self.xatt_data:
+            self.position_data['pitch'] = round(self.xatt_data['pitch'], 1)
+            self.position_data['roll'] = round(self.xatt_data['roll'], 1)
+            self.position_data['vertical_speed'] = round(self.xatt_data['speed_u_ms'] * 196.85, 0)
+
+
+def run_parse(parser, payloads):
+    """Feed (is_xgps, payload) pairs to parser. Returns (seconds, transient bytes per packet)"""
+    parse_xgps, parse_xatt = parser.parse_xgps, parser.parse_xatt
+    start = time.perf_counter()
+    for is_xgps, payload in payloads:
+        if is_xgps:
+            parse_xgps(payload)
+        else:
+            parse_xatt(payload)
+    elapsed = time.perf_counter() - start
+
+    # Separate traced pass (tracemalloc slows everything down, so it isn't timed): measure the
+    # transient memory each packet allocates, as the traced peak above the pre-parse level.
+    sample = payloads[:100000]
+    tracemalloc.start()
+    transient = 0
+    for is_xgps, payload in sample:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        if is_xgps:
+            parse_xgps(payload)
+        else:
+            parse_xatt(payload)
+        transient += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return elapsed, transient / len(sample)
+
+
+def bench_parse(args):
+    packets = synthetic_packets(2000)
+    payloads = [(packet[:4] == b'XGPS', packet[6:]) for packet in packets]
+    payloads = (payloads * (args.count // len(payloads) + 1))[:args.count]
+    print(f"Parsing {len(payloads)} packets")
+    receiver = XPlaneUDPReceiver()
+    for name, parser in (('legacy', LegacyParser()), ('record', receiver)):
+        elapsed, transient = run_parse(parser, payloads)
+        print(f"{name:>8}: {elapsed:6.2f}s  {1e9 * elapsed / len(payloads):6.0f}ns/packet  "
+              f"{transient:6.0f} bytes allocated/packet")
+    # The parse loop calls the parsers directly; handle() also stamps the receive time get_position() checks
+    for packet in packets[-2:]:
+        receiver.handle(packet)
+    elapsed = time.perf_counter()
+    position = receiver.get_position()
+    elapsed = time.perf_counter() - elapsed
+    print(f"  get_position() once per upload, after handle(): {'valid' if position else 'NONE'}, "
+          f"{1e6 * elapsed:.1f}us")
+
+
+def bench_spool(args):
+    path = os.path.join(tempfile.mkdtemp(), 'trackerSpool.bin')
+    sent = []
+    with StandInServer() as server:
+        def run_uploader(count, down_from, down_to):
+            spool = PositionSpool(path, capacity=args.capacity)
+            # Outages here last well under a second: scale the circuit breaker's open period to match
+            breaker = CircuitBreaker(base_delay=args.breaker_delay, max_delay=4 * args.breaker_delay)
+            client = PushClient(server.url, 'BENCH', breaker=breaker)
+            uploader = PositionUploader(server.url, 'BENCH', queue_size=count, client=client, spool=spool)
+            uploader.start()
+            for i in range(count):
+                server.up = not down_from <= i < down_to
+                position = {'lat': 47.45, 'lon': -122.31 + i * 1e-4, 'altitude': 1500.0, 'heading': 270.0,
+                            'speed': 120.0, 'timestamp': time.time() + len(sent)}
+                sent.append(position['timestamp'])
+                uploader.submit(position)
+                time.sleep(args.interval)
+            time.sleep(0.5)
+            # Once the server's back, give the breaker's probe and the backfill time to finish
+            deadline = time.monotonic() + 5.0
+            while server.up and len(spool) and time.monotonic() < deadline:
+                time.sleep(0.05)
+            waiting = len(spool)
+            uploader.stop()
+            return waiting
+
+        # First run ends with server down, so the spool is carried over a restart
+        half = args.count // 2
+        waiting = run_uploader(half, half - args.outage // 2, half)
+        print(f"run 1: {half} positions, server down for last {args.outage // 2}, {waiting} left in spool")
+        waiting = run_uploader(half, 0, args.outage // 2)
+        print(f"run 2: {half} positions, server down for first {args.outage // 2}, {waiting} left in spool")
+    missing = len(set(sent) - server.timestamps)
+    print(f"sent {len(sent)}, server received {len(server.timestamps)} unique, missing {missing}"
+          f" ({server.requests} requests)")
+    print(f"spool file {os.path.getsize(path)} bytes for capacity {args.capacity}")
+
+
+def bench_pipeline(args):
+    if args.capture:
+        records = udp_replay.read_capture(args.capture)
+    else:
+        records = udp_replay.synthesize(args.aircraft, args.duration, args.rate)
+    with StandInServer() as server:
+        receiver = XPlaneUDPReceiver()
+        receiver.track_traffic = True
+        receiver.start(port=args.port)
+        uploader = PositionUploader(server.url, 'BENCH')
+        uploader.start()
+        stop = StopEvent()
+        result = {}
+
+        def send():
+            result['sent'], result['elapsed'] = udp_replay.replay(records, port=args.port, speed=args.speed)
+            time.sleep(1.0)
+            stop.set()
+
+        sender = threading.Thread(target=send, daemon=True)
+        cpu = time.thread_time()
+        sender.start()
+        try:
+            run_tracker(receiver, uploader, stop)
+        finally:
+            cpu = time.thread_time() - cpu
+            traffic = len(receiver.traffic)
+            receiver.stop()
+            uploader.stop()
+    sent, elapsed = result['sent'], result['elapsed']
+    print(f"sent {sent} datagrams in {elapsed:.1f}s ({sent / elapsed:.0f}/s), received {receiver.packet_count}")
+    print(f"receive loop CPU {cpu:.3f}s ({1e6 * cpu / max(1, receiver.packet_count):.1f}us/datagram), "
+          f"traffic table {traffic} aircraft")
+    if server.ages:
+        p50, p99 = percentiles(server.ages)
+        print(f"server received {len(server.ages)} positions, age on arrival p50 {p50:.1f}ms, p99 {p99:.1f}ms")
+
+
+def bench_fanin(args):
+    ports = [args.port + i for i in range(args.sources)]
+    records = udp_replay.synthesize(1, args.duration, args.rate)
+    with StandInServer() as server:
+        tracker = MultiSourceTracker([(port, None, f'KEY{port}') for port in ports])
+        uploaders = start_uploaders(server.url, None, args.workers, queue_size=2 * args.sources)
+        stop = StopEvent()
+
+        def send():
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            start = time.perf_counter()
+            for offset, data in records:
+                wait = start + offset - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+                for port in ports:
+                    sock.sendto(data, ('127.0.0.1', port))
+            time.sleep(1.5)
+            stop.set()
+
+        sender = threading.Thread(target=send, daemon=True)
+        cpu = time.thread_time()
+        wall = time.perf_counter()
+        sender.start()
+        try:
+            tracker.run(uploaders[0], stop)
+        finally:
+            cpu = time.thread_time() - cpu
+            wall = time.perf_counter() - wall
+            received = sum(receiver.packet_count for receiver in tracker.receivers)
+            tracker.stop()
+            stop_uploaders(uploaders)
+    sent = len(records) * len(ports)
+    print(f"{args.sources} sources: sent {sent} datagrams, received {received}, "
+          f"unknown {tracker.unknown}")
+    print(f"receive loop CPU {cpu:.2f}s over {wall:.1f}s ({100 * cpu / wall:.1f}% of one core, "
+          f"{1e6 * cpu / max(1, received):.1f}us/datagram)")
+    counts = [server.keys.get(f'KEY{port}', 0) for port in ports]
+    print(f"uploads per source: min {min(counts)}, max {max(counts)}, total {server.requests}")
+
+
+def bench_payload(args):
+    receiver = XPlaneUDPReceiver()
+    positions = []
+    start = time.time()
+    for offset, data in udp_replay.synthesize(1, args.count / 10.0, 10.0):
+        receiver.handle(data)
+        if data[:4] == b'XATT':
+            position = receiver.get_position()
+            position['timestamp'] = start + offset
+            positions.append(position)
+    api_key = 'ABCD1234EFGH5678'
+
+    def as_json(chunk):
+        payload = {'api_key': api_key, 'positions': chunk} if len(chunk) > 1 else \
+            {'api_key': api_key, 'position': chunk[0]}
+        return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+    encoders = (('json', as_json),
+                ('json+gzip', lambda chunk: gzip.compress(as_json(chunk), compresslevel=6)),
+                ('binary', lambda chunk: encode_positions(api_key, chunk)))
+    for batch in (1, args.batch):
+        chunks = [positions[i:i + batch] for i in range(0, len(positions) - batch + 1, batch)]
+        print(f"{len(chunks)} bodies of {batch} position(s):")
+        for name, encode in encoders:
+            elapsed = time.perf_counter()
+            sizes = [len(encode(chunk)) for chunk in chunks]
+            elapsed = time.perf_counter() - elapsed
+            print(f"{name:>10}: {sum(sizes) / len(sizes):8.0f} bytes/body  {sum(sizes) / len(positions):6.1f} bytes/position"
+                  f"  {1e6 * elapsed / len(chunks):7.1f}us encode/body")
+    _key, decoded = decode_positions(encode_positions(api_key, positions))
+    error = max(abs(decoded[i][field] - positions[i][field]) for i in range(len(positions)) for field in positions[i])
+    print(f"binary round trip, max error {error:.2g}")
+
+    for accepts in (True, False):
+        with StandInServer(binary=accepts) as server:
+            client = PushClient(server.url, api_key, encoding='binary')
+            ok = sum(client.push(position).status_code == 200 for position in positions[:20])
+            ok += client.push_batch(positions[20:70]).status_code == 200
+            client.close()
+        print(f"server {'accepts' if accepts else 'refuses'} binary: {ok}/21 uploads ok, "
+              f"{len(server.timestamps)} positions received, by content type {server.content_types}")
+
+
+def bench_idle(args):
+    receiver = XPlaneUDPReceiver()
+    receiver.start(port=args.port)
+    uploader = PositionUploader('http://127.0.0.1:9/api/aircraft/push', 'BENCH')  # never called
+    uploader.start()
+    stop = StopEvent()
+    loop = threading.Thread(target=run_tracker, args=(receiver, uploader, stop))
+    loop.start()
+    time.sleep(1.0)  # let everything settle
+    wakeups = metrics.counters.get(('loop_wakeups_total', None), 0)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = time.process_time()
+    time.sleep(args.duration)
+    cpu = time.process_time() - cpu
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    wakeups = metrics.counters.get(('loop_wakeups_total', None), 0) - wakeups
+    stop.set()
+    loop.join()
+    receiver.stop()
+    uploader.stop()
+    switches = after.ru_nvcsw + after.ru_nivcsw - usage.ru_nvcsw - usage.ru_nivcsw
+    print(f"idle {args.duration:.0f}s: receive loop {wakeups / args.duration:.2f} wakeups/s, "
+          f"process {switches / args.duration:.2f} context switches/s, CPU {1000 * cpu / args.duration:.3f}ms/s")
+
+
+def bench_archive(args):
+    path = tempfile.mkdtemp()
+    count = int(args.hours * 3600 * args.rate)
+    start = time.time() - args.hours * 3600
+    record = PositionRecord()
+    record.has_xgps = record.has_xatt = True
+    archive = TrackArchive(path)
+    elapsed = time.perf_counter()
+    for i in range(count):
+        t = i / args.rate
+        record.lat = 47.45 + 0.05 * math.cos(t / 600)
+        record.lon = -122.31 + 0.05 * math.sin(t / 600)
+        record.elevation_m = 1500.0 + 100.0 * math.sin(t / 60)
+        record.g_normal = 1.0 + 0.5 * math.sin(t / 7) * math.sin(t / 1300)
+        archive.append(start + t, record)
+    elapsed = time.perf_counter() - elapsed
+    size = sum(os.path.getsize(os.path.join(directory, name))
+               for directory, _dirs, names in os.walk(path) for name in names)
+    print(f"appended {count} samples ({args.hours}h at {args.rate}Hz) in {elapsed:.1f}s, "
+          f"{1e6 * elapsed / count:.1f}us/sample, {size / 2 ** 20:.1f}MB in {len(archive.segments())} segments")
+
+    # Not closed: a new writer must find where the old one stopped, from the files alone
+    archive.flush()
+    reopened = TrackArchive(path)
+    print(f"reopened writer resumes at sample {len(reopened)} of {count}")
+
+    reader = TrackArchive(path, readonly=True)
+    middle = start + args.hours * 1800
+    for name, query in (('10 minute range, lat/lon/elevation',
+                         lambda: len(reader.select(middle, middle + 600, ['lat', 'lon', 'elevation_m'])['timestamp'])),
+                        ('whole flight, all fields', lambda: len(reader.select()['timestamp'])),
+                        ('max g_normal, whole flight', lambda: reader.extreme('g_normal'))):
+        elapsed = time.perf_counter()
+        result = query()
+        print(f"{name:>36}: {1000 * (time.perf_counter() - elapsed):7.1f}ms  -> {result}")
+
+
+class TimedLiveMapServer(LiveMapServer):
+    """LiveMapServer recording how long each broadcast takes"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.broadcast_times = []
+
+    def _broadcast(self, frame):
+        start = time.perf_counter()
+        super()._broadcast(frame)
+        self.broadcast_times.append(time.perf_counter() - start)
+
+
+def bench_livemap(args):
+    server = TimedLiveMapServer(host='127.0.0.1', port=0)
+    server.start()
+    server.ready.wait()
+    url_request = b'GET /events HTTP/1.1\r\nHost: localhost\r\n\r\n'
+    clients = {}  # socket -> [buffer, frames received]
+    elapsed = time.perf_counter()
+    for _ in range(args.clients):
+        sock = socket.create_connection(('127.0.0.1', server.port))
+        sock.sendall(url_request)
+        sock.setblocking(False)
+        clients[sock] = [b'', 0]
+    while len(server.subscribers) < args.clients and time.perf_counter() - elapsed < 10:
+        time.sleep(0.01)
+    print(f"{len(server.subscribers)} subscribers connected in {time.perf_counter() - elapsed:.2f}s")
+
+    latencies = []
+    done = threading.Event()
+
+    def receive():
+        selector = selectors.DefaultSelector()
+        for sock in clients:
+            selector.register(sock, selectors.EVENT_READ)
+        while not done.is_set():
+            for key, _events in selector.select(0.1):
+                state = clients[key.fileobj]
+                try:
+                    state[0] += key.fileobj.recv(65536)
+                except BlockingIOError:
+                    continue
+                *frames, state[0] = state[0].split(b'\n\n')
+                now = time.time()
+                for frame in frames:
+                    if frame.startswith(b'data: {"position"'):
+                        state[1] += 1
+                        latencies.append(now - json.loads(frame[6:])['position']['timestamp'])
+        selector.close()
+
+    receiver_thread = threading.Thread(target=receive)
+    receiver_thread.start()
+    traffic = {'id': list(range(1, 21)), 'lat': [47.5] * 20, 'lon': [-122.3] * 20, 'altitude': [5000.0] * 20,
+               'vertical_speed': [0.0] * 20, 'heading': [90.0] * 20, 'speed': [120.0] * 20,
+               'airborne': [1] * 20, 'callsign': [f'N{n:04d}' for n in range(1, 21)]}
+    updates = int(args.duration * args.rate)
+    start = time.perf_counter()
+    for i in range(updates):
+        wait = start + i / args.rate - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        server.publish({'lat': 47.45, 'lon': -122.31 + i * 1e-5, 'altitude': 1500.0, 'heading': 90.0,
+                        'speed': 120.0, 'timestamp': time.time()}, traffic)
+    time.sleep(1.0)
+    done.set()
+    receiver_thread.join()
+    server.stop()
+    for sock in clients:
+        sock.close()
+
+    received = sum(state[1] for state in clients.values())
+    times = sorted(server.broadcast_times)
+    print(f"{updates} updates ({len(server.latest) + 8} byte frames) to {args.clients} subscribers: "
+          f"{received} of {updates * args.clients} frames delivered, {server.slow_disconnects} slow disconnects")
+    p50, p99 = percentiles(latencies)
+    print(f"publish to client latency p50 {p50:.1f}ms, p99 {p99:.1f}ms")
+    print(f"broadcast p50 {1e3 * times[len(times) // 2]:.2f}ms, max {1e3 * times[-1]:.2f}ms "
+          f"({1e6 * times[len(times) // 2] / args.clients:.1f}us per subscriber)")
+
+
+def bench_resample(args):
+    import numpy as np  # pylint: disable=import-outside-toplevel
+    rng = np.random.default_rng(1)
+    records = udp_replay.synthesize(1, args.duration, args.rate)
+    arrivals = np.array([offset for offset, _data in records]) + rng.uniform(0, args.jitter, len(records))
+    order = np.argsort(arrivals, kind='stable')
+    start = time.time() - args.duration
+    receiver = XPlaneUDPReceiver()
+    gps, att, paired = [], [], []
+    heading = PositionRecord.XATT_FIELDS.index('heading')
+    path = PositionRecord.XGPS_FIELDS.index('horizontal_path')
+
+    def mismatch(headings, paths):
+        error = np.abs((np.asarray(headings) - np.asarray(paths) + 180.0) % 360.0 - 180.0)
+        return f"heading-track mismatch mean {error.mean():.4f} max {error.max():.4f} deg"
+
+    def spread(times):
+        intervals = np.diff(times)
+        return f"interval {1000 * intervals.mean():.1f}ms +/- {1000 * intervals.std():.1f}ms"
+
+    resamplers = {'resampled': TrackResampler(smoothing=False), 'resampled+smoothed': TrackResampler()}
+    outputs = {name: [] for name in resamplers}
+    update_time = 0.0
+    for i in order:
+        data = records[i][1]
+        receiver.handle(data)
+        arrival = start + arrivals[i]
+        record = receiver.record
+        if data[:4] == b'XGPS':
+            receiver.xgps_time = arrival
+            gps.append([arrival] + [getattr(record, field) for field in PositionRecord.XGPS_FIELDS])
+        else:
+            receiver.xatt_time = arrival
+            att.append([arrival] + [getattr(record, field) for field in PositionRecord.XATT_FIELDS])
+        if record.has_xgps and record.has_xatt:
+            paired.append((arrival, record.heading, record.horizontal_path))
+        for name, resampler in resamplers.items():
+            elapsed = time.perf_counter()
+            rows = resampler.update(receiver)
+            update_time += time.perf_counter() - elapsed
+            outputs[name].extend(rows)
+    paired = np.array(paired)
+    print(f"{len(records)} samples over {args.duration:.0f}s, arrival jitter up to {1000 * args.jitter:.0f}ms")
+    print(f"{'latest pair':>20}: {len(paired):6d} outputs, {spread(paired[:, 0])}, {mismatch(paired[:, 1], paired[:, 2])}")
+    for name, rows in outputs.items():
+        rows = np.array(rows)
+        print(f"{name:>20}: {len(rows):6d} outputs, {spread(rows[:, 0])}, "
+              f"{mismatch(rows[:, 1 + len(PositionRecord.XGPS_FIELDS) + heading], rows[:, 1 + path])}")
+    print(f"streaming: {1e6 * update_time / (2 * len(records)):.1f}us per sample")
+
+    gps, att = np.array(gps), np.array(att)
+    elapsed = time.perf_counter()
+    rows = resample_track(gps, att, smoothing=False)
+    elapsed = time.perf_counter() - elapsed
+    streamed = np.array(outputs['resampled'])
+    same = len(rows) == len(streamed) and np.allclose(rows[:, 1:], streamed[:, 1:], atol=1e-6)
+    print(f"batch resample_track(): {len(rows)} outputs in {1000 * elapsed:.1f}ms "
+          f"({1e6 * elapsed / len(rows):.2f}us/output), matches streaming: {same}")
+
+
+def synthetic_flight(duration, rate, start, noise=0.5, rng=None):
+    """Rows (TrackArchive.FIELDS order) of a flight of 2 minute straight legs joined by rate one
+    turns, climbing for the first 10 minutes, with `noise` meters of position jitter"""
+    import numpy as np  # pylint: disable=import-outside-toplevel
+    rng = rng or np.random.default_rng(1)
+    count = int(duration * rate)
+    t = np.arange(count) / rate
+    turn_rate = np.where(t % 150.0 >= 120.0, 3.0, 0.0)  # deg/s
+    heading = np.cumsum(turn_rate) / rate % 360.0
+    speed = 70.0
+    east = np.cumsum(speed * np.sin(np.radians(heading))) / rate + rng.normal(0, noise, count)
+    north = np.cumsum(speed * np.cos(np.radians(heading))) / rate + rng.normal(0, noise, count)
+    climb = np.where(t < 600.0, 5.0, 0.0)
+    elevation = 300.0 + np.cumsum(climb) / rate + rng.normal(0, noise / 2, count)
+    rows = np.zeros((count, len(TrackArchive.FIELDS)))
+    fields = [name for name, _dtype in TrackArchive.FIELDS]
+    rows[:, 0] = start + t
+    rows[:, fields.index('lat')] = 47.45 + np.degrees(north / 6371000.0)
+    rows[:, fields.index('lon')] = -122.31 + np.degrees(east / (6371000.0 * math.cos(math.radians(47.45))))
+    rows[:, fields.index('elevation_m')] = elevation
+    rows[:, fields.index('horizontal_path')] = heading
+    rows[:, fields.index('true_speed_ms')] = speed
+    rows[:, fields.index('heading')] = heading
+    rows[:, fields.index('speed_u_ms')] = climb
+    rows[:, fields.index('g_normal')] = 1.0
+    return rows
+
+
+def bench_filter(args):
+    import numpy as np  # pylint: disable=import-outside-toplevel
+    rng = np.random.default_rng(2)
+    fields = [name for name, _dtype in TrackArchive.FIELDS]
+    lat, lon, elevation, speed = (fields.index(name) for name in ('lat', 'lon', 'elevation_m', 'true_speed_ms'))
+    rows = synthetic_flight(args.duration, args.rate, time.time() - args.duration, rng=rng)
+    count = len(rows)
+
+    # Glitches: single-sample zero speed spikes and position jumps, and a reposition half way
+    spikes = rng.choice(np.arange(10, count // 2 - 10), int(args.glitches * count), replace=False)
+    jumps = rng.choice(np.arange(count // 2 + 10, count - 10), int(args.glitches * count / 2), replace=False)
+    clean = rows.copy()
+    rows[spikes, speed] = 0.0
+    rows[jumps, lat] += 0.3
+    for track in (rows, clean):
+        track[count // 2:, lat] += 1.0
+        track[count // 2:, lon] += 1.0
+    glitches = set(spikes.tolist()) | set(jumps.tolist())
+
+    track_filter = TrackFilter()
+    kept = []
+    elapsed = time.perf_counter()
+    for row in rows:
+        kept.extend(track_filter.filter([row.tolist()]))
+    kept.extend(track_filter.flush())
+    elapsed = time.perf_counter() - elapsed
+    kept = np.array(kept)
+    stats = track_filter.stats()
+    print(f"{count} samples ({args.duration:.0f}s at {args.rate:.0f}Hz), {len(glitches)} glitches injected, "
+          f"one reposition: {1e6 * elapsed / count:.1f}us/sample")
+    leaked = len(set(kept[:, 0].tolist()) & set(rows[sorted(glitches), 0].tolist()))
+    print(f"rejected {stats['rejected']}, repositions {stats['repositions']}, glitches kept {leaked}")
+    print(f"kept {stats['kept']} of {stats['accepted']} accepted samples ({100 * stats['reduction']:.1f}% dropped)")
+
+    # How far is each clean sample from the track drawn through the kept ones
+    segment = np.clip(np.searchsorted(kept[:, 0], clean[:, 0], side='right') - 1, 0, len(kept) - 2)
+    a, b = kept[segment], kept[segment + 1]
+    scale = np.array([6371000.0 * np.cos(np.radians(a[:, lat])), np.full(count, 6371000.0)])
+    ab = np.radians(np.array([b[:, lon] - a[:, lon], b[:, lat] - a[:, lat]])) * scale
+    ap = np.radians(np.array([clean[:, lon] - a[:, lon], clean[:, lat] - a[:, lat]])) * scale
+    length = np.maximum((ab * ab).sum(axis=0), 1e-9)
+    along = np.clip((ab * ap).sum(axis=0) / length, 0.0, 1.0)
+    horizontal = np.hypot(*(ap - along * ab))
+    fraction = np.clip((clean[:, 0] - a[:, 0]) / np.maximum(b[:, 0] - a[:, 0], 1e-9), 0.0, 1.0)
+    vertical = np.abs(clean[:, elevation] - (a[:, elevation] + fraction * (b[:, elevation] - a[:, elevation])))
+    seen = np.sqrt(length) < 10000.0  # not the segment across the reposition
+    seen[sorted(glitches)] = False  # clean versions of glitches weren't filtered
+    print(f"clean samples from drawn track: horizontal max {horizontal[seen].max():.2f}m "
+          f"(tolerance {track_filter.tolerance}m), vertical max {vertical[seen].max():.2f}m "
+          f"(tolerance {track_filter.alt_tolerance}m)")
+
+    row_bytes = sum(np.dtype(dtype).itemsize for _name, dtype in TrackArchive.FIELDS)
+    window = int(10 * args.rate)
+    for name, track in (('unfiltered', rows), ('filtered', kept)):
+        batches = [track[(track[:, 0] >= t) & (track[:, 0] < t + 10)] for t in rows[::window, 0]]
+        upload = sum(len(encode_positions('ABCD1234EFGH5678', [row_position(row) for row in batch]))
+                     for batch in batches if len(batch))
+        print(f"{name:>11}: archive {len(track) * row_bytes / 2 ** 20:6.2f}MB, "
+              f"10s binary batch uploads {upload / 2 ** 10:7.1f}KB")
+
+
+def bench_breaker(args):
+    phases = (('up', 5.0, 200, 0.0), ('5xx', args.outage, 503, 0.0), ('up', 10.0, 200, 0.0),
+              ('hang', args.outage, 200, 3 * args.timeout), ('up', 10.0, 200, 0.0))
+    for name, breaker in (('no breaker', CircuitBreaker(failures=math.inf)), ('circuit breaker', CircuitBreaker())):
+        spool = PositionSpool(os.path.join(tempfile.mkdtemp(), 'trackerSpool.bin'), capacity=100000)
+        sent = []
+        outages = []
+        with StandInServer() as server:
+            client = PushClient(server.url, 'BENCH', timeout=args.timeout, breaker=breaker)
+            uploader = PositionUploader(server.url, 'BENCH', client=client, spool=spool)
+            uploader.start()
+            for phase, seconds, status, delay in phases:
+                server.status, server.delay = status, delay
+                requests_before = server.requests
+                start = time.monotonic()
+                drained = None
+                while time.monotonic() - start < seconds:
+                    position = {'lat': 47.45, 'lon': -122.31, 'altitude': 1500.0, 'heading': 270.0,
+                                'speed': 120.0, 'timestamp': time.time()}
+                    sent.append(position['timestamp'])
+                    uploader.submit(position)
+                    time.sleep(args.interval)
+                    if drained is None and not len(spool):
+                        drained = time.monotonic() - start
+                if phase != 'up':
+                    outages.append(f"{phase}: {server.requests - requests_before} requests to failing server")
+                elif outages:
+                    outages[-1] += f", spool drained {drained:.1f}s after" if drained is not None else ", not drained"
+            uploader.stop()
+        lost = len(set(sent) - server.timestamps)
+        print(f"{name}: {lost} of {len(sent)} positions lost ({uploader.queue.dropped} dropped from queue), "
+              f"circuit {breaker.stats()}")
+        for outage in outages:
+            print(f"  {outage}")
+
+
+def bench_fanout(args):
+    path = os.path.join(tempfile.mkdtemp(), 'positions.jsonl')
+    listener = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    listener.bind(('127.0.0.1', 0))
+    listener.settimeout(0.5)
+    datagrams = []
+
+    def listen():
+        while True:
+            try:
+                datagrams.append(listener.recv(65536))
+            except socket.timeout:
+                return
+
+    with StandInServer(delay=args.slow) as avnwx, StandInServer(delay=10 * args.timeout) as mirror:
+        uploader = PositionUploader(avnwx.url, 'BENCH', queue_size=1)
+        sinks = [HttpSink(mirror.url, 'MIRROR', name='mirror', timeout=args.timeout),
+                 UdpSink(listener.getsockname(), name='rebroadcast'), FileSink(path)]
+        output = FanOut(uploader, sinks)
+        output.start()
+        threading.Thread(target=listen, daemon=True).start()
+        count = int(args.duration * args.rate)
+        submit_times = []
+        for i in range(count):
+            position = {'lat': 47.45, 'lon': -122.31 + i * 1e-5, 'altitude': 1500.0, 'heading': 270.0,
+                        'speed': 120.0, 'timestamp': time.time()}
+            elapsed = time.perf_counter()
+            output.submit(position)
+            submit_times.append(time.perf_counter() - elapsed)
+            time.sleep(1.0 / args.rate)
+        time.sleep(1.0)
+        output.stop(timeout=1.0)
+    with open(path, encoding='utf-8') as f:
+        lines = sum(1 for _line in f)
+    print(f"{count} positions at {args.rate:.0f}/s, FanOut.submit mean {1e6 * sum(submit_times) / count:.0f}us "
+          f"max {1e6 * max(submit_times):.0f}us")
+    print(f"{'avnwx':>12} (answers after {args.slow:.1f}s): {len(avnwx.timestamps)} received, "
+          f"{uploader.queue.dropped} dropped (latest-only queue)")
+    print(f"{'mirror':>12} (hangs, {args.timeout:.1f}s timeout): {mirror.requests} requests, "
+          f"{sinks[0].queue.dropped} dropped, circuit {sinks[0].client.breaker.stats()}")
+    print(f"{'rebroadcast':>12}: {len(datagrams)} datagrams, {sinks[1].queue.dropped} dropped")
+    print(f"{'file':>12}: {lines} lines, {sinks[2].queue.dropped} dropped")
+    for sink in sinks:
+        label = sink.label
+        print(f"{label[1]:>12}: delivered {metrics.counters.get(('sink_items_total', label), 0)}, "
+              f"failed {metrics.counters.get(('sink_failures_total', label), 0)}, "
+              f"latency p50 <= {metrics.quantile('sink_latency_seconds', 0.5, label)}s "
+              f"p99 <= {metrics.quantile('sink_latency_seconds', 0.99, label)}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    p = sub.add_parser('dropped', help='packets dropped while uploads are slow')
+    p.add_argument('--delay', type=float, default=5.0, help='stand-in server response delay (s)')
+    p.add_argument('--rate', type=float, default=200.0, help='replay rate (packets/s)')
+    p.add_argument('--duration', type=float, default=15.0, help='replay duration (s)')
+    p.add_argument('--rcvbuf', type=int, default=0, help='receiver SO_RCVBUF (bytes), 0 for system default')
+    p.add_argument('--port', type=int, default=BENCH_PORT)
+    p.set_defaults(func=bench_dropped)
+
+    p = sub.add_parser('latency', help='connection reuse and upload latency')
+    p.add_argument('--count', type=int, default=200, help='number of uploads')
+    p.add_argument('--gzip', action='store_true', help='gzip PushClient request bodies')
+    p.add_argument('--cert', help='PEM certificate, to serve HTTPS')
+    p.add_argument('--key', help='PEM private key for --cert')
+    p.set_defaults(func=bench_latency)
+
+    p = sub.add_parser('parse', help='XGPS/XATT parser speed and allocations')
+    p.add_argument('--count', type=int, default=1000000, help='number of packets')
+    p.set_defaults(func=bench_parse)
+
+    p = sub.add_parser('cpu', help='CPU time, per-packet parsing vs drain-and-coalesce')
+    p.add_argument('--rate', type=float, default=2000.0, help='replay rate (packets/s)')
+    p.add_argument('--duration', type=float, default=10.0, help='replay duration (s)')
+    p.add_argument('--burst', type=int, default=32, help='packets sent back-to-back, like one sim frame')
+    p.add_argument('--port', type=int, default=BENCH_PORT)
+    p.set_defaults(func=bench_cpu)
+
+    p = sub.add_parser('spool', help='store-and-forward across server outages and a restart')
+    p.add_argument('--count', type=int, default=120, help='positions uploaded, over two runs')
+    p.add_argument('--outage', type=int, default=40, help='positions sent while server is down')
+    p.add_argument('--interval', type=float, default=0.02, help='seconds between positions')
+    p.add_argument('--capacity', type=int, default=1000, help='spool capacity (positions)')
+    p.add_argument('--breaker-delay', type=float, default=0.1, help='circuit breaker first open period (s)')
+    p.set_defaults(func=bench_spool)
+
+    p = sub.add_parser('pipeline', help='end-to-end receive, parse and upload')
+    p.add_argument('--capture', help='capture file to replay (default: synthesize)')
+    p.add_argument('--aircraft', type=int, default=20, help='synthetic aircraft (ours + traffic)')
+    p.add_argument('--duration', type=float, default=30.0, help='synthetic flight seconds')
+    p.add_argument('--rate', type=float, default=10.0, help='synthetic updates per second per aircraft')
+    p.add_argument('--speed', type=float, default=10.0, help='replay speed, 1 to 100')
+    p.add_argument('--port', type=int, default=BENCH_PORT)
+    p.set_defaults(func=bench_pipeline)
+
+    p = sub.add_parser('fanin', help='one tracker serving many X-Plane instances')
+    p.add_argument('--sources', type=int, default=50, help='simulated X-Plane instances')
+    p.add_argument('--rate', type=float, default=10.0, help='XGPS+XATT pairs per second per source')
+    p.add_argument('--duration', type=float, default=20.0, help='seconds')
+    p.add_argument('--workers', type=int, default=4, help='upload threads')
+    p.add_argument('--port', type=int, default=BENCH_PORT + 100, help='first of --sources ports')
+    p.set_defaults(func=bench_fanin)
+
+    p = sub.add_parser('payload', help='request body size and encode time, JSON vs binary')
+    p.add_argument('--count', type=int, default=2000, help='positions to encode')
+    p.add_argument('--batch', type=int, default=50, help='positions per batched body')
+    p.set_defaults(func=bench_payload)
+
+    p = sub.add_parser('idle', help='wakeups and CPU while no X-Plane data arrives')
+    p.add_argument('--duration', type=float, default=30.0, help='seconds')
+    p.add_argument('--port', type=int, default=BENCH_PORT)
+    p.set_defaults(func=bench_idle)
+
+    p = sub.add_parser('archive', help='sample archive append cost and query speed')
+    p.add_argument('--hours', type=float, default=3.0, help='flight length')
+    p.add_argument('--rate', type=float, default=20.0, help='samples per second')
+    p.set_defaults(func=bench_archive)
+
+    p = sub.add_parser('livemap', help='live map server with hundreds of subscribers')
+    p.add_argument('--clients', type=int, default=500, help='concurrent SSE subscribers')
+    p.add_argument('--rate', type=float, default=10.0, help='updates per second')
+    p.add_argument('--duration', type=float, default=10.0, help='seconds of updates')
+    p.set_defaults(func=bench_livemap)
+
+    p = sub.add_parser('resample', help='fixed-clock resampling vs latest XGPS/XATT pairing')
+    p.add_argument('--duration', type=float, default=3600.0, help='seconds of flight')
+    p.add_argument('--rate', type=float, default=10.0, help='XGPS+XATT pairs per second')
+    p.add_argument('--jitter', type=float, default=0.05, help='max random arrival delay (s)')
+    p.set_defaults(func=bench_resample)
+
+    p = sub.add_parser('filter', help='outlier rejection and track simplification')
+    p.add_argument('--duration', type=float, default=3600.0, help='seconds of flight')
+    p.add_argument('--rate', type=float, default=10.0, help='samples per second')
+    p.add_argument('--glitches', type=float, default=0.002, help='fraction of samples corrupted')
+    p.set_defaults(func=bench_filter)
+
+    p = sub.add_parser('breaker', help='uploads across server 5xx and hanging outages')
+    p.add_argument('--outage', type=float, default=20.0, help='seconds of each outage')
+    p.add_argument('--interval', type=float, default=0.2, help='seconds between positions')
+    p.add_argument('--timeout', type=float, default=2.0, help='upload timeout (s)')
+    p.set_defaults(func=bench_breaker)
+
+    p = sub.add_parser('fanout', help='one slow and one hanging destination alongside UDP and file sinks')
+    p.add_argument('--duration', type=float, default=10.0, help='seconds')
+    p.add_argument('--rate', type=float, default=10.0, help='positions per second')
+    p.add_argument('--slow', type=float, default=0.5, help='avnwx stand-in response delay (s)')
+    p.add_argument('--timeout', type=float, default=1.0, help='mirror upload timeout (s)')
+    p.set_defaults(func=bench_fanout)
+
+    args = parser.parse_args()
+    # Keep the metrics run_tracker() exports out of the source tree
+    aircraft_udp_tracker.METRICS_FILE = os.path.join(tempfile.mkdtemp(), 'trackerMetrics')
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Capture and replay X-Plane "Broadcast To All Mapping Apps" UDP traffic
+
+Exercises aircraft_udp_tracker.py without running X-Plane:
+
+    python udp_replay.py record flight.xpcap [--port 49002] [--duration 600]
+    python udp_replay.py replay flight.xpcap [--speed 10] [--port 49002] [--loop]
+    python udp_replay.py synth [--aircraft 20] [--duration 300] [--rate 10] [--out synth.xpcap] [--speed 1]
+
+'record' saves every datagram received on the port, with its arrival time.
+'replay' sends a capture to localhost (or --host) at 1x to 100x its recorded speed.
+'synth' generates a flight for our aircraft (XGPS + XATT), plus N-1 others as XTRA traffic,
+and either saves it as a capture (--out) or replays it immediately.
+
+Capture file format: 8-byte magic, then one record per datagram: little-endian double
+(seconds since first datagram), unsigned short (length), and the raw datagram.
+"""
+
+import argparse
+import math
+import socket
+import struct
+import time
+
+MAGIC = b'XPCAP1\n\x00'
+RECORD = struct.Struct('<dH')
+UDP_PORT = 49002
+
+
+def write_capture(path, records):
+    """Write (seconds, datagram) records to path"""
+    with open(path, 'wb') as f:
+        f.write(MAGIC)
+        for offset, data in records:
+            f.write(RECORD.pack(offset, len(data)))
+            f.write(data)
+
+
+def read_capture(path):
+    """Return list of (seconds, datagram) records from path"""
+    with open(path, 'rb') as f:
+        buffer = f.read()
+    if not buffer.startswith(MAGIC):
+        raise ValueError(f"{path} is not a capture file")
+    records = []
+    pos = len(MAGIC)
+    while pos + RECORD.size <= len(buffer):
+        offset, length = RECORD.unpack_from(buffer, pos)
+        pos += RECORD.size
+        records.append((offset, buffer[pos:pos + length]))
+        pos += length
+    return records
+
+
+def record(path, port=UDP_PORT, duration=None):
+    """Capture datagrams arriving on port until duration seconds elapse (or KeyboardInterrupt)"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, 'SO_REUSEPORT'):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.settimeout(0.5)
+    sock.bind(('0.0.0.0', port))
+    records = []
+    start = None
+    print(f"Recording UDP port {port} to {path}, Ctrl-C to stop")
+    try:
+        while duration is None or start is None or time.monotonic() - start < duration:
+            try:
+                data, _addr = sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+            now = time.monotonic()
+            if start is None:
+                start = now
+            records.append((now - start, data))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+    write_capture(path, records)
+    print(f"Recorded {len(records)} datagrams, {records[-1][0] if records else 0:.1f}s")
+    return records
+
+
+def replay(records, host='127.0.0.1', port=UDP_PORT, speed=1.0):
+    """Send records to host:port, keeping their recorded spacing divided by speed.
+    Returns (datagrams sent, seconds taken)"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if host.endswith('.255'):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    start = time.perf_counter()
+    for offset, data in records:
+        wait = start + offset / speed - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        sock.sendto(data, (host, port))
+    sock.close()
+    return len(records), time.perf_counter() - start
+
+
+def synthesize(aircraft=1, duration=60.0, rate=10.0, lat=47.45, lon=-122.31):
+    """Generate records for `aircraft` aircraft flying circles for duration seconds at rate Hz.
+
+    Aircraft 0 is ours (XGPS and XATT); the others are sent as XTRA traffic.
+    """
+    records = []
+    speed_ms = 61.7
+    radius_deg = 0.05
+    for tick in range(int(duration * rate)):
+        t = tick / rate
+        for n in range(aircraft):
+            center_lat = lat + 0.2 * (n % 10)
+            center_lon = lon + 0.2 * (n // 10)
+            angle = (t * speed_ms / (radius_deg * 111000.0) + n) % (2 * math.pi)
+            heading = (math.degrees(angle) + 90.0) % 360.0  # tangent to circle
+            climb = 2.0 * math.sin(angle)  # m/s
+            ac_lat = center_lat + radius_deg * math.cos(angle)
+            ac_lon = center_lon + radius_deg * math.sin(angle) / math.cos(math.radians(center_lat))
+            elevation = 1500.0 + 50 * n + 100.0 * math.cos(angle)
+            if n == 0:
+                records.append((t, b'XGPS\x00\x00' + (f"{ac_lon:.6f},{ac_lat:.6f},{elevation:.1f},"
+                                                      f"{heading:.1f},{speed_ms:.1f}").encode()))
+                records.append((t, b'XATT\x00\x00' + (f"{heading:.1f},2.5,-15.0,0.01,0.02,-0.10,"
+                                                      f"{speed_ms * math.sin(math.radians(heading)):.2f},"
+                                                      f"{climb:.2f},"
+                                                      f"{-speed_ms * math.cos(math.radians(heading)):.2f},"
+                                                      f"0.01,1.03,0.02").encode()))
+            else:
+                records.append((t, b'XTRA\x00\x00' + (f"{n},{ac_lat:.6f},{ac_lon:.6f},{elevation * 3.28084:.0f},"
+                                                      f"{climb * 196.85:.0f},1,{heading:.1f},"
+                                                      f"{speed_ms * 1.94384:.0f},N{n:04d}").encode()))
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('record', help='capture datagrams to a file')
+    p.add_argument('path')
+    p.add_argument('--port', type=int, default=UDP_PORT)
+    p.add_argument('--duration', type=float, help='seconds to record (default: until Ctrl-C)')
+
+    p = sub.add_parser('replay', help='send a capture file')
+    p.add_argument('path')
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=UDP_PORT)
+    p.add_argument('--speed', type=float, default=1.0, help='1 to 100 times recorded speed')
+    p.add_argument('--loop', action='store_true', help='repeat until Ctrl-C')
+
+    p = sub.add_parser('synth', help='generate synthetic flights')
+    p.add_argument('--aircraft', type=int, default=1, help='number of aircraft (ours + traffic)')
+    p.add_argument('--duration', type=float, default=60.0, help='seconds of flight')
+    p.add_argument('--rate', type=float, default=10.0, help='updates per second per aircraft')
+    p.add_argument('--out', help='save as capture file, rather than sending')
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=UDP_PORT)
+    p.add_argument('--speed', type=float, default=1.0, help='1 to 100 times real time')
+
+    args = parser.parse_args()
+    if getattr(args, 'speed', 1.0) < 1.0 or getattr(args, 'speed', 1.0) > 100.0:
+        parser.error('--speed must be between 1 and 100')
+
+    try:
+        if args.command == 'record':
+            record(args.path, args.port, args.duration)
+        elif args.command == 'replay':
+            records = read_capture(args.path)
+            while True:
+                sent, elapsed = replay(records, args.host, args.port, args.speed)
+                print(f"Sent {sent} datagrams in {elapsed:.1f}s ({sent / max(elapsed, 1e-6):.0f}/s)")
+                if not args.loop:
+                    break
+        else:
+            records = synthesize(args.aircraft, args.duration, args.rate)
+            if args.out:
+                write_capture(args.out, records)
+                print(f"Wrote {len(records)} datagrams to {args.out}")
+            else:
+                sent, elapsed = replay(records, args.host, args.port, args.speed)
+                print(f"Sent {sent} datagrams in {elapsed:.1f}s ({sent / max(elapsed, 1e-6):.0f}/s)")
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
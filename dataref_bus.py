@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+"""
+Shared-memory dataref snapshot bus: live sim state for a plugin's child processes (needs numpy)
+
+The plugin declares the datarefs it shares, and publishes them once per flight loop:
+
+    DATAREFS = (('sim/flightmodel/position/latitude', 'd'),
+                ('sim/flightmodel/position/groundspeed', 'f'),
+                ('sim/flightmodel/engine/ENGN_N1_', 'vf', 8), ...)
+    publisher = DatarefPublisher(xp, DATAREFS)
+    ... in a flight loop, every frame:
+    publisher.publish()
+    ... on disable:
+    publisher.close()
+
+Any number of processes (worker_pool.py workers, the avnwx tracker, ...) map the block
+and read frames, without pickling or copying through a pipe. Waiting readers sleep until
+the next publish wakes them:
+
+    bus = DatarefBus.attach()
+    while bus.wait(1.0):
+        frame = bus.read()
+        frame['sim/flightmodel/position/latitude'], frame['sim/flightmodel/engine/ENGN_N1_'][0]
+
+Kinds are 'i', 'f', 'd' (int, float, double scalars) and 'vi', 'vf' (int and float
+arrays, with a count). Run `python dataref_bus.py bench` to compare with pipe+pickle.
+
+This module must not import xp: readers import it too. The plugin passes xp in.
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import select
+import socket
+import struct
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+BUS_NAME = 'xppython3_datarefs'
+MAX_READERS = 16  # readers woken by each publish; any more poll, every WAIT_INTERVAL
+WAIT_INTERVAL = 0.005  # seconds between checks for a new frame, by a reader that couldn't register
+WAKE_CHECK = 1.0  # longest a woken reader sleeps before checking the block anyway (e.g. writer crashed)
+
+KINDS = {'i': np.int32, 'f': np.float32, 'd': np.float64, 'vi': np.int32, 'vf': np.float32}
+SCALAR_ORDER = ('d', 'f', 'i')  # widest first, so every field is aligned
+
+
+class DatarefBus:
+    """One frame of datarefs in shared memory, laid out as a numpy structured array.
+
+    The block holds a header (magic, format version, layout size, row offset, closed flag),
+    a sequence number, the layout (JSON list of [name, kind, count]) and one row: '_time'
+    (publish time), then the scalars grouped by kind (doubles, floats, ints), then the
+    arrays. Grouping lets a publisher write each kind of scalar with one copy. Readers
+    build the dtype from the stored layout, so they need no declaration of their own.
+
+    Like SharedPositionFeed (avnwx/aircraft_udp_tracker.py) it's a seqlock: publish() makes
+    the sequence number odd, writes the row, then makes it even again; read() retries until
+    it sees the same even sequence number before and after copying the row. So the sequence
+    number is also the frame's version: frame n is sequence 2n. Single writer; readers never
+    block it.
+
+    Shared memory can't wake anyone, so waiting readers each bind a loopback UDP socket and
+    register its port in the block's table of MAX_READERS slots. After each publish (and on
+    close) the writer sends every registered port an empty datagram. A reader that registers
+    before checking the sequence number can't miss a frame: the datagram waits in its socket.
+    """
+
+    MAGIC = b'XPDB'
+    VERSION = 2
+    HEADER = struct.Struct('<4sIIII')
+    SEQUENCE = struct.Struct('<Q')
+    SEQUENCE_OFFSET = 24
+    READERS = struct.Struct(f'<{MAX_READERS}H')  # UDP port of each waiting reader, 0 if free
+    READERS_OFFSET = 32
+    LAYOUT_OFFSET = READERS_OFFSET + READERS.size
+    ROW_ALIGN = 64
+
+    def __init__(self, shm, layout, row_offset):
+        self.shm = shm
+        self.buf = shm.buf
+        self.layout = layout
+        self.row_offset = row_offset
+        self.dtype, self.groups = self.layout_dtype(layout)
+        self.frame = np.ndarray((1,), self.dtype, buffer=self.buf, offset=row_offset)[0]  # live, zero-copy
+        self.snapshot = np.zeros((1,), self.dtype)  # read()'s consistent copy
+        self.sequence = 0  # writer: its count, always even between publishes. Reader: last read.
+        self.missed = 0  # reader: frames published but never read
+        self.sock = None  # writer: to send wakeups. Reader: to receive them, once registered
+        self.slot = None  # reader: its slot in the READERS table, if it got one
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @staticmethod
+    def layout_dtype(layout):
+        """Return (structured dtype, groups) for layout, a list of [name, kind, count].
+        groups lists (kind, names, offset in row) for each kind of scalar, then each array."""
+        names, formats, offsets, groups = ['_time'], [np.float64], [0], []
+        offset = 8
+        for kind in SCALAR_ORDER:
+            group = [name for name, field_kind, _count in layout if field_kind == kind]
+            if group:
+                groups.append((kind, group, offset))
+                for name in group:
+                    names.append(name)
+                    formats.append(KINDS[kind])
+                    offsets.append(offset)
+                    offset += np.dtype(KINDS[kind]).itemsize
+        for name, kind, count in layout:
+            if kind not in SCALAR_ORDER:
+                offset = -(-offset // 4) * 4
+                groups.append((kind, [name], offset))
+                names.append(name)
+                formats.append((KINDS[kind], (count,)))
+                offsets.append(offset)
+                offset += np.dtype(KINDS[kind]).itemsize * count
+        return np.dtype({'names': names, 'formats': formats, 'offsets': offsets,
+                         'itemsize': -(-offset // 8) * 8}), groups
+
+    @staticmethod
+    def normalize(datarefs):
+        """Declaration (name, kind) / (name, kind, count) tuples -> layout list of [name, kind, count]"""
+        layout = []
+        for dataref in datarefs:
+            name, kind = dataref[0], dataref[1]
+            if kind not in KINDS:
+                raise ValueError(f"{name}: kind must be one of {', '.join(KINDS)}, not {kind!r}")
+            count = dataref[2] if len(dataref) > 2 else 1
+            layout.append([name, kind, count if kind.startswith('v') else 1])
+        return layout
+
+    @classmethod
+    def create(cls, datarefs, name=BUS_NAME):
+        """Writer side: create the block for datarefs (replacing any left by a crashed X-Plane)"""
+        layout = cls.normalize(datarefs)
+        text = json.dumps(layout).encode('utf-8')
+        row_offset = -(-(cls.LAYOUT_OFFSET + len(text)) // cls.ROW_ALIGN) * cls.ROW_ALIGN
+        size = row_offset + cls.layout_dtype(layout)[0].itemsize
+        try:
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        cls.HEADER.pack_into(shm.buf, 0, cls.MAGIC, cls.VERSION, len(text), row_offset, 0)
+        cls.SEQUENCE.pack_into(shm.buf, cls.SEQUENCE_OFFSET, 0)
+        cls.READERS.pack_into(shm.buf, cls.READERS_OFFSET, *[0] * MAX_READERS)
+        shm.buf[cls.LAYOUT_OFFSET:cls.LAYOUT_OFFSET + len(text)] = text
+        return cls(shm, layout, row_offset)
+
+    @classmethod
+    def attach(cls, name=BUS_NAME):
+        """Reader side: open an existing block. Returns None if there's none (or it's not a bus)"""
+        try:
+            shm = shared_memory.SharedMemory(name)
+        except (FileNotFoundError, OSError):
+            return None
+        if multiprocessing.parent_process() is None:
+            # Run standalone: attaching registered the block with our own resource tracker,
+            # which would unlink it when we exit, though only its creator should.
+            try:
+                from multiprocessing import resource_tracker  # pylint: disable=import-outside-toplevel
+                resource_tracker.unregister(shm._name, 'shared_memory')  # pylint: disable=protected-access
+            except (ImportError, AttributeError):
+                pass
+        magic, version, layout_size, row_offset, _closed = cls.HEADER.unpack_from(shm.buf, 0)
+        if (magic, version) != (cls.MAGIC, cls.VERSION):
+            shm.close()
+            return None
+        layout = json.loads(bytes(shm.buf[cls.LAYOUT_OFFSET:cls.LAYOUT_OFFSET + layout_size]))
+        return cls(shm, layout, row_offset)
+
+    def views(self):
+        """Writer side: a typed array over the row for each of groups, to copy values into"""
+        return [np.ndarray((len(names) if kind in SCALAR_ORDER else self.dtype[names[0]].shape[0],),
+                           KINDS[kind], buffer=self.buf, offset=self.row_offset + offset)
+                for kind, names, offset in self.groups]
+
+    def publish(self, views, columns, timestamp=None):
+        """Write one frame: columns holds values for each of views() (a list per group)"""
+        self.SEQUENCE.pack_into(self.buf, self.SEQUENCE_OFFSET, self.sequence + 1)
+        self.frame['_time'] = time.time() if timestamp is None else timestamp
+        for view, values in zip(views, columns):
+            view[:len(values)] = values
+        self.sequence += 2
+        self.SEQUENCE.pack_into(self.buf, self.SEQUENCE_OFFSET, self.sequence)
+        self.wake()
+
+    def wake(self):
+        """Writer side: send each registered reader a wakeup. Never blocks."""
+        ports = [port for port in self.READERS.unpack_from(self.buf, self.READERS_OFFSET) if port]
+        if not ports:
+            return
+        if self.sock is None:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.setblocking(False)
+        for port in ports:
+            try:
+                self.sock.sendto(b'', ('127.0.0.1', port))
+            except OSError:
+                pass  # reader gone, or its socket full (so it has a wakeup waiting anyway)
+
+    def register(self):
+        """Reader side: bind a wakeup socket and take a slot for it: a free one, or one left by a
+        reader that died (its port is free again). Returns False if every slot is taken (the
+        reader then polls)."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for slot, taken in enumerate(self.READERS.unpack_from(self.buf, self.READERS_OFFSET)):
+            try:
+                sock.bind(('127.0.0.1', taken))  # port 0 (free slot): any port
+            except OSError:
+                continue  # slot's reader is alive
+            port = sock.getsockname()[1]
+            offset = self.READERS_OFFSET + 2 * slot
+            struct.pack_into('<H', self.buf, offset, port)
+            if struct.unpack_from('<H', self.buf, offset)[0] == port:  # not raced by another reader
+                sock.setblocking(False)
+                self.sock, self.slot = sock, slot
+                return True
+            sock.close()
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.close()
+        return False
+
+    def fileno(self):
+        """Reader side: the wakeup socket, readable after a publish, to select() on along with
+        others (registering if need be). -1 if the reader couldn't register."""
+        if self.sock is None and not self.register():
+            return -1
+        return self.sock.fileno()
+
+    @property
+    def published(self):
+        """Sequence number of the newest complete frame (odd while one is being written)"""
+        return self.SEQUENCE.unpack_from(self.buf, self.SEQUENCE_OFFSET)[0]
+
+    @property
+    def closed(self):
+        """True once the writer has closed the block: attach() again to follow a new one"""
+        return self.HEADER.unpack_from(self.buf, 0)[4] != 0
+
+    def wait(self, timeout=None):
+        """Reader side: wait up to timeout seconds for a frame newer than the last read().
+        Returns True if there is one, False on timeout or if the writer closed the block."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        registered = self.fileno() >= 0
+        while True:
+            sequence = self.published
+            if sequence > self.sequence and not sequence & 1:
+                return True
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if self.closed or (remaining is not None and remaining <= 0):
+                return False
+            if not registered:
+                time.sleep(WAIT_INTERVAL if remaining is None else min(WAIT_INTERVAL, remaining))
+                continue
+            select.select([self.sock], [], [], WAKE_CHECK if remaining is None else min(WAKE_CHECK, remaining))
+            try:
+                while True:
+                    self.sock.recv(16)
+            except OSError:
+                pass  # drained (BlockingIOError), or a stray ICMP error on Windows
+
+    def read(self, tries=100):
+        """Reader side: return a consistent copy of the newest frame (a numpy record, reused
+        by the next read()), or None if nothing's published yet or the writer was mid-publish
+        on every try"""
+        for _ in range(tries):
+            before = self.published
+            if before & 1:
+                continue
+            self.snapshot[0] = self.frame
+            if self.published == before:
+                if before == 0:
+                    return None
+                if before > self.sequence + 2 and self.sequence:
+                    self.missed += (before - self.sequence) // 2 - 1
+                self.sequence = before
+                return self.snapshot[0]
+        return None
+
+    def close(self, unlink=False):
+        """Detach; the writer also marks the block closed (waking its readers) and unlinks it"""
+        if unlink:
+            self.HEADER.pack_into(self.buf, 0, self.MAGIC, self.VERSION, 0, self.row_offset, 1)
+            self.wake()
+        elif self.slot is not None:
+            offset = self.READERS_OFFSET + 2 * self.slot
+            if struct.unpack_from('<H', self.buf, offset)[0] == self.sock.getsockname()[1]:
+                struct.pack_into('<H', self.buf, offset, 0)
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = self.slot = None
+        self.frame = None
+        self.buf.release()
+        self.buf = None
+        self.shm.close()
+        if unlink:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class DatarefPublisher:
+    """Plugin side: copies the declared datarefs into a DatarefBus each time publish() is called.
+
+    xp is the XPPython3 module (or anything with its findDataRef / getData* functions).
+    """
+
+    def __init__(self, xp, datarefs, name=BUS_NAME):
+        self.bus = DatarefBus.create(datarefs, name)
+        self.views = self.bus.views()
+        getters = {'i': xp.getDatai, 'f': xp.getDataf, 'd': xp.getDatad, 'vi': xp.getDatavi, 'vf': xp.getDatavf}
+        self.readers = []  # (getter, datarefs, count) for each group, count None for scalars
+        for kind, names, _offset in self.bus.groups:
+            refs = [xp.findDataRef(name) for name in names]
+            count = self.bus.dtype[names[0]].shape[0] if kind not in SCALAR_ORDER else None
+            self.readers.append((getters[kind], refs, count))
+
+    def publish(self):
+        """Read every declared dataref and publish them as one frame. Call from a flight loop."""
+        columns = []
+        for getter, refs, count in self.readers:
+            if count is None:
+                columns.append([getter(ref) for ref in refs])
+            else:
+                values = []
+                getter(refs[0], values, 0, count)
+                columns.append(values[:count])
+        self.bus.publish(self.views, columns)
+
+    def close(self):
+        self.views = None
+        self.bus.close(unlink=True)
+
+
+class StandInXP:
+    """Just enough of xp for the benchmark: every dataref's value changes with each frame"""
+
+    def __init__(self):
+        self.frame = 0
+
+    @staticmethod
+    def findDataRef(name):  # pylint: disable=invalid-name
+        return name
+
+    def getDatai(self, _ref):  # pylint: disable=invalid-name
+        return self.frame
+
+    def getDataf(self, _ref):  # pylint: disable=invalid-name
+        return self.frame * 0.5
+
+    getDatad = getDataf
+
+    def getDatavf(self, _ref, values, offset, count):  # pylint: disable=invalid-name
+        values.extend(float(self.frame + i) for i in range(offset, offset + count))
+        return count
+
+    getDatavi = getDatavf
+
+
+def bench_datarefs(count, array_size=8):
+    """A declaration of count datarefs: mostly floats, some doubles, ints and arrays"""
+    datarefs = []
+    for i in range(count):
+        if i % 25 == 0:
+            datarefs.append((f'bench/array/{i}', 'vf', array_size))
+        elif i % 10 == 1:
+            datarefs.append((f'bench/double/{i}', 'd'))
+        elif i % 10 == 2:
+            datarefs.append((f'bench/int/{i}', 'i'))
+        else:
+            datarefs.append((f'bench/float/{i}', 'f'))
+    return datarefs
+
+
+def bus_reader(name, results):
+    """Benchmark reader process: follow the bus until it closes, then send back stats"""
+    bus = DatarefBus.attach(name)
+    latencies = []
+    cpu = time.process_time()
+    while bus.wait(5.0):
+        frame = bus.read()
+        if frame is not None:
+            latencies.append(time.time() - frame['_time'])
+    results.send((latencies, bus.missed, time.process_time() - cpu))
+
+
+def pipe_reader(conn, results):
+    """Benchmark reader process: receive pickled frames until None, then send back stats"""
+    latencies = []
+    cpu = time.process_time()
+    while True:
+        frame = conn.recv()
+        if frame is None:
+            break
+        latencies.append(time.time() - frame['_time'])
+    results.send((latencies, 0, time.process_time() - cpu))
+
+
+def bench(args):
+    datarefs = bench_datarefs(args.datarefs)
+    xp = StandInXP()
+    for method in ('pipe+pickle', 'shared memory'):
+        result_conns, readers, pipes = [], [], []
+        publisher = None
+        if method == 'shared memory':
+            publisher = DatarefPublisher(xp, datarefs, name=f'{BUS_NAME}_bench')
+        for _ in range(args.readers):
+            receive, send = multiprocessing.Pipe(duplex=False)
+            result_conns.append(receive)
+            if publisher is not None:
+                process = multiprocessing.Process(target=bus_reader, args=(publisher.bus.name, send))
+            else:
+                frames, frames_in = multiprocessing.Pipe(duplex=False)
+                pipes.append(frames_in)
+                process = multiprocessing.Process(target=pipe_reader, args=(frames, send))
+            process.start()
+            readers.append(process)
+        time.sleep(1.0)  # readers up
+
+        costs = []
+        frames = int(args.duration * args.rate)
+        start = time.perf_counter()
+        for n in range(frames):
+            xp.frame = n
+            elapsed = time.perf_counter()
+            if publisher is not None:
+                publisher.publish()
+            else:
+                # The usual alternative: read the datarefs into a dict and send it to each reader
+                frame = {'_time': time.time()}
+                for name, kind, *size in datarefs:
+                    if kind == 'f':
+                        frame[name] = xp.getDataf(name)
+                    elif kind == 'd':
+                        frame[name] = xp.getDatad(name)
+                    elif kind == 'i':
+                        frame[name] = xp.getDatai(name)
+                    else:
+                        values = []
+                        xp.getDatavf(name, values, 0, size[0])
+                        frame[name] = values
+                for conn in pipes:
+                    conn.send(frame)
+            costs.append(time.perf_counter() - elapsed)
+            wait = start + (n + 1) / args.rate - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+
+        if publisher is not None:
+            publisher.close()
+        for conn in pipes:
+            conn.send(None)
+        latencies, missed, cpu = [], 0, 0.0
+        for conn, process in zip(result_conns, readers):
+            reader_latencies, reader_missed, reader_cpu = conn.recv()
+            latencies += reader_latencies
+            missed += reader_missed
+            cpu += reader_cpu
+            process.join()
+        costs.sort()
+        latencies.sort()
+        print(f"{method:>14}: publish p50 {1e6 * costs[len(costs) // 2]:6.0f}us p99 "
+              f"{1e6 * costs[int(0.99 * len(costs))]:6.0f}us; {len(latencies)}/{frames * args.readers} frames "
+              f"read ({missed} skipped), latency p50 {1e3 * latencies[len(latencies) // 2]:.2f}ms p99 "
+              f"{1e3 * latencies[int(0.99 * len(latencies))]:.2f}ms; reader CPU "
+              f"{100 * cpu / args.readers / args.duration:.1f}% each")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('bench', help='publish to reader processes: shared memory vs pipe+pickle')
+    p.add_argument('--datarefs', type=int, default=500)
+    p.add_argument('--rate', type=float, default=60.0, help='frames per second')
+    p.add_argument('--readers', type=int, default=4, help='reader processes')
+    p.add_argument('--duration', type=float, default=10.0, help='seconds')
+    args = parser.parse_args()
+    if args.rate <= 0 or math.isinf(args.rate):
+        parser.error('--rate must be positive')
+    bench(args)
+
+
+if __name__ == '__main__':
+    main()
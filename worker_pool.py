@@ -0,0 +1,312 @@
+"""
+Persistent pool of worker processes for XPPython3 plugins
+
+Workers are started once and kept warm, so a job doesn't pay for a new interpreter.
+Nothing here blocks the sim: submit() only queues the job, and results are collected by
+calling poll() from a flight loop, which never waits on a worker.
+
+    pool = WorkerPool(size=2, executable=xp.pythonExecutable, log=xp.log)
+    pool.start()
+    ... from any callback:
+    job = pool.submit(work, arg, timeout=5.0, callback=self.on_result)
+    ... every frame or so, from a flight loop:
+    pool.poll()          # calls on_result(job) for finished jobs, from the flight loop
+    ... or check job.done / job.state / job.result yourself
+    ... on disable:
+    pool.shutdown()
+
+Jobs must be picklable: module-level functions, with picklable arguments and results (as
+for multiprocessing). A job that runs longer than its timeout, or is cancelled while
+running, can only be stopped by terminating its worker, which is then replaced: anything
+an initializer set up in it is set up again.
+
+This module must not import xp: it's imported by the worker processes too.
+"""
+
+import itertools
+import multiprocessing
+import time
+import traceback
+from collections import deque
+
+STANDBY_CHECK = 5.0  # seconds between an idle worker's checks that its parent is still alive
+KILL_AFTER = 2.0  # seconds a terminated worker gets to exit before it's killed
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+TIMED_OUT = 'timed_out'
+CANCELLED = 'cancelled'
+
+
+def worker_main(conn, initializer=None, initargs=()):
+    """Worker process entry point: run (func, args, kwargs) jobs from conn, replying
+    (ok, result or traceback, seconds), until sent None or the parent goes away"""
+    parent = multiprocessing.parent_process()
+    if initializer is not None:
+        initializer(*initargs)
+    while True:
+        if not conn.poll(STANDBY_CHECK):
+            if parent is not None and not parent.is_alive():
+                return
+            continue
+        start = time.perf_counter()
+        try:
+            message = conn.recv()
+            if message is None:
+                return
+            func, args, kwargs = message
+            reply = (True, func(*args, **kwargs))
+        except EOFError:
+            return
+        except Exception:  # pylint: disable=broad-exception-caught
+            reply = (False, traceback.format_exc())
+        elapsed = time.perf_counter() - start
+        try:
+            conn.send(reply + (elapsed,))
+        except Exception:  # pylint: disable=broad-exception-caught
+            # Result couldn't be pickled
+            conn.send((False, traceback.format_exc(), elapsed))
+
+
+class Job:
+    """A call submitted to a WorkerPool. Its state changes only in WorkerPool.poll() (or cancel())."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, pool, func, args, kwargs, timeout=None, callback=None):
+        self.id = next(self._ids)
+        self.pool = pool
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.timeout = timeout  # seconds, from when a worker starts it
+        self.callback = callback  # called with the job once it's finished, from poll()
+        self.state = PENDING
+        self.result = None
+        self.error = None  # traceback or reason, unless DONE
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+        self.run_time = None  # seconds the worker spent on it
+
+    @property
+    def name(self):
+        return getattr(self.func, '__name__', repr(self.func))
+
+    @property
+    def done(self):
+        return self.state not in (PENDING, RUNNING)
+
+    def cancel(self):
+        """Cancel job, if not finished (terminating its worker, if it's running). Returns True if cancelled."""
+        return self.pool.cancel(self)
+
+    def __repr__(self):
+        return f"<Job {self.id} {self.name} {self.state}>"
+
+
+class Worker:
+    """One worker process of a WorkerPool, with its statistics"""
+
+    def __init__(self, number):
+        self.number = number
+        self.process = None
+        self.conn = None
+        self.job = None  # running, if any
+        self.created = time.monotonic()
+        self.jobs = 0  # finished, in any state
+        self.busy = 0.0  # seconds spent running jobs (as measured by the worker)
+        self.restarts = 0
+
+    def stats(self, now):
+        return {'worker': self.number, 'pid': self.process.pid if self.process else None,
+                'running': self.job.name if self.job else None, 'jobs': self.jobs,
+                'busy_s': round(self.busy, 3),
+                'utilization': round(self.busy / max(now - self.created, 1e-6), 3), 'restarts': self.restarts}
+
+
+class WorkerPool:
+    """Keeps `size` warm worker processes, runs submitted jobs on them, one at a time each"""
+
+    def __init__(self, size=2, executable=None, initializer=None, initargs=(), log=print):
+        self.executable = executable  # e.g. xp.pythonExecutable: in X-Plane sys.executable is X-Plane itself
+        self.initializer = initializer  # called once in each worker as it starts, e.g. to import modules
+        self.initargs = initargs
+        self.log = log
+        self.workers = [Worker(n) for n in range(size)]
+        self.pending = deque()
+        self.finished = []  # finished since the last poll()
+        self.dying = []  # (process, monotonic time terminated), until reaped
+        self.counts = {state: 0 for state in (DONE, FAILED, TIMED_OUT, CANCELLED)}
+
+    def start(self):
+        """Start the workers. Doesn't wait for them to be ready: jobs queue until they are."""
+        for worker in self.workers:
+            self._spawn(worker)
+
+    def _spawn(self, worker):
+        if self.executable:
+            multiprocessing.set_executable(self.executable)
+        conn, child_conn = multiprocessing.Pipe()
+        worker.process = multiprocessing.Process(target=worker_main, args=(child_conn, self.initializer, self.initargs),
+                                                 name=f"worker-{worker.number}", daemon=True)
+        worker.process.start()
+        child_conn.close()
+        worker.conn = conn
+        worker.job = None
+
+    def submit(self, func, *args, timeout=None, callback=None, **kwargs):
+        """Queue func(*args, **kwargs) to run on a worker. Returns its Job at once."""
+        job = Job(self, func, args, kwargs, timeout, callback)
+        self.pending.append(job)
+        self._dispatch()
+        return job
+
+    def poll(self):
+        """Collect results, enforce timeouts, replace dead workers and start queued jobs.
+        Never waits on a worker. Calls the callbacks of, and returns, the jobs finished
+        since the last poll()."""
+        now = time.monotonic()
+        for worker in self.workers:
+            job = worker.job
+            if job is None:
+                if not worker.process.is_alive():
+                    self._replace(worker, f"exited with code {worker.process.exitcode} while idle")
+                continue
+            if worker.conn.poll():
+                try:
+                    ok, value, elapsed = worker.conn.recv()
+                except (EOFError, OSError):
+                    self._lost(worker, FAILED, f"worker exited with code {worker.process.exitcode}")
+                    continue
+                worker.job = None
+                worker.jobs += 1
+                worker.busy += elapsed
+                job.run_time = elapsed
+                self._finish(job, DONE if ok else FAILED, value)
+            elif not worker.process.is_alive():
+                self._lost(worker, FAILED, f"worker exited with code {worker.process.exitcode}")
+            elif job.timeout is not None and now - job.started > job.timeout:
+                self._lost(worker, TIMED_OUT, f"timed out after {job.timeout}s")
+        self._reap(now)
+        self._dispatch()
+        finished, self.finished = self.finished, []
+        for job in finished:
+            if job.callback is not None:
+                try:
+                    job.callback(job)
+                except Exception:  # pylint: disable=broad-exception-caught
+                    self.log(f"Callback for {job} failed: {traceback.format_exc()}")
+        return finished
+
+    def cancel(self, job):
+        """Cancel job if it hasn't finished. A running job's worker is terminated and replaced."""
+        if job.state == PENDING:
+            self.pending.remove(job)
+            self._finish(job, CANCELLED, "cancelled before it started")
+            return True
+        if job.state == RUNNING:
+            for worker in self.workers:
+                if worker.job is job:
+                    self._lost(worker, CANCELLED, "cancelled while running")
+                    return True
+        return False
+
+    def _dispatch(self):
+        for worker in self.workers:
+            if not self.pending:
+                return
+            if worker.job is not None or not worker.process.is_alive():
+                continue
+            job = self.pending.popleft()
+            try:
+                worker.conn.send((job.func, job.args, job.kwargs))
+            except OSError:
+                self.pending.appendleft(job)  # worker died: try again once poll() has replaced it
+                continue
+            except Exception:  # pylint: disable=broad-exception-caught
+                self._finish(job, FAILED, traceback.format_exc())  # couldn't be pickled
+                continue
+            worker.job = job
+            job.state = RUNNING
+            job.started = time.monotonic()
+
+    def _finish(self, job, state, value):
+        job.state = state
+        if state == DONE:
+            job.result = value
+        else:
+            job.error = value
+        job.finished = time.monotonic()
+        self.counts[state] += 1
+        self.finished.append(job)
+
+    def _lost(self, worker, state, reason):
+        """worker's job ends in state: stop the worker (if it's still running) and replace it"""
+        job = worker.job
+        worker.job = None
+        worker.jobs += 1
+        worker.busy += time.monotonic() - job.started
+        self._finish(job, state, reason)
+        self._replace(worker, reason)
+
+    def _replace(self, worker, reason):
+        if worker.process.is_alive():
+            worker.process.terminate()
+            self.dying.append((worker.process, time.monotonic()))
+        worker.conn.close()
+        worker.restarts += 1
+        self.log(f"Worker {worker.number} replaced: {reason}")
+        self._spawn(worker)
+
+    def _reap(self, now):
+        """Forget terminated workers once they've exited, killing any that take too long"""
+        dying = []
+        for process, terminated in self.dying:
+            if process.is_alive():
+                if now - terminated > KILL_AFTER:
+                    process.kill()
+                dying.append((process, terminated))
+        self.dying = dying
+
+    def stats(self):
+        """Pool and per-worker statistics"""
+        now = time.monotonic()
+        return {'pending': len(self.pending), 'running': sum(worker.job is not None for worker in self.workers),
+                **self.counts, 'workers': [worker.stats(now) for worker in self.workers]}
+
+    def shutdown(self, timeout=2.0):
+        """Cancel queued jobs and stop the workers: politely, then terminate, then kill.
+        Blocks up to a few times timeout, so only call on disable/stop."""
+        while self.pending:
+            self._finish(self.pending.popleft(), CANCELLED, "pool shut down")
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive() and worker.job is None:
+                try:
+                    worker.conn.send(None)
+                except OSError:
+                    pass
+        for worker in self.workers:
+            process = worker.process
+            if process is None:
+                continue
+            if worker.job is not None:
+                self._finish(worker.job, CANCELLED, "pool shut down")
+                worker.job = None
+                process.terminate()
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout)
+            if process.is_alive():
+                process.kill()
+                process.join(timeout)
+            worker.conn.close()
+            worker.process = None
+        for process, _terminated in self.dying:
+            if process.is_alive():
+                process.kill()
+            process.join(timeout)
+        self.dying = []